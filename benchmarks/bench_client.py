@@ -0,0 +1,248 @@
+"""
+Client benchmarks against the offline MockEskizServer.
+
+    python -m benchmarks.bench_client
+    python -m benchmarks.bench_client --requests 5000 --latency 0.005 --concurrency 50 sync_send async_send
+
+Every scenario reports messages per second, p50/p99 latency of one call (a send, a batch of 100 messages
+or a bulk of 100 messages) and the peak memory allocated during one call, measured with tracemalloc
+in a separate shorter run. "cold" scenarios create a new client, so every send logs in first.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from eskiz_sms.mock import MockEskizServer
+
+BATCH_SIZE = 100
+
+
+@dataclass
+class Result:
+    name: str
+    calls: int
+    items: int
+    seconds: float
+    latencies: List[float]
+    alloc_bytes: Optional[float] = None
+
+    @property
+    def rate(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def row(self) -> str:
+        alloc = f"{self.alloc_bytes / 1024:10.1f}" if self.alloc_bytes is not None else f"{'-':>10}"
+        return (
+            f"{self.name:<18} {self.calls:>8} {self.rate:>12.0f} "
+            f"{self.percentile(0.5) * 1000:>9.3f} {self.percentile(0.99) * 1000:>9.3f} {alloc}"
+        )
+
+
+HEADER = f"{'scenario':<18} {'calls':>8} {'items/s':>12} {'p50 ms':>9} {'p99 ms':>9} {'KiB/call':>10}"
+
+
+def _server(args) -> MockEskizServer:
+    return MockEskizServer(latency=args.latency, keep_messages=False, seed=1)
+
+
+def _batch(i: int) -> List[dict]:
+    return [
+        {"user_sms_id": f"{i}-{j}", "to": 998901234567, "text": "Benchmark message"}
+        for j in range(BATCH_SIZE)
+    ]
+
+
+# ===== sync ===== #
+def _sync_calls(args, scenario: str) -> Callable[[int], Callable[[], int]]:
+    """Returns a factory of the calls, the call returns the number of the sent items"""
+    server = _server(args)
+    eskiz = server.client()
+    eskiz.get_limit()
+
+    def factory(i: int) -> Callable[[], int]:
+        if scenario == "sync_send":
+            return lambda: eskiz.send_sms("998901234567", "Benchmark message") and 1
+        if scenario == "sync_send_cold":
+            def cold():
+                with server.client() as client:
+                    client.send_sms("998901234567", "Benchmark message")
+                return 1
+            return cold
+        if scenario == "sync_batch":
+            messages = _batch(i)
+            return lambda: eskiz.send_batch(messages=messages, dispatch_id=i) and BATCH_SIZE
+        raise ValueError(scenario)
+
+    return factory
+
+
+def run_sync(args, scenario: str, calls: int) -> Result:
+    factory = _sync_calls(args, scenario)
+    latencies = []
+    items = 0
+    started = time.perf_counter()
+    for i in range(calls):
+        call = factory(i)
+        call_started = time.perf_counter()
+        items += call()
+        latencies.append(time.perf_counter() - call_started)
+    return Result(scenario, calls, items, time.perf_counter() - started, latencies)
+
+
+def alloc_sync(args, scenario: str, calls: int) -> float:
+    factory = _sync_calls(args, scenario)
+    factory(0)()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for i in range(calls):
+            call = factory(i)
+            tracemalloc.clear_traces()
+            call()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+    return statistics.mean(peaks)
+
+
+# ===== async ===== #
+def _async_calls(args, scenario: str):
+    server = _server(args)
+    eskiz = server.async_client()
+
+    async def setup():
+        await eskiz.get_limit()
+
+    def factory(i: int) -> Callable[[], Awaitable[int]]:
+        if scenario == "async_send":
+            async def send():
+                await eskiz.send_sms("998901234567", "Benchmark message")
+                return 1
+            return send
+        if scenario == "async_send_cold":
+            async def cold():
+                async with server.async_client() as client:
+                    await client.send_sms("998901234567", "Benchmark message")
+                return 1
+            return cold
+        if scenario == "async_batch":
+            messages = _batch(i)
+
+            async def batch():
+                await eskiz.send_batch(messages=messages, dispatch_id=i)
+                return BATCH_SIZE
+            return batch
+        if scenario == "async_bulk":
+            async def bulk():
+                items = (("998901234567", "Benchmark message") for _ in range(BATCH_SIZE))
+                return sum([1 async for _ in eskiz.send_bulk(items, concurrency=args.concurrency)])
+            return bulk
+        raise ValueError(scenario)
+
+    return setup, factory, eskiz
+
+
+async def _run_async(args, scenario: str, calls: int) -> Result:
+    setup, factory, eskiz = _async_calls(args, scenario)
+    await setup()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def timed(i: int) -> int:
+        async with semaphore:
+            call_started = time.perf_counter()
+            sent = await factory(i)()
+            latencies.append(time.perf_counter() - call_started)
+            return sent
+
+    started = time.perf_counter()
+    items = sum(await asyncio.gather(*(timed(i) for i in range(calls))))
+    seconds = time.perf_counter() - started
+    await eskiz.aclose()
+    return Result(scenario, calls, items, seconds, latencies)
+
+
+def run_async(args, scenario: str, calls: int) -> Result:
+    return asyncio.run(_run_async(args, scenario, calls))
+
+
+def alloc_async(args, scenario: str, calls: int) -> float:
+    async def run():
+        setup, factory, eskiz = _async_calls(args, scenario)
+        await setup()
+        await factory(0)()
+        tracemalloc.start()
+        try:
+            peaks = []
+            for i in range(calls):
+                call = factory(i)
+                tracemalloc.clear_traces()
+                await call()
+                peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+            await eskiz.aclose()
+        return statistics.mean(peaks)
+
+    return asyncio.run(run())
+
+
+SCENARIOS: Dict[str, tuple] = {
+    "sync_send": (run_sync, alloc_sync),
+    "sync_send_cold": (run_sync, alloc_sync),
+    "sync_batch": (run_sync, alloc_sync),
+    "async_send": (run_async, alloc_async),
+    "async_send_cold": (run_async, alloc_async),
+    "async_batch": (run_async, alloc_async),
+    "async_bulk": (run_async, alloc_async),
+}
+
+
+def run(args) -> List[Result]:
+    results = []
+    for scenario in args.scenarios or list(SCENARIOS):
+        runner, alloc = SCENARIOS[scenario]
+        # batches and bulks send BATCH_SIZE messages per call
+        calls = args.requests if scenario.endswith(("send", "send_cold")) else max(1, args.requests // BATCH_SIZE)
+        result = runner(args, scenario, calls)
+        if args.alloc_calls:
+            result.alloc_bytes = alloc(args, scenario, min(calls, args.alloc_calls))
+        results.append(result)
+    return results
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run, default is all: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=2000, help="Messages per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of the server latency")
+    parser.add_argument("--concurrency", type=int, default=20, help="Async calls in flight")
+    parser.add_argument("--alloc-calls", type=int, default=200, help="Calls of the allocation run, 0 disables it")
+    args = parser.parse_args(argv)
+    unknown = [scenario for scenario in args.scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    return args
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    print(HEADER)
+    for result in run(args):
+        print(result.row())
+
+
+if __name__ == "__main__":
+    main()
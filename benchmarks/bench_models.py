@@ -0,0 +1,133 @@
+"""
+Benchmark of building the report results from the decoded JSON page.
+
+    python -m benchmarks.bench_models
+    python -m benchmarks.bench_models --rows 100000
+
+Compares a plain dataclass (the unknown keys filtered out before the construction), the slotted
+models built by keyword arguments and by from_dicts, and the columnar UserMessageTable.
+The memory is what the result keeps after the decoded dicts are dropped (tracemalloc), the strings
+decoded from the body are included.
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import gc
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from eskiz_sms.columns import UserMessageTable
+from eskiz_sms.types import UserMessage
+
+
+@dataclasses.dataclass
+class DataclassMessage:
+    id: Optional[int] = None
+    user_id: Optional[int] = None
+    dispatch_id: Optional[int] = None
+    user_sms_id: Optional[str] = None
+    request_id: Optional[str] = None
+    nick: Optional[str] = None
+    to: Optional[str] = None
+    message: Optional[str] = None
+    encoding: Optional[int] = None
+    parts_count: Optional[int] = None
+    price: Optional[int] = None
+    is_ad: Optional[bool] = None
+    status: Optional[str] = None
+    sent_at: Optional[datetime] = None
+    submit_sm_resp_at: Optional[datetime] = None
+    delivery_sm_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+DATACLASS_FIELDS = frozenset(field.name for field in dataclasses.fields(DataclassMessage))
+
+
+def make_body(rows: int) -> bytes:
+    items = []
+    for i in range(rows):
+        second = i // 20
+        timestamp = f"2023-01-{1 + second // 86400:02d} {second // 3600 % 24:02d}:{second // 60 % 60:02d}:{second % 60:02d}"
+        items.append({
+            "id": 1_000_000 + i,
+            "user_id": 1,
+            "dispatch_id": None,
+            "user_sms_id": str(i),
+            "request_id": f"req-{i}",
+            "nick": "4546",
+            "to": f"99890{i % 10_000_000:07d}",
+            "message": f"Your code is {i % 10000:04d}",
+            "encoding": 0,
+            "parts_count": 1,
+            "price": 50,
+            "is_ad": False,
+            "status": "DELIVRD" if i % 50 else "EXPIRED",
+            "sent_at": timestamp,
+            "submit_sm_resp_at": timestamp,
+            "delivery_sm_at": timestamp,
+            "created_at": timestamp,
+            "updated_at": timestamp,
+        })
+    return json.dumps(items).encode()
+
+
+BUILDERS = {
+    "dataclass": lambda items: [
+        DataclassMessage(**{key: value for key, value in item.items() if key in DATACLASS_FIELDS}) for item in items
+    ],
+    "model(**item)": lambda items: [UserMessage(**item) for item in items],
+    "from_dicts": UserMessage.from_dicts,
+    "table": UserMessageTable,
+}
+
+
+def _measure(name: str, build: Callable[[list], object], body: bytes, rows: int) -> str:
+    items = json.loads(body)
+    started = time.perf_counter()
+    result = build(items)
+    elapsed = time.perf_counter() - started
+    del result, items
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        items = json.loads(body)
+        result = build(items)
+        del items
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del result
+    return f"{name:<14} {rows:>9} {elapsed * 1e3:>10.1f} {elapsed / rows * 1e9:>10.0f} {retained / rows:>10.0f}"
+
+
+HEADER = f"{'builder':<14} {'rows':>9} {'ms':>10} {'ns/row':>10} {'B/row':>10}"
+
+
+def run(args) -> List[str]:
+    body = make_body(args.rows)
+    return [_measure(name, build, body, args.rows) for name, build in BUILDERS.items()]
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="Messages in the result")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    print(HEADER)
+    for row in run(args):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
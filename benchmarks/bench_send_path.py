@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of the client send path against the offline MockEskizServer.
+
+    python -m benchmarks.bench_send_path
+    python -m benchmarks.bench_send_path --sends 100000 --batch-size 1000 --json-backend json
+
+Reports CPU and wall time per send_sms/send_batch call and the peak memory allocated during one call
+(tracemalloc, measured on the first `--alloc-calls` calls only since tracing slows the calls down).
+The server is in-process and answers without latency, so the numbers include its share of the work.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+import tracemalloc
+from typing import Callable, List
+
+from eskiz_sms.jsonlib import BACKENDS, set_json_backend
+from eskiz_sms.mock import MockEskizServer
+
+
+def _measure(name: str, call: Callable[[int], object], calls: int, alloc_calls: int) -> str:
+    call(-1)
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(min(calls, alloc_calls)):
+            tracemalloc.clear_traces()
+            call(i)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+    alloc = statistics.mean(peaks) / 1024 if peaks else 0.0
+    return f"{name:<12} {calls:>9} {cpu / calls * 1e6:>12.1f} {wall / calls * 1e6:>12.1f} {alloc:>10.1f}"
+
+
+HEADER = f"{'call':<12} {'calls':>9} {'cpu us/call':>12} {'wall us/call':>12} {'KiB/call':>10}"
+
+
+def run(args) -> List[str]:
+    set_json_backend(args.json_backend)
+    server = MockEskizServer(keep_messages=False)
+    eskiz = server.client()
+    rows = []
+
+    def send(i: int):
+        return eskiz.send_sms("+998 90 123 45 67", "Your code is 1234")
+
+    rows.append(_measure("send_sms", send, args.sends, args.alloc_calls))
+
+    messages = [
+        {"user_sms_id": str(i), "to": 998901234567, "text": "Your code is 1234"}
+        for i in range(args.batch_size)
+    ]
+
+    def batch(i: int):
+        return eskiz.send_batch(messages=messages, dispatch_id=i)
+
+    batches = max(1, args.sends // args.batch_size)
+    rows.append(_measure("send_batch", batch, batches, min(args.alloc_calls, batches)))
+    eskiz.close()
+    set_json_backend(None)
+    return rows
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sends", type=int, default=100_000, help="Number of send_sms calls")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages per send_batch call")
+    parser.add_argument("--alloc-calls", type=int, default=1000, help="Calls of the allocation run")
+    parser.add_argument("--json-backend", choices=BACKENDS, help="JSON backend, the fastest installed by default")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    print(HEADER)
+    for row in run(args):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
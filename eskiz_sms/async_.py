@@ -1,19 +1,53 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from datetime import timedelta
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Union
 
 from .base import EskizSMSBase
+from .bulk import (
+    BatchResult,
+    BulkResult,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_MAX_PAYLOAD_BYTES,
+    asend_batch_chunked,
+    send_bulk,
+)
+from .columns import UserMessageTable
 from .exceptions import ContactNotFound
-from .types import Response, Contact, User, ContactCreated
+from .jsonlib import RawResponse
+from .poller import DispatchPoller
+from .reports import DateLike, aiter_user_messages, auser_messages_table
+from .types import Response, Contact, User, ContactCreated, UserMessage
 
 __all__ = ['EskizSMS']
 
 
 class EskizSMS(EskizSMSBase, async_=True):
+    async def aclose(self):
+        """Closes the connection pool, if it was created by the instance"""
+        if self._owns_http_client:
+            await self._http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
     @property
     async def user(self) -> Optional[User]:
-        self._user = await self._user_data()
-        return self._user
+        user = self._cached_user()
+        if user is None:
+            user = self._cache_user(await self._user_data())
+        return user
+
+    async def _get_user_id(self, user_id: int = None) -> int:
+        if user_id is not None:
+            return user_id
+        if self.user_id is not None:
+            return self.user_id
+        user = await self.user
+        return user.id
 
     async def _user_data(self) -> Optional[User]:
         response = await self._request.get("/auth/user")
@@ -54,8 +88,7 @@ class EskizSMS(EskizSMSBase, async_=True):
         return Response(**response)
 
     async def send_sms(self, mobile_phone: str, message: str, from_whom: str = '4546',
-                       callback_url: str = None) -> Response:
-
+                       callback_url: str = None, user_sms_id: str = None, idempotency_key: str = None) -> Response:
         payload = {
             "mobile_phone": str(mobile_phone),
             "message": message,
@@ -64,8 +97,43 @@ class EskizSMS(EskizSMSBase, async_=True):
         callback_url = self._get_callback_url(callback_url)
         if callback_url:
             payload['callback_url'] = callback_url
-        response = await self._request.post("/message/sms/send", payload=payload)
-        return Response(**response)
+        if user_sms_id is not None:
+            payload['user_sms_id'] = user_sms_id
+
+        key = self._idempotency_key(idempotency_key if idempotency_key is not None else user_sms_id)
+        sent = await self._aclaim_key(key)
+        if sent is not None:
+            return sent
+        try:
+            response = await self._request.post("/message/sms/send", payload=payload)
+        except BaseException as e:
+            await self._arelease_key(key, e)
+            raise
+        return await self._aremember_response(key, Response(**response))
+
+    def send_bulk(self, messages: Union[Iterable, AsyncIterable], *, concurrency: int = 10,
+                  from_whom: str = '4546', callback_url: str = None) -> AsyncIterator[BulkResult]:
+        """
+        Sends many messages with bounded concurrency over the shared connection pool.
+        Failed messages are reported in the results and don't stop the others.
+
+            async for result in eskiz.send_bulk(messages, concurrency=50):
+                if not result.ok:
+                    print(result.message, result.error)
+
+        :param messages: Iterable or async iterable of (mobile_phone, message[, user_sms_id]) items
+        :param concurrency: Max number of requests in flight, keep it below the pool limits
+        :param from_whom: Nickname
+        :param callback_url: Callback url for all the messages
+        :return: Async iterator of eskiz_sms.bulk.BulkResult in the order of completion
+        """
+        return send_bulk(
+            self,
+            messages,
+            concurrency=concurrency,
+            from_whom=from_whom,
+            callback_url=self._get_callback_url(callback_url),
+        )
 
     async def send_global_sms(self, mobile_phone: str, message: str, country_code: str,
                               callback_url: str = None, unicode: str = "0") -> Response:
@@ -81,54 +149,121 @@ class EskizSMS(EskizSMSBase, async_=True):
         response = await self._request.post("/message/sms/send-global", payload=payload)
         return Response(**response)
 
-    async def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int) -> Response:
-        response = await self._request.post(
-            "/message/sms/send-batch",
-            payload={
-                "messages": [
-                    {
-                        "user_sms_id": message["user_sms_id"],
-                        "to": str(message["to"]),
-                        "text": message["text"]
-                    } for message in messages
-                ],
-                "from_whom": from_whom,
-                "dispatch_id": dispatch_id
-            })
-        return Response(**response)
+    async def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int,
+                         idempotency_key: str = None) -> Response:
+        key = self._batch_idempotency_key(idempotency_key, dispatch_id, messages)
+        sent = await self._aclaim_key(key)
+        if sent is not None:
+            return sent
+        try:
+            response = await self._request.post(
+                "/message/sms/send-batch",
+                payload={
+                    "messages": [
+                        {
+                            "user_sms_id": message["user_sms_id"],
+                            "to": str(message["to"]),
+                            "text": message["text"]
+                        } for message in messages
+                    ],
+                    "from_whom": from_whom,
+                    "dispatch_id": dispatch_id
+                })
+        except BaseException as e:
+            await self._arelease_key(key, e)
+            raise
+        return await self._aremember_response(key, Response(**response))
 
-    async def get_user_messages(self, from_date: str, to_date: str) -> Response:
-        user = await self.user
+    async def send_batch_chunked(
+            self,
+            messages: Iterable[dict],
+            *,
+            dispatch_id: Union[int, Callable[[int], int]],
+            from_whom: str = "4546",
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+            parallelism: int = 4,
+    ) -> BatchResult:
+        return await asend_batch_chunked(
+            self,
+            messages,
+            dispatch_id=dispatch_id,
+            from_whom=from_whom,
+            chunk_size=chunk_size,
+            max_payload_bytes=max_payload_bytes,
+            parallelism=parallelism,
+        )
+
+    async def get_user_messages(self, from_date: str, to_date: str, user_id: int = None,
+                                raw: bool = False) -> Union[Response, RawResponse]:
+        user_id = await self._get_user_id(user_id)
         response = await self._request.get(
             "/message/sms/get-user-messages",
             payload={
                 "from_date": from_date,
                 "to_date": to_date,
-                "user_id": user.id
-            }
+                "user_id": user_id
+            },
+            raw=raw,
         )
-        return Response(**response)
+        return response if raw else Response(**response)
 
-    async def get_user_messages_by_dispatch(self, dispatch_id: int) -> Response:
-        user = await self.user
+    def iter_user_messages(
+            self,
+            from_date: DateLike,
+            to_date: DateLike,
+            *,
+            user_id: int = None,
+            window: timedelta = None,
+            prefetch: bool = False,
+    ) -> AsyncIterator[UserMessage]:
+        return aiter_user_messages(self, from_date, to_date, user_id=user_id, window=window, prefetch=prefetch)
+
+    async def user_messages_table(
+            self,
+            from_date: DateLike,
+            to_date: DateLike,
+            *,
+            user_id: int = None,
+            window: timedelta = None,
+            prefetch: bool = False,
+    ) -> UserMessageTable:
+        return await auser_messages_table(
+            self, from_date, to_date, user_id=user_id, window=window, prefetch=prefetch
+        )
+
+    async def get_user_messages_by_dispatch(self, dispatch_id: int, user_id: int = None,
+                                            raw: bool = False) -> Union[Response, RawResponse]:
+        user_id = await self._get_user_id(user_id)
         response = await self._request.get(
             "/message/sms/get-user-messages-by-dispatch",
             payload={
                 "dispatch_id": dispatch_id,
-                "user_id": user.id
-            })
-        return Response(**response)
+                "user_id": user_id
+            },
+            raw=raw,
+        )
+        return response if raw else Response(**response)
 
-    async def get_dispatch_status(self, dispatch_id: int) -> Response:
-        user = await self.user
-        response = self._request.get(
+    async def get_dispatch_status(self, dispatch_id: int, user_id: int = None) -> Response:
+        user_id = await self._get_user_id(user_id)
+        response = await self._request.get(
             "/message/sms/get-dispatch-status",
             payload={
                 "dispatch_id": dispatch_id,
-                "user_id": user.id
+                "user_id": user_id
             })
         return Response(**response)
 
+    def poll_dispatches(self, dispatch_ids: Iterable[int], **kwargs) -> DispatchPoller:
+        """
+        Tracks the statuses of many dispatches, see eskiz_sms.poller.DispatchPoller for the options
+
+            async for change in eskiz.poll_dispatches([1, 2, 3]).changes():
+                print(change.dispatch_id, change.data, change.finished)
+        """
+        return DispatchPoller(self, dispatch_ids, **kwargs)
+
     async def create_template(self, name: str, text: str) -> Response:
         response = await self._request.post(
             "/template",
@@ -156,13 +291,13 @@ class EskizSMS(EskizSMSBase, async_=True):
         response = await self._request.get("/template")
         return Response(**response)
 
-    async def totals(self, year: int) -> Response:
-        user = await self.user
+    async def totals(self, year: int, user_id: int = None) -> Response:
+        user_id = await self._get_user_id(user_id)
         response = await self._request.post(
             "/user/totals",
             payload={
                 "year": year,
-                "user_id": user.id
+                "user_id": user_id
             })
         return Response(**response)
 
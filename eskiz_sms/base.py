@@ -1,10 +1,28 @@
+import asyncio
 import re
-from typing import Optional, List
-
-from eskiz_sms.request import Request
+import time
+from datetime import timedelta
+from typing import Callable, Iterable, Iterator, Optional, List, Union
+
+import httpx
+
+from eskiz_sms.request import Request, create_http_client
+from .bulk import BatchResult, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_PAYLOAD_BYTES
+from .cache import ResponseCache
+from .circuit import CircuitBreaker
+from .columns import UserMessageTable
+from .concurrency import AIMDLimiter
 from .exceptions import InvalidCallbackUrl
-from .token import Token
-from .types import User, Contact, Response
+from .hooks import Hooks
+from .idempotency import IdempotencyStore, batch_key
+from .jsonlib import RawResponse
+from .priority import PriorityScheduler
+from .ratelimit import RateLimiter
+from .retry import Retry
+from .token import Token, DEFAULT_REFRESH_MARGIN
+from .token_store import TokenStore
+from .reports import DateLike
+from .types import User, Contact, Response, UserMessage
 
 
 class Meta(type):
@@ -18,9 +36,22 @@ class EskizSMSBase(metaclass=Meta):
     __slots__ = (
         "token",
         "_user",
+        "_user_fetched_at",
+        "user_id",
+        "user_cache_ttl",
         "callback_url",
         "is_async",
         "_request",
+        "_http_client",
+        "_owns_http_client",
+        "rate_limiter",
+        "retry",
+        "idempotency",
+        "scheduler",
+        "concurrency_limiter",
+        "circuit_breaker",
+        "cache",
+        "hooks",
     )
 
     def __init__(
@@ -31,11 +62,64 @@ class EskizSMSBase(metaclass=Meta):
             save_token: bool = False,
             env_file_path: str = None,
             auto_update_token=True,
+            http_client: Union[httpx.Client, httpx.AsyncClient] = None,
+            limits: httpx.Limits = None,
+            timeout: httpx.Timeout = None,
+            rate_limiter: RateLimiter = None,
+            retry: Retry = None,
+            token_refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+            token_store: TokenStore = None,
+            user_id: int = None,
+            user_cache_ttl: float = 300,
+            idempotency: IdempotencyStore = None,
+            scheduler: PriorityScheduler = None,
+            concurrency_limiter: AIMDLimiter = None,
+            circuit_breaker: CircuitBreaker = None,
+            cache: ResponseCache = None,
+            hooks: Hooks = None,
     ):
+        """
+        :param email: Eskiz account email
+        :param password: Eskiz account password
+        :param callback_url: Default callback url for the sent messages
+        :param save_token: Save the token to the env file
+        :param env_file_path: Path to the env file, default is .env
+        :param auto_update_token: Get the new token when the current one is invalid
+        :param http_client: Pre-configured httpx.Client (httpx.AsyncClient for async) to use.
+            It won't be closed by close()/aclose()
+        :param limits: Connection pool limits of the created client
+        :param timeout: Timeouts of the created client
+        :param rate_limiter: Client-side rate limits per endpoint group, can be shared between instances
+        :param retry: Retry policies of the transient failures, nothing is retried by default
+        :param token_refresh_margin: Seconds before the token expiry to refresh it in the background
+        :param token_store: Token storage shared between instances/processes, e.g. FileTokenStore
+        :param user_id: Id of the account user for the reports, /auth/user isn't requested when it's set
+        :param user_cache_ttl: Seconds to keep the user profile, 0 disables the cache
+        :param idempotency: Ledger of the sent messages, repeated send_sms/send_batch with the same
+            user_sms_id (or idempotency_key) returns the original response without sending
+        :param scheduler: Priority lanes of the requests, can be shared between instances
+        :param concurrency_limiter: Adaptive limit of the requests in flight, used by the async client only
+        :param circuit_breaker: Fails fast with ServiceUnavailable while the API is down, can be shared between instances
+        :param cache: Cache of get_templates, get_template, get_limit, get_contact and totals responses
+        :param hooks: Instrumentation hooks of the requests and the token, e.g. MetricsCollector().hooks
+        """
 
         if callback_url is not None:
             self._validate_callback_url(callback_url)
         self.callback_url = callback_url
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.idempotency = idempotency
+        self.scheduler = scheduler
+        self.concurrency_limiter = concurrency_limiter
+        self.circuit_breaker = circuit_breaker
+        self.cache = cache
+        self.hooks = hooks
+
+        self._owns_http_client = http_client is None
+        if http_client is None:
+            http_client = create_http_client(getattr(self, 'is_async'), limits=limits, timeout=timeout)
+        self._http_client = http_client
 
         self.token = Token(
             email,
@@ -43,10 +127,17 @@ class EskizSMSBase(metaclass=Meta):
             save_token=save_token,
             env_file_path=env_file_path,
             auto_update=auto_update_token,
-            is_async=getattr(self, 'is_async')
+            is_async=getattr(self, 'is_async'),
+            http_client=self._http_client,
+            refresh_margin=token_refresh_margin,
+            store=token_store,
+            hooks=hooks,
         )
         self._request = Request(self)
         self._user: Optional[User] = None
+        self._user_fetched_at = 0.0
+        self.user_id = user_id
+        self.user_cache_ttl = user_cache_ttl
 
     @staticmethod
     def _validate_callback_url(url):
@@ -59,8 +150,64 @@ class EskizSMSBase(metaclass=Meta):
             return callback_url
         return self.callback_url
 
+    def _cached_user(self) -> Optional[User]:
+        if self._user is not None and time.monotonic() - self._user_fetched_at < self.user_cache_ttl:
+            return self._user
+        return None
+
+    def _cache_user(self, user: Optional[User]) -> Optional[User]:
+        self._user = user
+        self._user_fetched_at = time.monotonic()
+        return user
+
+    def _idempotency_key(self, key: Optional[str]) -> Optional[str]:
+        return key if self.idempotency is not None else None
+
+    def _batch_idempotency_key(self, key: Optional[str], dispatch_id: int, messages: List[dict]) -> Optional[str]:
+        if self.idempotency is None:
+            return None
+        if key is not None:
+            return key
+        return batch_key(dispatch_id, (message["user_sms_id"] for message in messages))
+
+    def _claim_key(self, key: Optional[str]) -> Optional[Response]:
+        """Reserves the idempotency key, returns the response of the previous send with the key"""
+        if key is None:
+            return None
+        return self.idempotency.claim(key)
+
+    async def _aclaim_key(self, key: Optional[str]) -> Optional[Response]:
+        if key is None:
+            return None
+        return await self.idempotency.aclaim(key)
+
+    def _release_key(self, key: Optional[str], error: BaseException):
+        """Releases the key if the message was rejected, otherwise it stays taken"""
+        if key is not None:
+            self.idempotency.finish(key, error)
+
+    def _remember_response(self, key: Optional[str], response: Response) -> Response:
+        if key is not None:
+            self.idempotency.put(key, response)
+        return response
+
+    async def _arelease_key(self, key: Optional[str], error: BaseException):
+        if key is not None:
+            # the send could be cancelled, the key is released or marked anyway
+            await asyncio.shield(self.idempotency.afinish(key, error))
+
+    async def _aremember_response(self, key: Optional[str], response: Response) -> Response:
+        if key is not None:
+            await asyncio.shield(self.idempotency.afinish(key, response=response))
+        return response
+
+    def invalidate_user(self):
+        """Drops the cached user profile, it will be requested again on the next access"""
+        self._user = None
+
     @property
     def user(self) -> Optional[User]:
+        """User profile, cached for user_cache_ttl seconds"""
         raise NotImplementedError
 
     def _user_data(self) -> Optional[User]:
@@ -79,7 +226,7 @@ class EskizSMSBase(metaclass=Meta):
         raise NotImplementedError
 
     def send_sms(self, mobile_phone: str, message: str, from_whom: str = '4546',
-                 callback_url: str = None) -> Response:
+                 callback_url: str = None, user_sms_id: str = None, idempotency_key: str = None) -> Response:
         """
         :param mobile_phone: Phone number without plus sign
         :param message: Message to send
@@ -89,6 +236,8 @@ class EskizSMSBase(metaclass=Meta):
             {"message_id": "4385062", "user_sms_id": "your_id_here", "country": "UZ",
             "phone_number": "998991234567", "sms_count": "1",
             "status" : "DELIVER", "status_date": "2021-04-02 00:39:36"}
+        :param user_sms_id: Your own id of the message, it is sent back in the callback
+        :param idempotency_key: Key of the idempotency ledger, user_sms_id is used by default
         :return: Response
         """
         raise NotImplementedError
@@ -106,24 +255,100 @@ class EskizSMSBase(metaclass=Meta):
 
         raise NotImplementedError
 
-    def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int) -> Response:
+    def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int,
+                   idempotency_key: str = None) -> Response:
         """
         :param messages: List of messages to send.
             [{"user_sms_id":"sms1","to": 998998046210, "text": "eto test"}]
         :param from_whom: 4546
         :param dispatch_id:
+        :param idempotency_key: Key of the idempotency ledger,
+            by default it's made of dispatch_id and user_sms_id's of the messages
         :returns: Response
         :rtype: eskiz_sms.types.Response
         """
         raise NotImplementedError
 
-    def get_user_messages(self, from_date: str, to_date: str) -> Response:
+    def send_batch_chunked(
+            self,
+            messages: Iterable[dict],
+            *,
+            dispatch_id: Union[int, Callable[[int], int]],
+            from_whom: str = "4546",
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+            parallelism: int = 4,
+    ) -> BatchResult:
+        """
+        Splits the messages into chunks and sends them with send_batch concurrently.
+        Messages are consumed lazily, failed chunks don't stop the others.
+
+        :param messages: Iterable of messages, same format as in send_batch
+        :param dispatch_id: Dispatch id of all chunks,
+            or a callable which returns the dispatch id by the chunk index
+        :param from_whom: 4546
+        :param chunk_size: Max number of messages in one request
+        :param max_payload_bytes: Approximate max size of the messages in one request
+        :param parallelism: Max number of chunks sent at the same time
+        :returns: BatchResult, result[user_sms_id] is the result of the chunk of the message
+        :rtype: eskiz_sms.bulk.BatchResult
+        """
+        raise NotImplementedError
+
+    def get_user_messages(self, from_date: str, to_date: str, user_id: int = None,
+                          raw: bool = False) -> Union[Response, RawResponse]:
+        """
+        :param raw: Return RawResponse, the body is kept as bytes and decoded on demand
+        """
+        raise NotImplementedError
+
+    def iter_user_messages(
+            self,
+            from_date: DateLike,
+            to_date: DateLike,
+            *,
+            user_id: int = None,
+            window: timedelta = None,
+            prefetch: bool = False,
+    ) -> Iterator[UserMessage]:
+        """
+        Iterates over the messages of the period page by page, only one page is kept in memory.
+        Async version returns async iterator.
+
+        :param from_date: e.g. '2023-01-01 00:00' or datetime
+        :param to_date: e.g. '2023-01-31 23:59' or datetime
+        :param user_id: Id of the user, by default is taken from the user profile
+        :param window: Split the period into windows of this size, e.g. timedelta(days=1)
+        :param prefetch: Request the next page while the current one is processed
+        :rtype: Iterator[eskiz_sms.types.UserMessage]
+        """
         raise NotImplementedError
 
-    def get_user_messages_by_dispatch(self, dispatch_id: int) -> Response:
+    def user_messages_table(
+            self,
+            from_date: DateLike,
+            to_date: DateLike,
+            *,
+            user_id: int = None,
+            window: timedelta = None,
+            prefetch: bool = False,
+    ) -> UserMessageTable:
+        """
+        Fetches the messages of the period into the columnar table, it keeps much less memory
+        than UserMessage objects for the large periods. Arguments are the same as of iter_user_messages.
+
+        :rtype: eskiz_sms.columns.UserMessageTable
+        """
+        raise NotImplementedError
+
+    def get_user_messages_by_dispatch(self, dispatch_id: int, user_id: int = None,
+                                      raw: bool = False) -> Union[Response, RawResponse]:
+        """
+        :param raw: Return RawResponse, the body is kept as bytes and decoded on demand
+        """
         raise NotImplementedError
 
-    def get_dispatch_status(self, dispatch_id: int) -> Response:
+    def get_dispatch_status(self, dispatch_id: int, user_id: int = None) -> Response:
         raise NotImplementedError
 
     def create_template(self, name: str, text: str) -> Response:
@@ -138,7 +363,7 @@ class EskizSMSBase(metaclass=Meta):
     def get_templates(self) -> Response:
         raise NotImplementedError
 
-    def totals(self, year: int) -> Response:
+    def totals(self, year: int, user_id: int = None) -> Response:
         raise NotImplementedError
 
     def get_limit(self) -> Response:
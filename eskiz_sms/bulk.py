@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import (
+    AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union, TYPE_CHECKING
+)
+
+from .types import Response
+
+if TYPE_CHECKING:
+    from .async_ import EskizSMS
+    from .eskiz import EskizSMS as SyncEskizSMS
+
+__all__ = [
+    'BulkMessage',
+    'BulkResult',
+    'send_bulk',
+    'BatchChunkResult',
+    'BatchResult',
+    'iter_chunks',
+    'send_batch_chunked',
+    'asend_batch_chunked',
+]
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_MAX_PAYLOAD_BYTES = 256 * 1024
+# json punctuation and keys of the single message in the batch payload
+_MESSAGE_OVERHEAD = len('{"user_sms_id":"","to":"","text":""},')
+
+
+class BulkMessage(NamedTuple):
+    mobile_phone: str
+    message: str
+    user_sms_id: Optional[str] = None
+
+
+@dataclass
+class BulkResult:
+    message: BulkMessage
+    response: Optional[Response] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def _aiter(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def _send(eskiz: EskizSMS, message: BulkMessage, from_whom: str, callback_url: Optional[str]) -> BulkResult:
+    try:
+        response = await eskiz.send_sms(
+            message.mobile_phone,
+            message.message,
+            from_whom=from_whom,
+            callback_url=callback_url,
+            user_sms_id=message.user_sms_id,
+        )
+    except Exception as e:
+        return BulkResult(message, error=e)
+    return BulkResult(message, response=response)
+
+
+async def send_bulk(
+        eskiz: EskizSMS,
+        messages: Union[Iterable, AsyncIterable],
+        *,
+        concurrency: int = 10,
+        from_whom: str = "4546",
+        callback_url: str = None,
+) -> AsyncIterator[BulkResult]:
+    """
+    Sends the messages one by one with at most `concurrency` requests in flight
+    and yields the results in the order of completion.
+    Messages are pulled from the source lazily, so the input can be arbitrarily large.
+
+    :param eskiz: Async EskizSMS instance
+    :param messages: Iterable or async iterable of (mobile_phone, message[, user_sms_id]) items
+    :param concurrency: Max number of requests in flight
+    :param from_whom: Nickname
+    :param callback_url: Callback url for all the messages
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    source = _aiter(messages)
+    pending = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    item = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                if not isinstance(item, BulkMessage):
+                    item = BulkMessage(*item)
+                pending.add(asyncio.ensure_future(_send(eskiz, item, from_whom, callback_url)))
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@dataclass
+class BatchChunkResult:
+    index: int
+    dispatch_id: int
+    user_sms_ids: List[str]
+    response: Optional[Response] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchResult:
+    """Aggregated result of the chunked batch, maps user_sms_id to the result of its chunk"""
+
+    __slots__ = ("chunks", "_by_user_sms_id")
+
+    def __init__(self):
+        self.chunks: List[BatchChunkResult] = []
+        self._by_user_sms_id: Dict[str, BatchChunkResult] = {}
+
+    def add(self, chunk: BatchChunkResult):
+        self.chunks.append(chunk)
+        for user_sms_id in chunk.user_sms_ids:
+            self._by_user_sms_id[user_sms_id] = chunk
+
+    def __getitem__(self, user_sms_id: str) -> BatchChunkResult:
+        return self._by_user_sms_id[user_sms_id]
+
+    def __contains__(self, user_sms_id: str) -> bool:
+        return user_sms_id in self._by_user_sms_id
+
+    def __len__(self):
+        return len(self._by_user_sms_id)
+
+    @property
+    def ok(self) -> bool:
+        return all(chunk.ok for chunk in self.chunks)
+
+    @property
+    def dispatch_ids(self) -> List[int]:
+        return sorted({chunk.dispatch_id for chunk in self.chunks})
+
+    @property
+    def failed(self) -> List[BatchChunkResult]:
+        return [chunk for chunk in self.chunks if not chunk.ok]
+
+
+def _message_size(message: dict) -> int:
+    return (
+            len(str(message["user_sms_id"]))
+            + len(str(message["to"]))
+            + len(message["text"].encode())
+            + _MESSAGE_OVERHEAD
+    )
+
+
+def iter_chunks(
+        messages: Iterable[dict],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+) -> Iterator[List[dict]]:
+    """
+    Splits the messages lazily into chunks of at most `chunk_size` messages
+    and approximately `max_payload_bytes` of payload
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    chunk = []
+    size = 0
+    for message in messages:
+        message_size = _message_size(message)
+        if chunk and (len(chunk) >= chunk_size or size + message_size > max_payload_bytes):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(message)
+        size += message_size
+    if chunk:
+        yield chunk
+
+
+def _get_dispatch_id(dispatch_id: Union[int, Callable[[int], int]], index: int) -> int:
+    if callable(dispatch_id):
+        return dispatch_id(index)
+    return dispatch_id
+
+
+def _chunk_result(index: int, dispatch_id: int, chunk: List[dict]) -> BatchChunkResult:
+    return BatchChunkResult(index, dispatch_id, [message["user_sms_id"] for message in chunk])
+
+
+def send_batch_chunked(
+        eskiz: SyncEskizSMS,
+        messages: Iterable[dict],
+        *,
+        dispatch_id: Union[int, Callable[[int], int]],
+        from_whom: str = "4546",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+        parallelism: int = 4,
+) -> BatchResult:
+    if parallelism < 1:
+        raise ValueError("parallelism must be at least 1")
+
+    def _send_chunk(chunk_result: BatchChunkResult, chunk: List[dict]) -> BatchChunkResult:
+        try:
+            chunk_result.response = eskiz.send_batch(
+                messages=chunk, from_whom=from_whom, dispatch_id=chunk_result.dispatch_id
+            )
+        except Exception as e:
+            chunk_result.error = e
+        return chunk_result
+
+    result = BatchResult()
+    pending = set()
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        for index, chunk in enumerate(iter_chunks(messages, chunk_size, max_payload_bytes)):
+            if len(pending) >= parallelism:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result.add(future.result())
+            chunk_result = _chunk_result(index, _get_dispatch_id(dispatch_id, index), chunk)
+            pending.add(executor.submit(_send_chunk, chunk_result, chunk))
+        for future in pending:
+            result.add(future.result())
+    return result
+
+
+async def asend_batch_chunked(
+        eskiz: EskizSMS,
+        messages: Iterable[dict],
+        *,
+        dispatch_id: Union[int, Callable[[int], int]],
+        from_whom: str = "4546",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+        parallelism: int = 4,
+) -> BatchResult:
+    if parallelism < 1:
+        raise ValueError("parallelism must be at least 1")
+
+    async def _send_chunk(chunk_result: BatchChunkResult, chunk: List[dict]) -> BatchChunkResult:
+        try:
+            chunk_result.response = await eskiz.send_batch(
+                messages=chunk, from_whom=from_whom, dispatch_id=chunk_result.dispatch_id
+            )
+        except Exception as e:
+            chunk_result.error = e
+        return chunk_result
+
+    result = BatchResult()
+    pending = set()
+    try:
+        for index, chunk in enumerate(iter_chunks(messages, chunk_size, max_payload_bytes)):
+            if len(pending) >= parallelism:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result.add(task.result())
+            chunk_result = _chunk_result(index, _get_dispatch_id(dispatch_id, index), chunk)
+            pending.add(asyncio.ensure_future(_send_chunk(chunk_result, chunk)))
+        for chunk_result in await asyncio.gather(*pending):
+            result.add(chunk_result)
+        pending = set()
+    finally:
+        for task in pending:
+            task.cancel()
+    return result
@@ -0,0 +1,225 @@
+"""
+Cache of the read-only endpoints: get_templates, get_template, get_limit, get_contact and totals.
+
+    eskiz = EskizSMS('email', 'password', cache=ResponseCache(ttls={"limit": 5}))
+
+Responses are kept for the ttl of the endpoint in LRU of `max_size` entries.
+Identical requests made while the first one is in flight wait for its response instead of being sent.
+A write (update_template, delete_contact etc.) drops the cached responses of its path and the parent path,
+e.g. PUT /template/5 invalidates get_template(5) and get_templates(). Sends drop get_limit() and totals(),
+the balance is changed by them. The writes which don't change the cached endpoints don't touch the cache.
+The cached data is shared between the callers, it must not be mutated.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+__all__ = ['ResponseCache', 'DEFAULT_TTLS', 'endpoint_name', 'invalidated_paths']
+
+DEFAULT_TTLS: Dict[str, float] = {
+    "templates": 300.0,
+    "template": 300.0,
+    "limit": 10.0,
+    "contact": 60.0,
+    "totals": 60.0,
+}
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+# cached paths changed by the sends
+SEND_INVALIDATES = ("/user/get-limit", "/user/totals")
+
+
+def endpoint_name(method: str, path: str) -> Optional[str]:
+    """Name of the cacheable endpoint, None for the others"""
+    if method == "GET":
+        if path == "/template":
+            return "templates"
+        if path.startswith("/template/"):
+            return "template"
+        if path == "/user/get-limit":
+            return "limit"
+        if path.startswith("/contact/"):
+            return "contact"
+    elif method == "POST" and path == "/user/totals":
+        return "totals"
+    return None
+
+
+def _parent(path: str) -> str:
+    return path.rsplit("/", 1)[0]
+
+
+def invalidated_paths(method: str, path: str) -> Tuple[str, ...]:
+    """Cached paths whose responses are changed by the request, empty for the reads"""
+    if method == "GET" or endpoint_name(method, path) is not None:
+        return ()
+    if path.startswith("/message/sms/send"):
+        return SEND_INVALIDATES
+    return tuple(
+        changed for changed in (path, _parent(path))
+        if endpoint_name("GET", changed) is not None
+    )
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """TTL + LRU cache with single-flight loading, thread-safe. Use one instance per account"""
+
+    def __init__(self, max_size: int = 1024, ttls: Dict[str, float] = None):
+        """
+        :param max_size: Max number of the cached responses
+        :param ttls: Seconds to keep the responses by endpoint name: "templates", "template",
+            "limit", "contact", "totals". Missing names take the default ttl, 0 disables caching of the endpoint
+        """
+        self.max_size = max_size
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        # keys of the entries by path, the invalidation doesn't scan all the entries
+        self._paths: Dict[str, Set[CacheKey]] = {}
+        self._flights: Dict[CacheKey, _Flight] = {}
+        self._async_flights: Dict[CacheKey, asyncio.Future] = {}
+        # a load is stored only if neither the cache nor its path was invalidated while it was in flight
+        self._generation = 0
+        self._path_generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl(self, method: str, path: str) -> Optional[float]:
+        name = endpoint_name(method, path)
+        if name is None:
+            return None
+        return self.ttls.get(name) or None
+
+    @staticmethod
+    def key(method: str, path: str, payload: Optional[dict]) -> CacheKey:
+        return method, path, tuple(sorted((k, str(v)) for k, v in (payload or {}).items()))
+
+    def _delete(self, key: CacheKey):
+        """Must be called with the lock held"""
+        del self._entries[key]
+        keys = self._paths[key[1]]
+        keys.discard(key)
+        if not keys:
+            del self._paths[key[1]]
+
+    def _get(self, key: CacheKey) -> Tuple[bool, Any]:
+        """Must be called with the lock held"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            self._delete(key)
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[1]
+
+    def _generations(self, key: CacheKey) -> Tuple[int, int]:
+        """Must be called with the lock held"""
+        return self._generation, self._path_generations.get(key[1], 0)
+
+    def _set(self, key: CacheKey, value: Any, ttl: float, generations: Tuple[int, int]):
+        with self._lock:
+            # the data was invalidated while it was loaded
+            if generations != self._generations(key):
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            self._paths.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._delete(next(iter(self._entries)))
+
+    def invalidate(self, path: str = None):
+        """Drops the responses of the path, or all of them"""
+        with self._lock:
+            if path is None:
+                self._generation += 1
+                self._path_generations.clear()
+                self._entries.clear()
+                self._paths.clear()
+                return
+            self._path_generations[path] = self._path_generations.get(path, 0) + 1
+            for key in self._paths.pop(path, ()):
+                del self._entries[key]
+
+    def invalidate_write(self, method: str, path: str):
+        """Drops the responses changed by the write request"""
+        for changed in invalidated_paths(method, path):
+            self.invalidate(changed)
+
+    def load(self, key: CacheKey, ttl: float, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            found, value = self._get(key)
+            if found:
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            generations = self._generations(key)
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            self._set(key, flight.value, ttl, generations)
+            return flight.value
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    async def aload(self, key: CacheKey, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            with self._lock:
+                found, value = self._get(key)
+                if found:
+                    return value
+                generations = self._generations(key)
+            future = self._async_flights.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the leader was cancelled, load it again
+
+        future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # the followers retrieve it, the exception mustn't be reported as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            self._set(key, value, ttl, generations)
+            return value
+        finally:
+            del self._async_flights[key]
@@ -0,0 +1,357 @@
+"""
+Receiver of the delivery reports sent by Eskiz to the callback_url.
+
+    batcher = ThreadedBatcher(sink=save_reports, max_batch_size=500, flush_interval=1.0)
+    app = WSGICallbackApp(batcher)  # or ASGICallbackApp(AsyncBatcher(...)) for asgi frameworks
+
+The reports are buffered in a bounded queue and passed to the sink in lists,
+when the batch is full or flush_interval passed. When the queue is full the app answers 503.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+from urllib.parse import parse_qs
+
+from .logging import logger
+
+__all__ = [
+    'DeliveryReport',
+    'parse_delivery_report',
+    'ThreadedBatcher',
+    'AsyncBatcher',
+    'WSGICallbackApp',
+    'ASGICallbackApp',
+]
+
+Sink = Callable[[List['DeliveryReport']], Any]
+
+STATUS_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class DeliveryReport:
+    """
+    {"message_id": "4385062", "user_sms_id": "your_id_here", "country": "UZ",
+    "phone_number": "998991234567", "sms_count": "1",
+    "status" : "DELIVER", "status_date": "2021-04-02 00:39:36"}
+    """
+
+    __slots__ = (
+        "message_id",
+        "user_sms_id",
+        "country",
+        "phone_number",
+        "sms_count",
+        "status",
+        "status_date",
+    )
+
+    def __init__(
+            self,
+            message_id: str,
+            user_sms_id: Optional[str] = None,
+            country: Optional[str] = None,
+            phone_number: Optional[str] = None,
+            sms_count: int = 1,
+            status: Optional[str] = None,
+            status_date: Optional[str] = None,
+    ):
+        self.message_id = message_id
+        self.user_sms_id = user_sms_id
+        self.country = country
+        self.phone_number = phone_number
+        self.sms_count = sms_count
+        self.status = status
+        self.status_date = status_date
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeliveryReport":
+        """Unknown keys are ignored, raises ValueError when message_id is missing"""
+        message_id = data.get('message_id')
+        if message_id is None or message_id == '':
+            raise ValueError("message_id is required")
+        sms_count = data.get('sms_count')
+        return cls(
+            message_id=str(message_id),
+            user_sms_id=_optional_str(data.get('user_sms_id')),
+            country=_optional_str(data.get('country')),
+            phone_number=_optional_str(data.get('phone_number')),
+            sms_count=int(sms_count) if sms_count not in (None, '') else 1,
+            status=_optional_str(data.get('status')),
+            status_date=_optional_str(data.get('status_date')),
+        )
+
+    @property
+    def status_datetime(self) -> Optional[datetime]:
+        if not self.status_date:
+            return None
+        return datetime.strptime(self.status_date, STATUS_DATE_FORMAT)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        if not isinstance(other, DeliveryReport):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return (
+            f"DeliveryReport(message_id={self.message_id!r}, "
+            f"user_sms_id={self.user_sms_id!r}, status={self.status!r})"
+        )
+
+
+def _optional_str(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def parse_delivery_report(body: bytes, content_type: str = "application/json") -> DeliveryReport:
+    """Parses json or form encoded body, raises ValueError when the body is invalid"""
+    if "application/x-www-form-urlencoded" in content_type:
+        data = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+    else:
+        data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Delivery report must be an object")
+    return DeliveryReport.from_dict(data)
+
+
+class ThreadedBatcher:
+    """Collects the reports and passes them to the sink from a background thread"""
+
+    def __init__(
+            self,
+            sink: Sink,
+            max_batch_size: int = 500,
+            flush_interval: float = 1.0,
+            max_queue_size: int = 10000,
+    ):
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name="eskiz-dlr-batcher", daemon=True)
+                self._thread.start()
+
+    def put(self, report: DeliveryReport) -> bool:
+        """Returns False if the queue is full"""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(report)
+        except queue.Full:
+            return False
+        return True
+
+    def _flush(self, batch: List[DeliveryReport]):
+        try:
+            self.sink(batch)
+        except Exception as e:
+            logger.exception(f"Eskiz delivery report sink failed, {len(batch)} reports are lost: {e!r}")
+
+    def _run(self):
+        batch: List[DeliveryReport] = []
+        deadline = None
+        while not (self._stopped.is_set() and self._queue.empty()):
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if batch and (len(batch) >= self.max_batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch, deadline = [], None
+        if batch:
+            self._flush(batch)
+
+    def close(self):
+        """Flushes the queued reports and stops the thread"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_STOP = object()
+
+
+class AsyncBatcher:
+    """Collects the reports and passes them to the sink (function or coroutine function) from a task"""
+
+    def __init__(
+            self,
+            sink: Sink,
+            max_batch_size: int = 500,
+            flush_interval: float = 1.0,
+            max_queue_size: int = 10000,
+    ):
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def start(self):
+        if self._task is None:
+            self._closed = False
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = asyncio.ensure_future(self._run())
+
+    def put(self, report: DeliveryReport) -> bool:
+        """Returns False if the queue is full or the batcher is closed, must be called from the event loop"""
+        if self._closed:
+            return False
+        if self._task is None:
+            self.start()
+        try:
+            self._queue.put_nowait(report)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _flush(self, batch: List[DeliveryReport]):
+        try:
+            result = self.sink(batch)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.exception(f"Eskiz delivery report sink failed, {len(batch)} reports are lost: {e!r}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch: List[DeliveryReport] = []
+        deadline = None
+        stopped = False
+        while not stopped:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                report = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                if report is _STOP:
+                    stopped = True
+                else:
+                    batch.append(report)
+                    if deadline is None:
+                        deadline = loop.time() + self.flush_interval
+            if batch and (stopped or len(batch) >= self.max_batch_size or loop.time() >= deadline):
+                await self._flush(batch)
+                batch, deadline = [], None
+
+    async def aclose(self):
+        """Flushes the queued reports and stops the task"""
+        if self._task is None:
+            return
+        task = self._task
+        if not self._closed:
+            # no reports are queued after the sentinel, put() refuses them from now on
+            self._closed = True
+            # the task isn't cancelled, so a batch being flushed is neither interrupted nor flushed twice
+            await self._queue.put(_STOP)
+        await task
+        if self._task is task:
+            self._task = None
+
+
+def _response_body(status: str) -> bytes:
+    return json.dumps({"status": status}).encode()
+
+
+class WSGICallbackApp:
+    """WSGI application receiving the delivery reports"""
+
+    def __init__(self, batcher: ThreadedBatcher):
+        self.batcher = batcher
+
+    def __call__(self, environ, start_response):
+        status, body = self.handle(environ)
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+        return [body]
+
+    def handle(self, environ):
+        if environ.get("REQUEST_METHOD") != "POST":
+            return "405 Method Not Allowed", _response_body("method not allowed")
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        try:
+            report = parse_delivery_report(environ["wsgi.input"].read(length), environ.get("CONTENT_TYPE") or "")
+        except ValueError:
+            return "400 Bad Request", _response_body("invalid report")
+        if not self.batcher.put(report):
+            return "503 Service Unavailable", _response_body("busy")
+        return "200 OK", _response_body("ok")
+
+
+class ASGICallbackApp:
+    """ASGI application receiving the delivery reports"""
+
+    def __init__(self, batcher: AsyncBatcher):
+        self.batcher = batcher
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        status, body = await self.handle(scope, receive)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, receive):
+        if scope.get("method") != "POST":
+            return 405, _response_body("method not allowed")
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        content_type = ""
+        for key, value in scope.get("headers", []):
+            if key == b"content-type":
+                content_type = value.decode()
+        try:
+            report = parse_delivery_report(b"".join(chunks), content_type)
+        except ValueError:
+            return 400, _response_body("invalid report")
+        if not self.batcher.put(report):
+            return 503, _response_body("busy")
+        return 200, _response_body("ok")
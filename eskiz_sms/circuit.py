@@ -0,0 +1,202 @@
+"""
+Circuit breaker, fails fast while the API is down instead of waiting for the timeouts.
+
+    breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30, thresholds={EndpointGroup.BATCH: 2})
+    breaker.add_listener(lambda group, old, new: print(group, old, new))
+    eskiz = EskizSMS('email', 'password', circuit_breaker=breaker)
+
+After `failure_threshold` consecutive failures (connect errors, timeouts, 5xx) of an endpoint group
+its circuit opens and the requests of the group raise ServiceUnavailable without being sent.
+After `recovery_timeout` seconds the circuit is half-open, a few trial requests are let through:
+a success closes the circuit, a failure opens it again. Results of the requests started before
+the last state change are ignored, so a late success of an old request doesn't close the circuit.
+The same instance can be passed to several EskizSMS instances to share the state.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .enums import CircuitState, EndpointGroup
+from .exceptions import ConnectError, EskizException, RequestTimeout, ServerError, ServiceUnavailable
+from .logging import logger
+
+__all__ = ['CircuitBreaker', 'is_failure']
+
+Listener = Callable[[EndpointGroup, CircuitState, CircuitState], None]
+
+
+def is_failure(error: Optional[BaseException]) -> bool:
+    """Errors which mean the API is unavailable"""
+    return isinstance(error, (ConnectError, RequestTimeout, ServerError))
+
+
+class _Circuit:
+    __slots__ = ("state", "failures", "successes", "opened_at", "trials", "generation")
+
+    def __init__(self):
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.successes = 0
+        self.opened_at = 0.0
+        self.trials = 0
+        # incremented on every state change, the requests are tagged with it
+        self.generation = 0
+
+
+class CircuitBreaker:
+    """Circuit per endpoint group, thread-safe"""
+
+    def __init__(
+            self,
+            failure_threshold: int = 5,
+            recovery_timeout: float = 30.0,
+            half_open_max_calls: int = 1,
+            success_threshold: int = 1,
+            thresholds: Dict[EndpointGroup, int] = None,
+            is_failure: Callable[[BaseException], bool] = is_failure,
+    ):
+        """
+        :param failure_threshold: Consecutive failures to open the circuit
+        :param recovery_timeout: Seconds the circuit stays open before the trial requests
+        :param half_open_max_calls: Max number of trial requests in flight when the circuit is half-open
+        :param success_threshold: Successful trial requests to close the circuit
+        :param thresholds: failure_threshold per endpoint group
+        :param is_failure: Returns True when the error must be counted as a failure
+        """
+        if failure_threshold < 1 or half_open_max_calls < 1 or success_threshold < 1:
+            raise ValueError("failure_threshold, half_open_max_calls and success_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.success_threshold = success_threshold
+        self.thresholds = dict(thresholds or {})
+        self.is_failure = is_failure
+        self._circuits: Dict[EndpointGroup, _Circuit] = {}
+        self._listeners: List[Listener] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: Listener):
+        """listener(group, old_state, new_state) is called on every state change"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Listener):
+        self._listeners.remove(listener)
+
+    def _circuit(self, group: EndpointGroup) -> _Circuit:
+        circuit = self._circuits.get(group)
+        if circuit is None:
+            circuit = self._circuits.setdefault(group, _Circuit())
+        return circuit
+
+    def state(self, group: EndpointGroup = EndpointGroup.DEFAULT) -> CircuitState:
+        with self._lock:
+            circuit = self._circuit(group)
+            if circuit.state == CircuitState.OPEN and self._recovered(circuit):
+                return CircuitState.HALF_OPEN
+            return circuit.state
+
+    def _recovered(self, circuit: _Circuit) -> bool:
+        return time.monotonic() - circuit.opened_at >= self.recovery_timeout
+
+    def _set_state(self, circuit: _Circuit, state: CircuitState) -> Optional[CircuitState]:
+        """Must be called with the lock held, returns the old state if it was changed"""
+        old = circuit.state
+        if old == state:
+            return None
+        circuit.state = state
+        circuit.generation += 1
+        circuit.failures = 0
+        circuit.successes = 0
+        circuit.trials = 0
+        if state == CircuitState.OPEN:
+            circuit.opened_at = time.monotonic()
+        return old
+
+    def _notify(self, group: EndpointGroup, old: Optional[CircuitState], new: CircuitState):
+        if old is None:
+            return
+        logger.warning(f"Eskiz circuit of {group.value} requests is {new.value} (was {old.value})")
+        for listener in list(self._listeners):
+            try:
+                listener(group, old, new)
+            except Exception as e:
+                logger.exception(f"Eskiz circuit breaker listener failed: {e!r}")
+
+    def before_request(self, group: EndpointGroup = EndpointGroup.DEFAULT) -> int:
+        """
+        Raises ServiceUnavailable if the request of the group must not be sent.
+        Returns the generation of the circuit to be passed to after_request()
+        """
+        old = None
+        with self._lock:
+            circuit = self._circuit(group)
+            if circuit.state == CircuitState.CLOSED:
+                return circuit.generation
+            if circuit.state == CircuitState.OPEN:
+                if not self._recovered(circuit):
+                    raise ServiceUnavailable(
+                        message=f"Eskiz {group.value} requests are failing, circuit is open",
+                        retry_after=self.recovery_timeout - (time.monotonic() - circuit.opened_at),
+                        group=group,
+                    )
+                old = self._set_state(circuit, CircuitState.HALF_OPEN)
+            if circuit.trials >= self.half_open_max_calls:
+                raise ServiceUnavailable(
+                    message=f"Eskiz {group.value} requests are failing, circuit is half-open",
+                    retry_after=self.recovery_timeout,
+                    group=group,
+                )
+            circuit.trials += 1
+            generation = circuit.generation
+        self._notify(group, old, CircuitState.HALF_OPEN)
+        return generation
+
+    def after_request(
+            self,
+            group: EndpointGroup = EndpointGroup.DEFAULT,
+            error: BaseException = None,
+            generation: int = None,
+    ):
+        """
+        Records the result of the request allowed by before_request()
+        :param generation: Returned by before_request(), the result is ignored if the state has changed since then
+        """
+        failed = error is not None and self.is_failure(error)
+        # a cancelled request says nothing about the API
+        succeeded = error is None or (isinstance(error, EskizException) and not failed)
+        new, old = None, None
+        with self._lock:
+            circuit = self._circuit(group)
+            if generation is not None and generation != circuit.generation:
+                return
+            if circuit.state == CircuitState.HALF_OPEN:
+                circuit.trials = max(0, circuit.trials - 1)
+                if failed:
+                    new = CircuitState.OPEN
+                elif succeeded:
+                    circuit.successes += 1
+                    if circuit.successes >= self.success_threshold:
+                        new = CircuitState.CLOSED
+            elif circuit.state == CircuitState.CLOSED:
+                if failed:
+                    circuit.failures += 1
+                    if circuit.failures >= self.thresholds.get(group, self.failure_threshold):
+                        new = CircuitState.OPEN
+                elif succeeded:
+                    circuit.failures = 0
+            if new is not None:
+                old = self._set_state(circuit, new)
+        if new is not None:
+            self._notify(group, old, new)
+
+    def reset(self, group: EndpointGroup = None):
+        """Closes the circuit of the group, or all the circuits"""
+        changes = []
+        with self._lock:
+            for circuit_group, circuit in self._circuits.items():
+                if group is None or circuit_group == group:
+                    changes.append((circuit_group, self._set_state(circuit, CircuitState.CLOSED)))
+        for circuit_group, old in changes:
+            self._notify(circuit_group, old, CircuitState.CLOSED)
@@ -0,0 +1,265 @@
+"""
+Columnar container of the large report results.
+
+Each field of UserMessage is kept in its own column instead of one object per message:
+integers in arrays, datetimes as microseconds in arrays, the repeating strings (status, nick)
+as codes of their distinct values. A column falls back to a plain list when the API returns
+a value it can't store, e.g. a string id, so nothing is lost.
+
+    table = eskiz.user_messages_table("2023-01-01 00:00", "2023-01-31 23:59")
+    len(table)
+    table.counts("status")          # {'DELIVRD': 9120, 'EXPIRED': 31}
+    table.column("price")           # [50, 50, ...]
+    table[0]                        # UserMessage
+
+Unknown fields of the API are dropped, use the models if they are needed.
+"""
+from __future__ import annotations
+
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from .types import UserMessage, parse_datetime
+
+__all__ = ['UserMessageTable']
+
+_INT_NULL = -(2 ** 63)
+_BOOL_NULL = -1
+_MICROSECOND = timedelta(microseconds=1)
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_UNSET = object()
+
+CATEGORY_FIELDS = ("nick", "status")
+INT_FIELDS = ("id", "user_id", "dispatch_id", "encoding", "parts_count", "price")
+BOOL_FIELDS = ("is_ad",)
+DATETIME_FIELDS = ("sent_at", "submit_sm_resp_at", "delivery_sm_at", "created_at", "updated_at")
+
+
+class _ListColumn:
+    __slots__ = ("values",)
+
+    def __init__(self, values: list = None):
+        self.values = values if values is not None else []
+
+    def extend(self, values: list) -> _ListColumn:
+        self.values.extend(values)
+        return self
+
+    def __getitem__(self, index: int):
+        return self.values[index]
+
+    def to_list(self) -> list:
+        return list(self.values)
+
+
+class _IntColumn:
+    __slots__ = ("values",)
+
+    typecode = "q"
+    null = _INT_NULL
+
+    def __init__(self):
+        self.values = array(self.typecode)
+
+    def extend(self, values: list) -> Union[_IntColumn, _ListColumn]:
+        null = self.null
+        try:
+            self.values.extend(array(self.typecode, [null if value is None else value for value in values]))
+        except (TypeError, OverflowError):
+            return _ListColumn(self.to_list()).extend(values)
+        return self
+
+    def _value(self, value):
+        return None if value == self.null else value
+
+    def __getitem__(self, index: int):
+        return self._value(self.values[index])
+
+    def to_list(self) -> list:
+        return [self._value(value) for value in self.values]
+
+
+class _BoolColumn(_IntColumn):
+    __slots__ = ()
+
+    typecode = "b"
+    null = _BOOL_NULL
+
+    def _value(self, value):
+        return None if value == self.null else bool(value)
+
+
+class _CategoryColumn:
+    """Codes of the distinct values, for the strings which repeat a lot"""
+
+    __slots__ = ("codes", "values", "index")
+
+    def __init__(self):
+        self.codes = array("I")
+        self.values: list = []
+        self.index: Dict[Any, int] = {}
+
+    def extend(self, values: list) -> Union[_CategoryColumn, _ListColumn]:
+        index = self.index
+        codes = []
+        try:
+            for value in values:
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(self.values)
+                    self.values.append(value)
+                codes.append(code)
+        except TypeError:  # unhashable value
+            return _ListColumn(self.to_list()).extend(values)
+        self.codes.extend(array("I", codes))
+        return self
+
+    def __getitem__(self, index: int):
+        return self.values[self.codes[index]]
+
+    def to_list(self) -> list:
+        values = self.values
+        return [values[code] for code in self.codes]
+
+    def counts(self) -> Dict[Any, int]:
+        values = self.values
+        return {values[code]: count for code, count in Counter(self.codes).items()}
+
+
+class _DateTimeColumn:
+    """Microseconds since the epoch, all values of the column must have the same timezone"""
+
+    __slots__ = ("values", "tz")
+
+    def __init__(self):
+        self.values = array("q")
+        self.tz = _UNSET
+
+    def extend(self, values: list) -> Union[_DateTimeColumn, _ListColumn]:
+        micros = []
+        tz = self.tz
+        # the reports repeat the same seconds a lot, each string is parsed once
+        seen: Dict[str, int] = {}
+        for value in values:
+            if value is None:
+                micros.append(_INT_NULL)
+                continue
+            if value.__class__ is str:
+                micro = seen.get(value)
+                if micro is not None:
+                    micros.append(micro)
+                    continue
+            parsed = parse_datetime(value) if isinstance(value, str) else value
+            if not isinstance(parsed, datetime):
+                break
+            if tz is _UNSET:
+                tz = parsed.tzinfo
+            elif parsed.tzinfo != tz:
+                break
+            epoch = _EPOCH if tz is None else _EPOCH_UTC
+            micro = (parsed - epoch) // _MICROSECOND
+            if value.__class__ is str:
+                seen[value] = micro
+            micros.append(micro)
+        else:
+            self.tz = tz
+            self.values.extend(array("q", micros))
+            return self
+        # the raw values of the rest are kept, like the models return the value they can't parse
+        parsed = self.to_list()
+        parsed.extend(self._value(value, tz) for value in micros)
+        return _ListColumn(parsed).extend(values[len(micros):])
+
+    @staticmethod
+    def _value(value: int, tz) -> Optional[datetime]:
+        if value == _INT_NULL:
+            return None
+        if tz is None or tz is _UNSET:
+            return _EPOCH + timedelta(microseconds=value)
+        return (_EPOCH_UTC + timedelta(microseconds=value)).astimezone(tz)
+
+    def __getitem__(self, index: int):
+        return self._value(self.values[index], self.tz)
+
+    def to_list(self) -> list:
+        tz = self.tz
+        return [self._value(value, tz) for value in self.values]
+
+
+def _new_column(field: str):
+    if field in CATEGORY_FIELDS:
+        return _CategoryColumn()
+    if field in DATETIME_FIELDS:
+        return _DateTimeColumn()
+    if field in BOOL_FIELDS:
+        return _BoolColumn()
+    if field in INT_FIELDS:
+        return _IntColumn()
+    return _ListColumn()
+
+
+class UserMessageTable:
+    """
+    :param items: Message dicts of the API, e.g. data["data"] of the get-user-messages response
+    """
+
+    __slots__ = ("_columns", "_length")
+
+    fields = UserMessage._fields
+
+    def __init__(self, items: Iterable[dict] = ()):
+        self._columns = {field: _new_column(field) for field in self.fields}
+        self._length = 0
+        self.extend(items)
+
+    def extend(self, items: Iterable[dict]):
+        """Adds the messages column by column"""
+        if not isinstance(items, list):
+            items = list(items)
+        if not items:
+            return
+        columns = self._columns
+        for field in self.fields:
+            columns[field] = columns[field].extend([item.get(field) for item in items])
+        self._length += len(items)
+
+    def append(self, item: dict):
+        self.extend([item])
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return f"UserMessageTable({self._length} messages)"
+
+    def row(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("UserMessageTable index out of range")
+        return {field: column[index] for field, column in self._columns.items()}
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[UserMessage, List[UserMessage]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        return UserMessage.from_dict(self.row(index))
+
+    def __iter__(self) -> Iterator[UserMessage]:
+        columns = [self._columns[field].to_list() for field in self.fields]
+        fields = self.fields
+        for values in zip(*columns):
+            yield UserMessage.from_dict(dict(zip(fields, values)))
+
+    def column(self, field: str) -> list:
+        """Values of the field, raises KeyError if there is no such field"""
+        return self._columns[field].to_list()
+
+    def counts(self, field: str) -> Dict[Any, int]:
+        """Number of the messages per value of the field, e.g. counts("status")"""
+        column = self._columns[field]
+        if isinstance(column, _CategoryColumn):
+            return column.counts()
+        return dict(Counter(column.to_list()))
@@ -0,0 +1,135 @@
+"""
+Adaptive limit of the async requests in flight (additive increase, multiplicative decrease).
+
+    limiter = AIMDLimiter(initial=10, max_limit=200)
+    eskiz = EskizSMS('email', 'password', concurrency_limiter=limiter)  # async client
+
+    async for result in eskiz.send_bulk(messages, concurrency=500):
+        ...
+    print(limiter.limit)
+
+The limit grows by about one request per round trip while the responses are fast and successful,
+and is cut by `decrease` on 429, 5xx and timeouts. Requests over the limit wait in the order of arrival.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from .exceptions import RequestTimeout, ServerError, TooManyRequests
+from .logging import logger
+
+__all__ = ['AIMDLimiter', 'is_overload']
+
+
+def is_overload(error: Optional[BaseException]) -> bool:
+    """Errors which mean the API is overloaded, so the limit is decreased"""
+    return isinstance(error, (TooManyRequests, ServerError, RequestTimeout))
+
+
+class AIMDLimiter:
+    """Must be used from one event loop, can be shared between the instances using it"""
+
+    __slots__ = (
+        "min_limit",
+        "max_limit",
+        "increase",
+        "decrease",
+        "latency_threshold",
+        "in_flight",
+        "_limit",
+        "_waiters",
+        "_decreased_at",
+    )
+
+    def __init__(
+            self,
+            initial: float = 10,
+            min_limit: float = 1,
+            max_limit: float = 500,
+            increase: float = 1.0,
+            decrease: float = 0.5,
+            latency_threshold: float = None,
+    ):
+        """
+        :param initial: Limit at the start
+        :param min_limit: The limit isn't decreased below it
+        :param max_limit: The limit isn't increased above it
+        :param increase: Increase of the limit per round trip of successful requests
+        :param decrease: Multiplier of the limit on overload, e.g. 0.5 halves it
+        :param latency_threshold: Seconds, slower responses don't increase the limit
+        """
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError("1 <= min_limit <= initial <= max_limit is required")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_threshold = latency_threshold
+        self.in_flight = 0
+        self._limit = float(initial)
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._decreased_at = 0.0
+
+    @property
+    def limit(self) -> int:
+        """Current max number of the requests in flight"""
+        return int(self._limit)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """Waits for a free place, returns the start time to be passed to release()"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the place was given, but the waiter is gone
+                self.in_flight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    # already dropped by _wake()
+                    pass
+            raise
+        return time.monotonic()
+
+    def release(self, started_at: float, error: BaseException = None):
+        """
+        :param started_at: Value returned by acquire()
+        :param error: Exception of the request, None if it succeeded
+        """
+        self.in_flight -= 1
+        if is_overload(error):
+            # requests started before the last decrease saw the old limit, one decrease per congestion
+            if started_at >= self._decreased_at:
+                self._limit = max(self.min_limit, self._limit * self.decrease)
+                self._decreased_at = time.monotonic()
+                logger.debug("Eskiz concurrency limit decreased to %s: %r", self.limit, error)
+        elif error is None:
+            latency = time.monotonic() - started_at
+            # the limit is grown only when it's actually used
+            saturated = bool(self._waiters) or self.in_flight + 1 >= self.limit
+            if saturated and (self.latency_threshold is None or latency <= self.latency_threshold):
+                self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
@@ -8,3 +8,25 @@ class Status(str, Enum):
 class Message(str, Enum):
     EXPIRED_TOKEN = "Expired token"
     INVALID_CREDENTIALS = "Неверный Email или пароль"
+
+
+class EndpointGroup(str, Enum):
+    SEND = "send"
+    BATCH = "batch"
+    REPORTING = "reporting"
+    CONTACTS = "contacts"
+    DEFAULT = "default"
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class HookEvent(str, Enum):
+    BEFORE_REQUEST = "before_request"
+    AFTER_RESPONSE = "after_response"
+    RETRY = "retry"
+    TOKEN_REFRESH = "token_refresh"
+    ERROR = "error"
@@ -1,15 +1,40 @@
-from typing import Optional, List
+from datetime import timedelta
+from typing import Callable, Iterable, Iterator, Optional, List, Union
 
 from .base import EskizSMSBase
+from .bulk import BatchResult, DEFAULT_CHUNK_SIZE, DEFAULT_MAX_PAYLOAD_BYTES, send_batch_chunked
+from .columns import UserMessageTable
 from .exceptions import ContactNotFound
-from .types import User, Contact, Response, ContactCreated
+from .jsonlib import RawResponse
+from .reports import DateLike, iter_user_messages, user_messages_table
+from .types import User, Contact, Response, ContactCreated, UserMessage
 
 
 class EskizSMS(EskizSMSBase):
+    def close(self):
+        """Closes the connection pool, if it was created by the instance"""
+        if self._owns_http_client:
+            self._http_client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     @property
     def user(self) -> Optional[User]:
-        self._user = self._user_data()
-        return self._user
+        user = self._cached_user()
+        if user is None:
+            user = self._cache_user(self._user_data())
+        return user
+
+    def _get_user_id(self, user_id: int = None) -> int:
+        if user_id is not None:
+            return user_id
+        if self.user_id is not None:
+            return self.user_id
+        return self.user.id
 
     def _user_data(self) -> Optional[User]:
         response = self._request.get("/auth/user")
@@ -50,8 +75,7 @@ class EskizSMS(EskizSMSBase):
         return Response(**response)
 
     def send_sms(self, mobile_phone: str, message: str, from_whom: str = '4546',
-                 callback_url: str = None) -> Response:
-
+                 callback_url: str = None, user_sms_id: str = None, idempotency_key: str = None) -> Response:
         payload = {
             "mobile_phone": str(mobile_phone),
             "message": message,
@@ -60,7 +84,19 @@ class EskizSMS(EskizSMSBase):
         callback_url = self._get_callback_url(callback_url)
         if callback_url:
             payload['callback_url'] = callback_url
-        return Response(**self._request.post("/message/sms/send", payload=payload))
+        if user_sms_id is not None:
+            payload['user_sms_id'] = user_sms_id
+
+        key = self._idempotency_key(idempotency_key if idempotency_key is not None else user_sms_id)
+        sent = self._claim_key(key)
+        if sent is not None:
+            return sent
+        try:
+            response = self._request.post("/message/sms/send", payload=payload)
+        except BaseException as e:
+            self._release_key(key, e)
+            raise
+        return self._remember_response(key, Response(**response))
 
     def send_global_sms(self, mobile_phone: str, message: str, country_code: str,
                         callback_url: str = None, unicode: str = "0") -> Response:
@@ -75,45 +111,104 @@ class EskizSMS(EskizSMSBase):
             payload['callback_url'] = callback_url
         return Response(**self._request.post("/message/sms/send-global", payload=payload))
 
-    def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int) -> Response:
-        return Response(**self._request.post(
-            "/message/sms/send-batch",
-            payload={
-                "messages": [
-                    {
-                        "user_sms_id": message["user_sms_id"],
-                        "to": str(message["to"]),
-                        "text": message["text"]
-                    } for message in messages
-                ],
-                "from_whom": from_whom,
-                "dispatch_id": dispatch_id
-            }))
-
-    def get_user_messages(self, from_date: str, to_date: str) -> Response:
-        return Response(**self._request.get(
+    def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int,
+                   idempotency_key: str = None) -> Response:
+        key = self._batch_idempotency_key(idempotency_key, dispatch_id, messages)
+        sent = self._claim_key(key)
+        if sent is not None:
+            return sent
+        try:
+            response = self._request.post(
+                "/message/sms/send-batch",
+                payload={
+                    "messages": [
+                        {
+                            "user_sms_id": message["user_sms_id"],
+                            "to": str(message["to"]),
+                            "text": message["text"]
+                        } for message in messages
+                    ],
+                    "from_whom": from_whom,
+                    "dispatch_id": dispatch_id
+                })
+        except BaseException as e:
+            self._release_key(key, e)
+            raise
+        return self._remember_response(key, Response(**response))
+
+    def send_batch_chunked(
+            self,
+            messages: Iterable[dict],
+            *,
+            dispatch_id: Union[int, Callable[[int], int]],
+            from_whom: str = "4546",
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_payload_bytes: int = DEFAULT_MAX_PAYLOAD_BYTES,
+            parallelism: int = 4,
+    ) -> BatchResult:
+        return send_batch_chunked(
+            self,
+            messages,
+            dispatch_id=dispatch_id,
+            from_whom=from_whom,
+            chunk_size=chunk_size,
+            max_payload_bytes=max_payload_bytes,
+            parallelism=parallelism,
+        )
+
+    def get_user_messages(self, from_date: str, to_date: str, user_id: int = None,
+                          raw: bool = False) -> Union[Response, RawResponse]:
+        response = self._request.get(
             "/message/sms/get-user-messages",
             payload={
                 "from_date": from_date,
                 "to_date": to_date,
-                "user_id": self.user.id
-            }
-        ))
-
-    def get_user_messages_by_dispatch(self, dispatch_id: int) -> Response:
-        return Response(**self._request.get(
+                "user_id": self._get_user_id(user_id)
+            },
+            raw=raw,
+        )
+        return response if raw else Response(**response)
+
+    def iter_user_messages(
+            self,
+            from_date: DateLike,
+            to_date: DateLike,
+            *,
+            user_id: int = None,
+            window: timedelta = None,
+            prefetch: bool = False,
+    ) -> Iterator[UserMessage]:
+        return iter_user_messages(self, from_date, to_date, user_id=user_id, window=window, prefetch=prefetch)
+
+    def user_messages_table(
+            self,
+            from_date: DateLike,
+            to_date: DateLike,
+            *,
+            user_id: int = None,
+            window: timedelta = None,
+            prefetch: bool = False,
+    ) -> UserMessageTable:
+        return user_messages_table(self, from_date, to_date, user_id=user_id, window=window, prefetch=prefetch)
+
+    def get_user_messages_by_dispatch(self, dispatch_id: int, user_id: int = None,
+                                      raw: bool = False) -> Union[Response, RawResponse]:
+        response = self._request.get(
             "/message/sms/get-user-messages-by-dispatch",
             payload={
                 "dispatch_id": dispatch_id,
-                "user_id": self.user.id
-            }))
+                "user_id": self._get_user_id(user_id)
+            },
+            raw=raw,
+        )
+        return response if raw else Response(**response)
 
-    def get_dispatch_status(self, dispatch_id: int) -> Response:
+    def get_dispatch_status(self, dispatch_id: int, user_id: int = None) -> Response:
         return Response(**self._request.get(
             "/message/sms/get-dispatch-status",
             payload={
                 "dispatch_id": dispatch_id,
-                "user_id": self.user.id
+                "user_id": self._get_user_id(user_id)
             }))
 
     def create_template(self, name: str, text: str) -> Response:
@@ -139,12 +234,12 @@ class EskizSMS(EskizSMSBase):
     def get_templates(self) -> Response:
         return Response(**self._request.get("/template"))
 
-    def totals(self, year: int) -> Response:
+    def totals(self, year: int, user_id: int = None) -> Response:
         return Response(**self._request.post(
             "/user/totals",
             payload={
                 "year": year,
-                "user_id": self.user.id
+                "user_id": self._get_user_id(user_id)
             }))
 
     def get_limit(self) -> Response:
@@ -2,6 +2,7 @@ class EskizException(Exception):
     def __init__(self, message=None, status=None, status_code: int = None):
         self.status = status
         self.message = message
+        self.status_code = status_code
         message = str(message) if message else ''
         if status:
             message += f"; status={status}"
@@ -36,3 +37,46 @@ class ContactNotFound(EskizException):
 
 class HTTPError(EskizException):
     pass
+
+
+class TooManyRequests(BadRequest):
+    def __init__(self, message=None, status=None, status_code: int = None, retry_after: float = None):
+        super().__init__(message, status, status_code)
+        self.retry_after = retry_after
+
+
+class ServerError(BadRequest):
+    pass
+
+
+class ConnectError(HTTPError):
+    """The request wasn't sent, it's safe to retry"""
+
+
+class RequestTimeout(HTTPError):
+    """The request was sent, but the response wasn't received in time"""
+
+
+class NoAvailableAccount(EskizException):
+    """All the accounts of the pool are disabled or cooling down"""
+
+
+class ServiceUnavailable(EskizException):
+    """The circuit breaker is open, the request wasn't sent"""
+
+    def __init__(self, message=None, status=None, status_code: int = None, retry_after: float = None, group=None):
+        super().__init__(message, status, status_code)
+        self.retry_after = retry_after
+        self.group = group
+
+
+class TemplateError(EskizException):
+    """The values don't match the placeholders of the template"""
+
+
+class IdempotencyConflict(EskizException):
+    """The send with the same idempotency key is in flight or its outcome is unknown, it wasn't sent again"""
+
+    def __init__(self, message=None, status=None, status_code: int = None, key: str = None):
+        super().__init__(message, status, status_code)
+        self.key = key
@@ -0,0 +1,149 @@
+"""
+Instrumentation hooks of the API calls.
+
+    hooks = Hooks()
+    hooks.add(HookEvent.AFTER_RESPONSE, lambda event: print(event.endpoint, event.status_code, event.duration))
+    eskiz = EskizSMS('email', 'password', hooks=hooks)
+
+Events:
+    before_request  - the request is about to be sent
+    after_response  - the response is received, with the status code, durations and sizes
+    error           - the request failed: connection error, timeout, error response or open circuit
+    retry           - the request is retried after `delay` seconds because of `error`
+    token_refresh   - a new token was requested, `error` is set if the login failed
+
+The same Event instance is passed to before_request and then to after_response or error.
+Listeners are called synchronously in the requesting thread (or event loop), they must be fast.
+When no listeners are added the requests skip the instrumentation.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .enums import EndpointGroup, HookEvent
+from .logging import logger
+
+__all__ = ['Event', 'Hooks', 'Listener']
+
+
+class Event:
+    """
+    :ivar type: HookEvent
+    :ivar method: HTTP method
+    :ivar endpoint: Path of the request, e.g. /message/sms/send
+    :ivar group: EndpointGroup of the endpoint
+    :ivar status_code: Status code of the response, None if there is no response
+    :ivar attempt: Number of the attempt, starts from 0, set for retry events
+    :ivar delay: Seconds before the retry
+    :ivar connect_time: Seconds to open the connection, None if a pooled connection was used
+    :ivar ttfb: Seconds until the response headers were received
+    :ivar duration: Seconds of the whole request
+    :ivar request_size: Bytes of the request body
+    :ivar response_size: Bytes of the response body
+    :ivar error: Exception of error, retry and failed token_refresh events
+    """
+
+    __slots__ = (
+        "type", "method", "endpoint", "group", "status_code", "attempt", "delay", "started_at",
+        "connect_time", "ttfb", "duration", "request_size", "response_size", "error", "_connect_started",
+    )
+
+    def __init__(self, type: HookEvent, method: str, endpoint: str, group: EndpointGroup = None):  # noqa
+        self.type = type
+        self.method = method
+        self.endpoint = endpoint
+        self.group = group
+        self.status_code: Optional[int] = None
+        self.attempt: Optional[int] = None
+        self.delay: Optional[float] = None
+        self.started_at = time.monotonic()
+        self.connect_time: Optional[float] = None
+        self.ttfb: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.request_size: Optional[int] = None
+        self.response_size: Optional[int] = None
+        self.error: Optional[BaseException] = None
+        self._connect_started: Optional[float] = None
+
+    def __repr__(self):
+        return (
+            f"Event({self.type.value}, {self.method} {self.endpoint}, status_code={self.status_code}, "
+            f"duration={self.duration}, error={self.error!r})"
+        )
+
+    # httpcore trace extension
+    def trace(self, name: str, info: dict):
+        now = time.monotonic()
+        if name == "connection.connect_tcp.started":
+            self._connect_started = now
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self._connect_started is not None:
+                self.connect_time = now - self._connect_started
+        elif name.endswith(".receive_response_headers.complete"):
+            self.ttfb = now - self.started_at
+
+    async def atrace(self, name: str, info: dict):
+        self.trace(name, info)
+
+    def record(self, response: httpx.Response):
+        """Takes the status and the sizes of the response"""
+        self.status_code = response.status_code
+        self.request_size = len(response.request.content)
+        self.response_size = len(response.content)
+
+    def finish(self, type: HookEvent, error: BaseException = None) -> "Event":  # noqa
+        self.type = type
+        self.duration = time.monotonic() - self.started_at
+        if error is not None:
+            self.error = error
+            if self.status_code is None:
+                self.status_code = getattr(error, "status_code", None)
+        return self
+
+
+Listener = Callable[[Event], None]
+
+
+class Hooks:
+    """Listeners of the events, can be shared between instances"""
+
+    def __init__(self):
+        self._listeners: Dict[HookEvent, Tuple[Listener, ...]] = {}
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self._listeners)
+
+    def add(self, event: HookEvent, listener: Listener):
+        with self._lock:
+            self._listeners[event] = self._listeners.get(event, ()) + (listener,)
+
+    def remove(self, event: HookEvent, listener: Listener):
+        with self._lock:
+            listeners = list(self._listeners.get(event, ()))
+            listeners.remove(listener)
+            if listeners:
+                self._listeners[event] = tuple(listeners)
+            else:
+                del self._listeners[event]
+
+    def on(self, event: HookEvent) -> Callable[[Listener], Listener]:
+        """Decorator of the listener"""
+        def decorator(listener: Listener) -> Listener:
+            self.add(event, listener)
+            return listener
+        return decorator
+
+    def listeners(self, event: HookEvent) -> List[Listener]:
+        return list(self._listeners.get(event, ()))
+
+    def emit(self, event: Event):
+        for listener in self._listeners.get(event.type, ()):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.exception(f"Eskiz hook {event.type.value} failed: {e!r}")
@@ -0,0 +1,321 @@
+"""
+Ledger of the successful sends, repeated submission with the same key returns the original response
+without sending the message again.
+
+    eskiz = EskizSMS('email', 'password', idempotency=MemoryIdempotencyStore(max_size=1_000_000, ttl=86400))
+    eskiz.send_sms('998901234567', 'message', user_sms_id='order-42')
+    eskiz.send_sms('998901234567', 'message', user_sms_id='order-42')  # not sent, same response
+
+The key is `idempotency_key` argument or user_sms_id of send_sms,
+batches are keyed by dispatch_id and user_sms_id's of the messages.
+
+The key is reserved before the send (atomic put-if-absent), so concurrent submissions with the same key
+wait for the first one and get its response. If the API surely rejected the message the reservation is
+released and the message can be sent again. After an ambiguous failure (timeout, 5xx, broken connection)
+the message could have been accepted, so the reservation is kept and the repeated submissions raise
+IdempotencyConflict until the key expires or is discarded.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple, Union
+
+from .exceptions import (
+    ConnectError,
+    EskizException,
+    HTTPError,
+    IdempotencyConflict,
+    ServerError,
+    ServiceUnavailable,
+    TooManyRequests,
+)
+from .types import Response
+
+__all__ = [
+    'IdempotencyStore',
+    'MemoryIdempotencyStore',
+    'SQLiteIdempotencyStore',
+    'batch_key',
+    'is_rejected',
+    'PENDING',
+    'UNKNOWN',
+]
+
+DEFAULT_TTL = 24 * 60 * 60
+# how long a reservation of the send in flight is valid, the outcome is unknown after it
+DEFAULT_PENDING_TIMEOUT = 120.0
+POLL_INTERVAL = 0.05
+
+# states of the reserved keys without the response
+PENDING = "pending"
+UNKNOWN = "unknown"
+# tag of the memory store values with the response
+_SENT = "sent"
+
+State = Union[Response, str, None]
+
+# (id, status, data, message) of the response
+_Entry = Tuple[Optional[str], Optional[str], object, object]
+
+
+def _pack(response: Response) -> _Entry:
+    return response.id, response.status, response.data, response.message
+
+
+def _unpack(entry: _Entry) -> Response:
+    return Response(id=entry[0], status=entry[1], data=entry[2], message=entry[3])
+
+
+def batch_key(dispatch_id: int, user_sms_ids: Iterable[str]) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for user_sms_id in user_sms_ids:
+        digest.update(str(user_sms_id).encode())
+        digest.update(b"\0")
+    return f"batch:{dispatch_id}:{digest.hexdigest()}"
+
+
+def is_rejected(error: BaseException) -> bool:
+    """The API surely didn't accept the message: it wasn't sent or the API answered with an error"""
+    if isinstance(error, (ConnectError, ServiceUnavailable, TooManyRequests)):
+        return True
+    if isinstance(error, (ServerError, HTTPError)):
+        return False
+    return isinstance(error, EskizException)
+
+
+class IdempotencyStore:
+    __slots__ = ()
+
+    def get(self, key: str) -> Optional[Response]:
+        """Response of the successful send"""
+        state = self.state(key)
+        return state if isinstance(state, Response) else None
+
+    def state(self, key: str) -> State:
+        """Response of the successful send, PENDING, UNKNOWN or None if the key is free"""
+        raise NotImplementedError
+
+    def reserve(self, key: str) -> bool:
+        """Reserves the free key for the send, returns False if it's already taken"""
+        raise NotImplementedError
+
+    def put(self, key: str, response: Response):
+        raise NotImplementedError
+
+    def mark_unknown(self, key: str):
+        """The send failed ambiguously, the key stays taken"""
+        raise NotImplementedError
+
+    def discard(self, key: str):
+        raise NotImplementedError
+
+    def _claimed(self, key: str) -> Tuple[bool, Optional[Response]]:
+        """(True, None) if the key was reserved, (True, response) if it was sent, (False, None) to wait"""
+        if self.reserve(key):
+            return True, None
+        state = self.state(key)
+        if isinstance(state, Response):
+            return True, state
+        if state == UNKNOWN:
+            raise IdempotencyConflict("Outcome of the previous send with this key is unknown", key=key)
+        # PENDING is waited for, None means the reservation was just released and is tried again
+        return False, None
+
+    def claim(self, key: str) -> Optional[Response]:
+        """
+        Reserves the key, returns None if the caller must send or the response of the previous send.
+        Waits while the same key is in flight.
+        """
+        while True:
+            done, response = self._claimed(key)
+            if done:
+                return response
+            time.sleep(POLL_INTERVAL)
+
+    async def _call(self, func, *args):
+        """Runs the store call from the event loop, the stores doing IO run it in a thread"""
+        return func(*args)
+
+    async def aclaim(self, key: str) -> Optional[Response]:
+        while True:
+            done, response = await self._call(self._claimed, key)
+            if done:
+                return response
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def finish(self, key: str, error: BaseException = None, response: Response = None):
+        """Saves the response, releases the key if the message was rejected or keeps it as UNKNOWN"""
+        if error is None:
+            self.put(key, response)
+        elif is_rejected(error):
+            self.discard(key)
+        else:
+            self.mark_unknown(key)
+
+    async def afinish(self, key: str, error: BaseException = None, response: Response = None):
+        await self._call(self.finish, key, error, response)
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """
+    LRU with TTL, O(1) lookups. Responses are kept as tuples, not as objects.
+
+    :param pending_timeout: Seconds after which the reservation of the send in flight is considered UNKNOWN
+    """
+
+    __slots__ = ("max_size", "ttl", "pending_timeout", "_entries", "_lock")
+
+    def __init__(self, max_size: int = 100_000, ttl: float = DEFAULT_TTL,
+                 pending_timeout: float = DEFAULT_PENDING_TIMEOUT):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        # the value is tagged: (_SENT, packed response), (PENDING, deadline) or (UNKNOWN, None)
+        self._entries: "OrderedDict[str, Tuple[float, tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _value(self, key: str, now: float) -> Optional[tuple]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def _set(self, key: str, value: tuple):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def state(self, key: str) -> State:
+        now = time.monotonic()
+        with self._lock:
+            value = self._value(key, now)
+        if value is None:
+            return None
+        kind, payload = value
+        if kind == _SENT:
+            return _unpack(payload)
+        if kind == PENDING and payload > now:
+            return PENDING
+        return UNKNOWN
+
+    def reserve(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._value(key, now) is not None:
+                return False
+            self._set(key, (PENDING, now + self.pending_timeout))
+        return True
+
+    def put(self, key: str, response: Response):
+        with self._lock:
+            self._set(key, (_SENT, _pack(response)))
+
+    def mark_unknown(self, key: str):
+        with self._lock:
+            self._set(key, (UNKNOWN, None))
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Keeps the ledger in SQLite, survives restarts and can be shared between processes.
+    The reservations are rows with {"state": ...} instead of the response.
+
+    :param pending_timeout: Seconds after which the reservation of the send in flight is considered UNKNOWN
+    """
+
+    __slots__ = ("path", "ttl", "pending_timeout", "_local", "_executor")
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, pending_timeout: float = DEFAULT_PENDING_TIMEOUT):
+        self.path = path
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self._local = threading.local()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS eskiz_idempotency "
+            "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, response TEXT NOT NULL) WITHOUT ROWID"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    async def _call(self, func, *args):
+        # reserve() may wait for the lock of another process up to the busy timeout,
+        # one dedicated thread keeps the event loop free and opens only one more connection
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="eskiz-idempotency")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def state(self, key: str) -> State:
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT response FROM eskiz_idempotency WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        if isinstance(value, dict):
+            if value["state"] == PENDING and value["until"] > now:
+                return PENDING
+            return UNKNOWN
+        return _unpack(value)
+
+    def _save(self, key: str, value):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO eskiz_idempotency (key, expires_at, response) VALUES (?, ?, ?)",
+            (key, time.time() + self.ttl, json.dumps(value, default=str)),
+        )
+
+    def reserve(self, key: str) -> bool:
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM eskiz_idempotency WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO eskiz_idempotency (key, expires_at, response) VALUES (?, ?, ?)",
+                (key, now + self.ttl, json.dumps({"state": PENDING, "until": now + self.pending_timeout})),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def put(self, key: str, response: Response):
+        self._save(key, _pack(response))
+
+    def mark_unknown(self, key: str):
+        self._save(key, {"state": UNKNOWN})
+
+    def discard(self, key: str):
+        self._connection().execute("DELETE FROM eskiz_idempotency WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        cursor = self._connection().execute("DELETE FROM eskiz_idempotency WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
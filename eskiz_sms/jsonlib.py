@@ -0,0 +1,267 @@
+"""
+JSON backend of the requests and the responses, and lazy parsing of the large responses.
+
+orjson or ujson is used when it's installed, stdlib json otherwise:
+
+    set_json_backend("json")    # force stdlib, or "orjson", "ujson", a JSONBackend, None for the default
+
+Report responses can be taken raw, the body is kept as bytes until it's read:
+
+    raw = eskiz.get_user_messages(from_date, to_date, raw=True)
+    raw.content                           # the body bytes
+    raw.get("data", "last_page")          # one value, no object tree of the whole body is built
+    for item in raw.iter_items("data", "data"):
+        ...                               # items of the array decoded one by one
+
+The lazy parsing scans the body bytes to skip the values before the requested one, so the memory
+is bounded by the body and one item. It uses more CPU than a full decode by orjson, so use it
+for the large reports.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable, Iterator, Optional, Tuple, Union
+
+__all__ = [
+    'JSONBackend',
+    'RawResponse',
+    'available_backends',
+    'get_json_backend',
+    'set_json_backend',
+    'dumps',
+    'loads',
+]
+
+BACKENDS = ("orjson", "ujson", "json")
+
+
+class JSONBackend:
+    """
+    :param name: Name of the backend
+    :param dumps: Serializes the object to UTF-8 bytes
+    :param loads: Deserializes bytes or str
+    """
+
+    __slots__ = ("name", "dumps", "loads")
+
+    def __init__(self, name: str, dumps: Callable[[Any], bytes], loads: Callable[[Union[bytes, str]], Any]):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return f"JSONBackend({self.name!r})"
+
+
+def _stdlib() -> JSONBackend:
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    return JSONBackend("json", lambda obj: encoder.encode(obj).encode(), json.loads)
+
+
+def _load_backend(name: str) -> Optional[JSONBackend]:
+    if name == "json":
+        return _stdlib()
+    if name == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            return None
+        return JSONBackend("orjson", orjson.dumps, orjson.loads)
+    if name == "ujson":
+        try:
+            import ujson
+        except ImportError:
+            return None
+        return JSONBackend("ujson", lambda obj: ujson.dumps(obj, ensure_ascii=False).encode(), ujson.loads)
+    raise ValueError(f"Unknown JSON backend {name!r}, use one of {', '.join(BACKENDS)}")
+
+
+def available_backends() -> Tuple[str, ...]:
+    return tuple(name for name in BACKENDS if _load_backend(name) is not None)
+
+
+def _default_backend() -> JSONBackend:
+    for name in BACKENDS:
+        backend = _load_backend(name)
+        if backend is not None:
+            return backend
+    raise RuntimeError("unreachable")  # pragma: no cover
+
+
+_backend = _default_backend()
+
+
+def get_json_backend() -> JSONBackend:
+    return _backend
+
+
+def set_json_backend(backend: Union[str, JSONBackend, None] = None) -> JSONBackend:
+    """Sets the process-wide backend, None restores the default one"""
+    global _backend
+    if backend is None:
+        backend = _default_backend()
+    elif isinstance(backend, str):
+        name = backend
+        backend = _load_backend(name)
+        if backend is None:
+            raise ImportError(f"JSON backend {name!r} isn't installed")
+    _backend = backend
+    return backend
+
+
+def dumps(obj: Any) -> bytes:
+    return _backend.dumps(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Raises ValueError if the data isn't valid JSON"""
+    return _backend.loads(data)
+
+
+# ===== lazy parsing ===== #
+# the body is scanned as bytes, only the strings and the brackets are matched to skip a value,
+# the skipped values aren't decoded nor validated
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_NEXT_ELEMENT = re.compile(rb"[ \t\n\r]*(?:(,)[ \t\n\r]*|\])")
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(rb"[^\s,:\]}]+")
+# strings and everything but the brackets, up to the next bracket
+_FILLER = re.compile(rb'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_QUOTE, _COLON, _COMMA = ord('"'), ord(":"), ord(",")
+_ARRAY_START, _ARRAY_END, _OBJECT_START, _OBJECT_END = ord("["), ord("]"), ord("{"), ord("}")
+_OPEN = (_ARRAY_START, _OBJECT_START)
+
+
+def _skip_ws(data: bytes, i: int) -> int:
+    return _WHITESPACE.match(data, i).end()
+
+
+def _expect(data: bytes, i: int, char: int):
+    if i >= len(data) or data[i] != char:
+        raise ValueError(f"Expected {chr(char)!r} at {i}")
+
+
+def _string_end(data: bytes, i: int) -> int:
+    match = _STRING.match(data, i)
+    if match is None:
+        raise ValueError(f"Expected a string at {i}")
+    return match.end()
+
+
+def _skip(data: bytes, i: int) -> int:
+    """End of the value at i"""
+    if i >= len(data):
+        raise ValueError(f"Expected a value at {i}")
+    char = data[i]
+    if char == _QUOTE:
+        return _string_end(data, i)
+    if char not in _OPEN:
+        match = _SCALAR.match(data, i)
+        if match is None:
+            raise ValueError(f"Expected a value at {i}")
+        return match.end()
+    depth = 1
+    size = len(data)
+    i += 1
+    while True:
+        i = _FILLER.match(data, i).end()
+        if i >= size or data[i] == _QUOTE:
+            raise ValueError("Unterminated array or object")
+        if data[i] in _OPEN:
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+
+
+def _member(data: bytes, i: int, key: str) -> int:
+    """Position of the value of the key in the object at i, raises KeyError if there is no such key"""
+    if data[i] != _OBJECT_START:
+        raise KeyError(key)
+    i = _skip_ws(data, i + 1)
+    if data[i] == _OBJECT_END:
+        raise KeyError(key)
+    while True:
+        end = _string_end(data, i)
+        name = loads(data[i:end])
+        i = _skip_ws(data, end)
+        _expect(data, i, _COLON)
+        i = _skip_ws(data, i + 1)
+        if name == key:
+            return i
+        i = _skip_ws(data, _skip(data, i))
+        if data[i] == _OBJECT_END:
+            raise KeyError(key)
+        _expect(data, i, _COMMA)
+        i = _skip_ws(data, i + 1)
+
+
+def _elements(data: bytes, i: int) -> Iterator[Tuple[int, int]]:
+    """Yields the start and the end of the elements of the array at i"""
+    _expect(data, i, _ARRAY_START)
+    i = _skip_ws(data, i + 1)
+    if data[i] == _ARRAY_END:
+        return
+    while True:
+        end = _skip(data, i)
+        yield i, end
+        match = _NEXT_ELEMENT.match(data, end)
+        if match is None:
+            raise ValueError(f"Expected ',' or ']' at {_skip_ws(data, end)}")
+        if match.group(1) is None:
+            return
+        i = match.end()
+
+
+def _find(data: bytes, path: Tuple[str, ...]) -> int:
+    """Position of the value at the path of the keys, raises KeyError if there is no such value"""
+    i = _skip_ws(data, 0)
+    for key in path:
+        i = _member(data, i, key)
+    return i
+
+
+class RawResponse:
+    """Body of the successful response, decoded only when it's read"""
+
+    __slots__ = ("content",)
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def __repr__(self):
+        return f"RawResponse({len(self.content)} bytes)"
+
+    def __len__(self):
+        return len(self.content)
+
+    def json(self) -> Any:
+        """The whole body decoded by the JSON backend"""
+        return loads(self.content)
+
+    def get(self, *path: str, default: Any = None) -> Any:
+        """
+        Value at the path of the keys, e.g. get("data", "last_page").
+        The values before it are skipped by scanning the bytes, only the value itself is decoded
+        """
+        data = self.content
+        try:
+            i = _find(data, path)
+        except KeyError:
+            return default
+        return loads(data[i:_skip(data, i)])
+
+    def iter_items(self, *path: str) -> Iterator[Any]:
+        """Decodes the items of the array at the path one by one, nothing is yielded if there is no array"""
+        data = self.content
+        try:
+            i = _find(data, path)
+        except KeyError:
+            return
+        if data[i] != _ARRAY_START:
+            return
+        for start, end in _elements(data, i):
+            yield loads(data[start:end])
@@ -0,0 +1,215 @@
+"""
+In-process metrics of the API calls collected from the hooks, exported as Prometheus text.
+
+    metrics = MetricsCollector()
+    eskiz = EskizSMS('email', 'password', hooks=metrics.hooks)
+    ...
+    print(metrics.to_prometheus())
+
+Metrics:
+    eskiz_requests_total{method,endpoint,status}       responses by status code
+    eskiz_request_errors_total{method,endpoint,error}  failed requests by exception name
+    eskiz_retries_total{method,endpoint}               retried requests
+    eskiz_token_refreshes_total{result}                logins, result is "success" or "error"
+    eskiz_request_duration_seconds{method,endpoint}    histogram of the request durations
+    eskiz_request_ttfb_seconds{method,endpoint}        histogram of the time to the response headers
+    eskiz_request_bytes_total{method,endpoint}         sent body bytes
+    eskiz_response_bytes_total{method,endpoint}        received body bytes
+
+Ids in the paths are replaced with {id}, e.g. /template/{id}, to keep the number of the series bounded.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .enums import HookEvent
+from .hooks import Event, Hooks
+
+__all__ = ['MetricsCollector', 'Histogram', 'DEFAULT_BUCKETS', 'endpoint_label']
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+ID_RE = re.compile(r"/\d+(?=/|$)")
+
+Labels = Tuple[str, ...]
+
+
+def endpoint_label(endpoint: str) -> str:
+    return ID_RE.sub("/{id}", endpoint)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Histogram:
+    """Counts of the observed values by bucket, not thread-safe by itself"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # the last count is +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((_format_value(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+
+
+class MetricsCollector:
+    """Counters and latency histograms of the requests, thread-safe"""
+
+    def __init__(self, hooks: Hooks = None, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, namespace: str = "eskiz"):
+        """
+        :param hooks: Hooks to collect the events from, new Hooks are created by default
+        :param buckets: Upper bounds of the latency histogram buckets in seconds
+        :param namespace: Prefix of the metric names
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._requests: Dict[Labels, int] = defaultdict(int)
+        self._errors: Dict[Labels, int] = defaultdict(int)
+        self._retries: Dict[Labels, int] = defaultdict(int)
+        self._token_refreshes: Dict[Labels, int] = defaultdict(int)
+        self._request_bytes: Dict[Labels, int] = defaultdict(int)
+        self._response_bytes: Dict[Labels, int] = defaultdict(int)
+        self._durations: Dict[Labels, Histogram] = {}
+        self._ttfb: Dict[Labels, Histogram] = {}
+        self._lock = threading.Lock()
+        self.hooks = hooks if hooks is not None else Hooks()
+        self.attach(self.hooks)
+
+    def attach(self, hooks: Hooks):
+        hooks.add(HookEvent.AFTER_RESPONSE, self._on_response)
+        hooks.add(HookEvent.ERROR, self._on_error)
+        hooks.add(HookEvent.RETRY, self._on_retry)
+        hooks.add(HookEvent.TOKEN_REFRESH, self._on_token_refresh)
+
+    def detach(self, hooks: Hooks):
+        hooks.remove(HookEvent.AFTER_RESPONSE, self._on_response)
+        hooks.remove(HookEvent.ERROR, self._on_error)
+        hooks.remove(HookEvent.RETRY, self._on_retry)
+        hooks.remove(HookEvent.TOKEN_REFRESH, self._on_token_refresh)
+
+    def reset(self):
+        with self._lock:
+            for metric in (self._requests, self._errors, self._retries, self._token_refreshes,
+                           self._request_bytes, self._response_bytes, self._durations, self._ttfb):
+                metric.clear()
+
+    def _observe(self, histograms: Dict[Labels, Histogram], labels: Labels, value: Optional[float]):
+        if value is None:
+            return
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def _record(self, event: Event, labels: Labels):
+        """Must be called with the lock held"""
+        self._observe(self._durations, labels, event.duration)
+        self._observe(self._ttfb, labels, event.ttfb)
+        if event.request_size is not None:
+            self._request_bytes[labels] += event.request_size
+        if event.response_size is not None:
+            self._response_bytes[labels] += event.response_size
+
+    def _on_response(self, event: Event):
+        labels = (event.method, endpoint_label(event.endpoint))
+        with self._lock:
+            self._requests[labels + (str(event.status_code),)] += 1
+            self._record(event, labels)
+
+    def _on_error(self, event: Event):
+        labels = (event.method, endpoint_label(event.endpoint))
+        with self._lock:
+            if event.status_code is not None:
+                self._requests[labels + (str(event.status_code),)] += 1
+            self._errors[labels + (type(event.error).__name__,)] += 1
+            self._record(event, labels)
+
+    def _on_retry(self, event: Event):
+        with self._lock:
+            self._retries[(event.method, endpoint_label(event.endpoint))] += 1
+
+    def _on_token_refresh(self, event: Event):
+        with self._lock:
+            self._token_refreshes[("error" if event.error is not None else "success",)] += 1
+
+    def counter(self, name: str) -> Dict[Labels, int]:
+        """Copy of the counter: requests, errors, retries, token_refreshes, request_bytes or response_bytes"""
+        with self._lock:
+            return dict(getattr(self, f"_{name}"))
+
+    def histogram(self, name: str) -> Dict[Labels, Histogram]:
+        """Histograms by labels: durations or ttfb. They are live objects, don't modify them"""
+        with self._lock:
+            return dict(getattr(self, f"_{name}"))
+
+    def _counter_lines(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                       values: Dict[Labels, int]) -> List[str]:
+        name = f"{self.namespace}_{name}"
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{name}{_format_labels(label_names, labels)} {value}")
+        return lines
+
+    def _histogram_lines(self, name: str, help_text: str, values: Dict[Labels, Histogram]) -> List[str]:
+        name = f"{self.namespace}_{name}"
+        label_names = ("method", "endpoint")
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels, histogram in sorted(values.items()):
+            for bound, count in histogram.cumulative():
+                lines.append(f"{name}_bucket{_format_labels(label_names + ('le',), labels + (bound,))} {count}")
+            lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_value(histogram.sum)}")
+            lines.append(f"{name}_count{_format_labels(label_names, labels)} {histogram.count}")
+        return lines
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        endpoint = ("method", "endpoint")
+        with self._lock:
+            lines = [
+                *self._counter_lines("requests_total", "Eskiz API responses by status code.",
+                                     endpoint + ("status",), self._requests),
+                *self._counter_lines("request_errors_total", "Failed Eskiz API requests.",
+                                     endpoint + ("error",), self._errors),
+                *self._counter_lines("retries_total", "Retried Eskiz API requests.", endpoint, self._retries),
+                *self._counter_lines("token_refreshes_total", "Eskiz logins.", ("result",), self._token_refreshes),
+                *self._counter_lines("request_bytes_total", "Sent request body bytes.",
+                                     endpoint, self._request_bytes),
+                *self._counter_lines("response_bytes_total", "Received response body bytes.",
+                                     endpoint, self._response_bytes),
+                *self._histogram_lines("request_duration_seconds", "Duration of the Eskiz API requests.",
+                                       self._durations),
+                *self._histogram_lines("request_ttfb_seconds", "Time to the response headers.", self._ttfb),
+            ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,426 @@
+"""
+Offline stand-in for notify.eskiz.uz, for tests and benchmarks.
+
+    server = MockEskizServer(latency=0.05, error_rate=0.01, throttle_rate=0.01)
+    eskiz = server.client()        # EskizSMS sending the requests to the server
+    eskiz = server.async_client()  # async EskizSMS
+
+    eskiz.send_sms('998901234567', 'message')
+    server.stats  # {'/auth/login': 1, '/message/sms/send': 1}
+    server.calls  # [('POST', '/auth/login'), ('POST', '/message/sms/send')]
+
+The server runs in-process as httpx transport (httpx.MockTransport), there is no socket.
+Latency is slept by the transport: time.sleep for the sync clients and asyncio.sleep for the async ones.
+
+Besides the random error injection, the tests can script the answers:
+`errors` are returned (or raised) instead of the next requests, `rejected_phones` and `rejected_dispatches`
+are answered with 400, `dispatch_statuses` replace the statuses computed from the messages.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import itertools
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs
+
+import httpx
+
+from .enums import Message, Status
+
+__all__ = ['MockEskizServer']
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _jwt(subject: int, exp: Optional[float], iat: float) -> str:
+    def encode(data: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    claims: Dict[str, Any] = {"sub": subject, "jti": uuid.uuid4().hex, "iat": int(iat)}
+    if exp is not None:
+        claims["exp"] = int(exp)
+    return f"{encode({'typ': 'JWT', 'alg': 'HS256'})}.{encode(claims)}.mock"
+
+
+def _response(status_code: int, data: Any, headers: Dict[str, str] = None) -> httpx.Response:
+    return httpx.Response(status_code, content=json.dumps(data).encode(), headers={**_JSON_HEADERS, **(headers or {})})
+
+
+def _path(request: httpx.Request) -> str:
+    path = request.url.path
+    return path[len("/api"):] if path.startswith("/api") else path
+
+
+def _form(request: httpx.Request) -> Dict[str, Any]:
+    content = request.content
+    if not content:
+        return {}
+    if request.headers.get("Content-Type", "").startswith("application/json"):
+        return json.loads(content)
+    data: Dict[str, Any] = {}
+    for key, values in parse_qs(content.decode()).items():
+        data[key] = values if key == "messages" else values[0]
+    return data
+
+
+class MockEskizServer:
+    """
+    :param email: Accepted email, any is accepted when None
+    :param password: Accepted password, any is accepted when None
+    :param latency: Seconds added to every response
+    :param jitter: Random seconds between 0 and jitter added to the latency
+    :param error_rate: Share of the requests answered with 500
+    :param throttle_rate: Share of the requests answered with 429
+    :param token_invalid_rate: Share of the requests answered with 401 token-invalid, the token is revoked
+    :param retry_after: Retry-After header of 429 responses
+    :param token_ttl: Seconds until the issued tokens expire, None means never
+    :param balance: Balance of the account, decreased by the sent messages
+    :param per_page: Page size of get-user-messages
+    :param keep_messages: Keep the sent messages for the reports and the requests for `calls`/`payloads`,
+        disable it for long benchmarks
+    :param seed: Seed of the error injection, for reproducible runs
+    """
+
+    def __init__(
+            self,
+            email: str = None,
+            password: str = None,
+            *,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            throttle_rate: float = 0.0,
+            token_invalid_rate: float = 0.0,
+            retry_after: float = 1,
+            token_ttl: float = None,
+            balance: int = 1_000_000,
+            per_page: int = 100,
+            keep_messages: bool = True,
+            seed: int = None,
+    ):
+        self.email = email
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.token_invalid_rate = token_invalid_rate
+        self.retry_after = retry_after
+        self.token_ttl = token_ttl
+        self.balance = balance
+        self.per_page = per_page
+        self.keep_messages = keep_messages
+        self.stats: Counter = Counter()
+        self.tokens = set()
+        self.last_token: Optional[str] = None
+        self.requests: List[httpx.Request] = []
+        self.messages: List[dict] = []
+        # responses or exceptions returned instead of the next requests, except the logins
+        self.errors: List[Union[httpx.Response, Exception]] = []
+        self.rejected_phones: Set[str] = set()
+        self.rejected_dispatches: Set[int] = set()
+        # dispatch_id -> successive get-dispatch-status data, the last one is repeated
+        self.dispatch_statuses: Dict[int, List[list]] = {}
+        self.templates: Dict[int, dict] = {}
+        self.contacts: Dict[int, dict] = {}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self.user = {
+            "id": 1,
+            "name": "Mock",
+            "email": email or "mock@example.com",
+            "role": "user",
+            "status": "active",
+            "balance": balance,
+        }
+
+    # ===== transports ===== #
+    def _delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency + self._random.uniform(0, self.jitter)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        return self.handle(request)
+
+    async def handle_async(self, request: httpx.Request) -> httpx.Response:
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self.handle(request)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self)
+
+    def async_transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle_async)
+
+    def client(self, **kwargs):
+        """EskizSMS connected to the server, kwargs are passed to EskizSMS"""
+        from .eskiz import EskizSMS
+        return EskizSMS(
+            self.email or "mock@example.com",
+            self.password or "password",
+            http_client=httpx.Client(transport=self.transport()),
+            **kwargs
+        )
+
+    def async_client(self, **kwargs):
+        from .async_ import EskizSMS
+        return EskizSMS(
+            self.email or "mock@example.com",
+            self.password or "password",
+            http_client=httpx.AsyncClient(transport=self.async_transport()),
+            **kwargs
+        )
+
+    # ===== recorded state ===== #
+    @property
+    def calls(self) -> List[Tuple[str, str]]:
+        """(method, path) of the received requests"""
+        return [(request.method, _path(request)) for request in self.requests]
+
+    def payloads(self, path: str) -> List[Dict[str, Any]]:
+        """Decoded bodies of the received requests to the path"""
+        return [_form(request) for request in self.requests if _path(request) == path]
+
+    @property
+    def sent(self) -> List[dict]:
+        """Messages accepted by send_sms, without the batches"""
+        return [message for message in self.messages if message["dispatch_id"] is None]
+
+    def issue_token(self, exp: float = None, iat: float = None) -> str:
+        """Issues the token accepted by the server, `exp` is token_ttl from now by default"""
+        now = time.time()
+        if exp is None and self.token_ttl is not None:
+            exp = now + self.token_ttl
+        token = _jwt(self.user["id"], exp, now if iat is None else iat)
+        self.tokens.add(token)
+        self.last_token = token
+        return token
+
+    # ===== handlers ===== #
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """Answers the request without the latency"""
+        path = _path(request)
+        self.stats[path] += 1
+        if self.keep_messages:
+            self.requests.append(request)
+        if path == "/auth/login":
+            return self._login(request)
+        if self.errors:
+            error = self.errors.pop(0)
+            if isinstance(error, Exception):
+                raise error
+            return error
+
+        token = request.headers.get("Authorization", "")[len("Bearer "):]
+        if token not in self.tokens:
+            return _response(401, {"status": Status.TOKEN_INVALID.value, "message": Message.EXPIRED_TOKEN.value})
+        injected = self._inject(token)
+        if injected is not None:
+            return injected
+
+        handler, args = self._route(request.method, path)
+        if handler is None:
+            return _response(404, {"message": "Not found"})
+        return handler(request, *args)
+
+    def _inject(self, token: str) -> Optional[httpx.Response]:
+        roll = self._random.random()
+        if roll < self.error_rate:
+            self.stats["injected_500"] += 1
+            return _response(500, {"message": "Internal Server Error"})
+        roll -= self.error_rate
+        if roll < self.throttle_rate:
+            self.stats["injected_429"] += 1
+            return _response(429, {"message": "Too Many Attempts."}, {"Retry-After": str(self.retry_after)})
+        roll -= self.throttle_rate
+        if roll < self.token_invalid_rate:
+            self.stats["injected_401"] += 1
+            self.tokens.discard(token)
+            return _response(401, {"status": Status.TOKEN_INVALID.value, "message": Message.EXPIRED_TOKEN.value})
+        return None
+
+    def _route(self, method: str, path: str) -> Tuple[Any, tuple]:
+        routes = {
+            ("GET", "/auth/user"): self._auth_user,
+            ("POST", "/message/sms/send"): self._send,
+            ("POST", "/message/sms/send-global"): self._send,
+            ("POST", "/message/sms/send-batch"): self._send_batch,
+            ("GET", "/message/sms/get-user-messages"): self._user_messages,
+            ("GET", "/message/sms/get-user-messages-by-dispatch"): self._dispatch_messages,
+            ("GET", "/message/sms/get-dispatch-status"): self._dispatch_status,
+            ("POST", "/user/totals"): self._totals,
+            ("GET", "/user/get-limit"): self._limit,
+            ("GET", "/template"): self._templates,
+            ("POST", "/template"): self._create_template,
+            ("POST", "/contact"): self._create_contact,
+        }
+        handler = routes.get((method, path))
+        if handler is not None:
+            return handler, ()
+        collection, _, item_id = path.rpartition("/")
+        if item_id.isdigit():
+            item_routes = {
+                ("GET", "/template"): self._template,
+                ("PUT", "/template"): self._update_template,
+                ("GET", "/contact"): self._contact,
+                ("PUT", "/contact"): self._update_contact,
+                ("DELETE", "/contact"): self._delete_contact,
+            }
+            handler = item_routes.get((method, collection))
+            if handler is not None:
+                return handler, (int(item_id),)
+        return None, ()
+
+    def _login(self, request: httpx.Request) -> httpx.Response:
+        data = _form(request)
+        if (self.email is not None and data.get("email") != self.email) or \
+                (self.password is not None and data.get("password") != self.password):
+            return _response(401, {"message": Message.INVALID_CREDENTIALS.value})
+        token = self.issue_token()
+        return _response(200, {"message": "token_generated", "data": {"token": token}, "token_type": "bearer"})
+
+    def _auth_user(self, request: httpx.Request) -> httpx.Response:
+        return _response(200, {**self.user, "balance": self.balance})
+
+    def _store(self, message: dict):
+        self.balance -= 1
+        if self.keep_messages:
+            self.messages.append(message)
+
+    def _send(self, request: httpx.Request) -> httpx.Response:
+        data = _form(request)
+        if data.get("mobile_phone") in self.rejected_phones:
+            return _response(400, {"status": "error", "message": "Invalid phone number"})
+        message_id = str(next(self._ids))
+        self._store({
+            "id": message_id,
+            "user_sms_id": data.get("user_sms_id"),
+            "to": data.get("mobile_phone"),
+            "message": data.get("message"),
+            "status": "WAITING",
+            "dispatch_id": None,
+        })
+        return _response(200, {"id": message_id, "status": "waiting", "message": "Waiting for SMS provider"})
+
+    def _send_batch(self, request: httpx.Request) -> httpx.Response:
+        data = _form(request)
+        messages = data.get("messages") or []
+        dispatch_id = data.get("dispatch_id")
+        if dispatch_id is not None and int(dispatch_id) in self.rejected_dispatches:
+            return _response(400, {"status": "error", "message": "Invalid dispatch"})
+        batch_id = str(next(self._ids))
+        for message in messages:
+            if not isinstance(message, dict):
+                message = {"raw": message}
+            self._store({
+                "id": str(next(self._ids)),
+                "user_sms_id": message.get("user_sms_id"),
+                "to": message.get("to"),
+                "message": message.get("text"),
+                "status": "WAITING",
+                "dispatch_id": int(dispatch_id) if dispatch_id is not None else None,
+            })
+        return _response(200, {"id": batch_id, "message": "Waiting for SMS provider", "status": ["waiting"]})
+
+    def _page(self, items: List[dict], page: int) -> dict:
+        last_page = max(1, -(-len(items) // self.per_page))
+        return {
+            "current_page": page,
+            "last_page": last_page,
+            "per_page": self.per_page,
+            "total": len(items),
+            "data": items[(page - 1) * self.per_page:page * self.per_page],
+        }
+
+    def _user_messages(self, request: httpx.Request) -> httpx.Response:
+        page = int(_form(request).get("page") or 1)
+        return _response(200, {"status": "success", "data": self._page(self.messages, page)})
+
+    def _dispatch_messages(self, request: httpx.Request) -> httpx.Response:
+        dispatch_id = int(_form(request).get("dispatch_id") or 0)
+        items = [message for message in self.messages if message["dispatch_id"] == dispatch_id]
+        return _response(200, {"status": "success", "data": self._page(items, 1)})
+
+    def _dispatch_status(self, request: httpx.Request) -> httpx.Response:
+        dispatch_id = int(_form(request).get("dispatch_id") or 0)
+        statuses = self.dispatch_statuses.get(dispatch_id)
+        if statuses:
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            return _response(200, {"status": "success", "data": status})
+        totals = Counter(message["status"] for message in self.messages if message["dispatch_id"] == dispatch_id)
+        return _response(200, {
+            "status": "success",
+            "data": [{"status": status, "total": total} for status, total in totals.items()],
+        })
+
+    def _totals(self, request: httpx.Request) -> httpx.Response:
+        return _response(200, {"status": "success", "data": [{"total": len(self.messages)}]})
+
+    def _limit(self, request: httpx.Request) -> httpx.Response:
+        return _response(200, {"status": "success", "data": {"balance": self.balance}})
+
+    def _templates(self, request: httpx.Request) -> httpx.Response:
+        return _response(200, {"status": "success", "data": list(self.templates.values())})
+
+    def _create_template(self, request: httpx.Request) -> httpx.Response:
+        data = _form(request)
+        template_id = next(self._ids)
+        self.templates[template_id] = {
+            "id": template_id, "name": data.get("name"), "text": data.get("text"), "status": "moderation"
+        }
+        return _response(200, {"status": "success", "data": self.templates[template_id]})
+
+    def _template(self, request: httpx.Request, template_id: int) -> httpx.Response:
+        if template_id not in self.templates:
+            return _response(404, {"message": "Template not found"})
+        return _response(200, {"status": "success", "data": self.templates[template_id]})
+
+    def _update_template(self, request: httpx.Request, template_id: int) -> httpx.Response:
+        if template_id not in self.templates:
+            return _response(404, {"message": "Template not found"})
+        data = _form(request)
+        self.templates[template_id].update(name=data.get("name"), text=data.get("text"))
+        return _response(200, {"status": "success", "data": self.templates[template_id]})
+
+    def _create_contact(self, request: httpx.Request) -> httpx.Response:
+        data = _form(request)
+        contact_id = next(self._ids)
+        self.contacts[contact_id] = {
+            "id": contact_id,
+            "user_id": self.user["id"],
+            "group": data.get("group"),
+            "name": data.get("name"),
+            "email": data.get("email"),
+            "mobile_phone": data.get("mobile_phone"),
+            "created_at": None,
+            "updated_at": None,
+        }
+        return _response(200, {"status": "success", "data": {"contact_id": contact_id}})
+
+    def _contact(self, request: httpx.Request, contact_id: int) -> httpx.Response:
+        contact = self.contacts.get(contact_id)
+        return _response(200, [contact] if contact else [])
+
+    def _update_contact(self, request: httpx.Request, contact_id: int) -> httpx.Response:
+        contact = self.contacts.get(contact_id)
+        if contact is None:
+            return _response(200, [])
+        data = _form(request)
+        contact.update({key: data[key] for key in ("name", "group", "mobile_phone") if key in data})
+        return _response(200, [contact])
+
+    def _delete_contact(self, request: httpx.Request, contact_id: int) -> httpx.Response:
+        self.contacts.pop(contact_id, None)
+        return _response(200, {"status": "success", "message": "Contact deleted"})
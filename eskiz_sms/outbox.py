@@ -0,0 +1,428 @@
+"""
+Durable outbox for fire-and-forget sending.
+
+    outbox = SQLiteOutbox("outbox.db")
+    outbox.enqueue("998901234567", "Hello")  # returns immediately
+
+    worker = OutboxWorker(outbox, eskiz, workers=4)
+    worker.start()
+
+Messages are kept in SQLite (WAL mode) until they are sent. Workers claim them in batches with a lease
+and send them one by one with send_sms, the lease is renewed before each send. A message claimed
+by a dead worker is claimed again when its lease expires, so every message is sent at least once.
+A worker which lost the lease skips the message and can't change its status.
+user_sms_id is unique in the outbox and is passed to send_sms.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from .exceptions import ServiceUnavailable
+from .logging import logger
+from .retry import RetryPolicy
+
+if TYPE_CHECKING:
+    from .async_ import EskizSMS
+    from .eskiz import EskizSMS as SyncEskizSMS
+    from .types import Response
+
+__all__ = ['OutboxMessage', 'SQLiteOutbox', 'OutboxWorker', 'AsyncOutboxWorker']
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS eskiz_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_sms_id TEXT NOT NULL UNIQUE,
+    mobile_phone TEXT NOT NULL,
+    message TEXT NOT NULL,
+    from_whom TEXT NOT NULL,
+    callback_url TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_until REAL,
+    last_error TEXT,
+    response TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS eskiz_outbox_due ON eskiz_outbox (status, next_attempt_at);
+"""
+
+# like the client sends, only the errors after which the message surely wasn't accepted are retried,
+# pass a policy with retry_timeouts and 5xx statuses to retry the ambiguous failures as well
+DEFAULT_RETRY_POLICY = RetryPolicy(
+    max_attempts=5,
+    backoff=1.0,
+    max_backoff=300.0,
+    deadline=None,
+    retry_statuses=(429,),
+    retry_timeouts=False,
+)
+
+
+@dataclass
+class OutboxMessage:
+    id: int
+    user_sms_id: str
+    mobile_phone: str
+    message: str
+    from_whom: str
+    callback_url: Optional[str]
+    attempts: int
+    # end of the lease, identifies the claim in the updates
+    locked_until: float
+
+
+def _dump_response(response: Optional[Response]) -> Optional[str]:
+    if response is None:
+        return None
+    return json.dumps({"id": response.id, "status": response.status, "message": response.message}, default=str)
+
+
+class SQLiteOutbox:
+    """Outbox stored in SQLite, safe to use from many threads and processes"""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """Closes the connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def enqueue(
+            self,
+            mobile_phone: str,
+            message: str,
+            *,
+            user_sms_id: str = None,
+            from_whom: str = "4546",
+            callback_url: str = None,
+    ) -> str:
+        """
+        Saves the message to be sent by the workers.
+        Message with already enqueued user_sms_id is ignored.
+        :return: user_sms_id of the message
+        """
+        if user_sms_id is None:
+            user_sms_id = uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR IGNORE INTO eskiz_outbox "
+            "(user_sms_id, mobile_phone, message, from_whom, callback_url, status, next_attempt_at, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_sms_id, str(mobile_phone), message, from_whom, callback_url, PENDING, now, now, now),
+        )
+        return user_sms_id
+
+    def claim(self, limit: int, lease: float = 60.0) -> List[OutboxMessage]:
+        """Takes up to `limit` due messages, they won't be given to other workers for `lease` seconds"""
+        now = time.time()
+        locked_until = now + lease
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, user_sms_id, mobile_phone, message, from_whom, callback_url, attempts "
+                "FROM eskiz_outbox "
+                "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND locked_until <= ?) "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, SENDING, now, limit),
+            ).fetchall()
+            if rows:
+                connection.executemany(
+                    "UPDATE eskiz_outbox SET status = ?, locked_until = ?, updated_at = ? WHERE id = ?",
+                    [(SENDING, locked_until, now, row[0]) for row in rows],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [OutboxMessage(*row, locked_until) for row in rows]
+
+    def renew(self, message: OutboxMessage, lease: float = 60.0) -> bool:
+        """Extends the lease of the claimed message, returns False if the lease was lost"""
+        locked_until = time.time() + lease
+        cursor = self._connection().execute(
+            "UPDATE eskiz_outbox SET locked_until = ? WHERE id = ? AND status = ? AND locked_until = ?",
+            (locked_until, message.id, SENDING, message.locked_until),
+        )
+        if cursor.rowcount != 1:
+            return False
+        message.locked_until = locked_until
+        return True
+
+    def mark_sent(self, message: OutboxMessage, response: Optional[Response] = None) -> bool:
+        """Returns False if the lease was lost, the status isn't changed then"""
+        cursor = self._connection().execute(
+            "UPDATE eskiz_outbox SET status = ?, attempts = ?, locked_until = NULL, response = ?, updated_at = ? "
+            "WHERE id = ? AND status = ? AND locked_until = ?",
+            (
+                SENT,
+                message.attempts + 1,
+                _dump_response(response),
+                time.time(),
+                message.id,
+                SENDING,
+                message.locked_until,
+            ),
+        )
+        return cursor.rowcount == 1
+
+    def mark_failed(self, message: OutboxMessage, error: Exception, retry_at: Optional[float] = None) -> bool:
+        """
+        Schedules the next attempt at `retry_at`, without it the message is failed permanently.
+        Returns False if the lease was lost, the status isn't changed then
+        """
+        cursor = self._connection().execute(
+            "UPDATE eskiz_outbox SET status = ?, attempts = ?, next_attempt_at = COALESCE(?, next_attempt_at), "
+            "locked_until = NULL, last_error = ?, updated_at = ? WHERE id = ? AND status = ? AND locked_until = ?",
+            (
+                PENDING if retry_at is not None else FAILED,
+                message.attempts + 1,
+                retry_at,
+                repr(error),
+                time.time(),
+                message.id,
+                SENDING,
+                message.locked_until,
+            ),
+        )
+        return cursor.rowcount == 1
+
+    def status(self, user_sms_id: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT status FROM eskiz_outbox WHERE user_sms_id = ?", (user_sms_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM eskiz_outbox GROUP BY status"))
+
+    def purge_sent(self, older_than: float = 0) -> int:
+        """Deletes the sent messages updated more than `older_than` seconds ago"""
+        cursor = self._connection().execute(
+            "DELETE FROM eskiz_outbox WHERE status = ? AND updated_at <= ?", (SENT, time.time() - older_than)
+        )
+        return cursor.rowcount
+
+
+class _BaseOutboxWorker:
+    def __init__(
+            self,
+            outbox: SQLiteOutbox,
+            *,
+            workers: int = 4,
+            batch_size: int = 50,
+            lease: float = 60.0,
+            poll_interval: float = 1.0,
+            retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    ):
+        """
+        :param outbox: Outbox to drain
+        :param workers: Number of worker threads/tasks
+        :param batch_size: Number of messages claimed at once by one worker
+        :param lease: Seconds after which a claimed but unfinished message is claimed again.
+            It's renewed before each send, so it must be longer than one send including the client retries
+        :param poll_interval: Seconds to wait when the outbox is empty
+        :param retry_policy: Which errors are retried, how many times and with what backoff
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.outbox = outbox
+        self.workers = workers
+        self.batch_size = batch_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.retry_policy = retry_policy
+
+    def _on_error(self, message: OutboxMessage, error: Exception):
+        retry_at = None
+        # the circuit breaker is open and the message wasn't sent, it's postponed regardless of the attempts
+        if isinstance(error, ServiceUnavailable) or (
+                message.attempts + 1 < self.retry_policy.max_attempts and self.retry_policy.is_retryable(error)
+        ):
+            delay = getattr(error, 'retry_after', None)
+            if delay is None:
+                delay = self.retry_policy.backoff_delay(message.attempts)
+            retry_at = time.time() + delay
+        logger.warning(
+            f"Eskiz outbox message {message.user_sms_id} failed "
+            f"(attempt {message.attempts + 1}, {'retry' if retry_at else 'giving up'}): {error!r}"
+        )
+        if not self.outbox.mark_failed(message, error, retry_at):
+            self._lease_lost(message)
+
+    @staticmethod
+    def _lease_lost(message: OutboxMessage):
+        logger.warning(f"Eskiz outbox message {message.user_sms_id} lease was lost, it's left to the other worker")
+
+
+class OutboxWorker(_BaseOutboxWorker):
+    """Drains the outbox with a pool of threads"""
+
+    def __init__(self, outbox: SQLiteOutbox, eskiz: SyncEskizSMS, **kwargs):
+        super().__init__(outbox, **kwargs)
+        self.eskiz = eskiz
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _send(self, message: OutboxMessage):
+        if not self.outbox.renew(message, self.lease):
+            self._lease_lost(message)
+            return
+        try:
+            response = self.eskiz.send_sms(
+                message.mobile_phone,
+                message.message,
+                from_whom=message.from_whom,
+                callback_url=message.callback_url,
+                user_sms_id=message.user_sms_id,
+            )
+        except Exception as e:
+            self._on_error(message, e)
+        else:
+            if not self.outbox.mark_sent(message, response):
+                self._lease_lost(message)
+
+    def run_once(self) -> int:
+        """Sends one batch of the due messages, returns the number of processed messages"""
+        messages = self.outbox.claim(self.batch_size, self.lease)
+        for message in messages:
+            self._send(message)
+        return len(messages)
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    processed = self.run_once()
+                except Exception as e:
+                    logger.exception(f"Eskiz outbox worker failed: {e!r}")
+                    processed = 0
+                if not processed:
+                    self._stopped.wait(self.poll_interval)
+        finally:
+            self.outbox.close()
+
+    def start(self):
+        self._stopped.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"eskiz-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Stops the workers after their current batch"""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+class AsyncOutboxWorker(_BaseOutboxWorker):
+    """Drains the outbox with asyncio tasks, database calls are made in one dedicated thread"""
+
+    def __init__(self, outbox: SQLiteOutbox, eskiz: EskizSMS, **kwargs):
+        super().__init__(outbox, **kwargs)
+        self.eskiz = eskiz
+        self._tasks: List[asyncio.Task] = []
+        self._stopped: Optional[asyncio.Event] = None
+        # one thread, so there is one connection of the outbox to close in stop()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _in_thread(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="eskiz-outbox-db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _send(self, message: OutboxMessage):
+        if not await self._in_thread(self.outbox.renew, message, self.lease):
+            self._lease_lost(message)
+            return
+        try:
+            response = await self.eskiz.send_sms(
+                message.mobile_phone,
+                message.message,
+                from_whom=message.from_whom,
+                callback_url=message.callback_url,
+                user_sms_id=message.user_sms_id,
+            )
+        except Exception as e:
+            await self._in_thread(self._on_error, message, e)
+        else:
+            if not await self._in_thread(self.outbox.mark_sent, message, response):
+                self._lease_lost(message)
+
+    async def run_once(self) -> int:
+        """Sends one batch of the due messages concurrently, returns the number of processed messages"""
+        messages = await self._in_thread(self.outbox.claim, self.batch_size, self.lease)
+        await asyncio.gather(*(self._send(message) for message in messages))
+        return len(messages)
+
+    async def _run(self):
+        stopped = self._stopped
+        while not stopped.is_set():
+            try:
+                processed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Eskiz outbox worker failed: {e!r}")
+                processed = 0
+            if not processed:
+                try:
+                    await asyncio.wait_for(stopped.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        self._stopped = asyncio.Event()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._run()))
+
+    async def stop(self, timeout: float = None):
+        """
+        Stops the workers after their current batch and closes the outbox connection.
+        Cancelling a send could leave a sent message unmarked and it would be sent again,
+        so the tasks are cancelled only if they didn't finish in `timeout` seconds
+        """
+        if self._stopped is not None:
+            self._stopped.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks = []
+        if self._executor is not None:
+            await self._in_thread(self.outbox.close)
+            executor, self._executor = self._executor, None
+            executor.shutdown(wait=False)
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import inspect
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+from .logging import logger
+
+if TYPE_CHECKING:
+    from .async_ import EskizSMS
+
+__all__ = ['DispatchStatusChange', 'DispatchPoller', 'is_dispatch_finished']
+
+# statuses of the messages which are not delivered or failed yet
+PENDING_STATUSES = frozenset({"WAITING", "ACCEPTED", "ACCEPTD", "TRANSMTD", "ENROUTE"})
+
+
+def is_dispatch_finished(data: Any) -> bool:
+    """
+    Default check of the dispatch status, data is expected as
+    [{"status": "DELIVRD", "total": 10}, {"status": "WAITING", "total": 2}]
+    """
+    if not isinstance(data, list) or not data:
+        return False
+    return all(
+        not isinstance(item, dict) or str(item.get('status', '')).upper() not in PENDING_STATUSES
+        for item in data
+    )
+
+
+@dataclass
+class DispatchStatusChange:
+    dispatch_id: int
+    data: Any
+    previous: Any = None
+    finished: bool = False
+
+
+class _DispatchState:
+    __slots__ = ("data", "interval", "polled")
+
+    def __init__(self, interval: float):
+        self.data = None
+        self.interval = interval
+        self.polled = False
+
+
+class DispatchPoller:
+    """
+    Polls the statuses of many dispatches with bounded concurrency.
+    A dispatch which didn't change is polled less often (the interval is multiplied by `backoff`
+    up to `max_interval`), a changed one is polled again after `interval`, a finished one is dropped.
+
+        poller = eskiz.poll_dispatches([1, 2, 3], interval=10)
+        async for change in poller.changes():
+            print(change.dispatch_id, change.data)
+    """
+
+    def __init__(
+            self,
+            eskiz: EskizSMS,
+            dispatch_ids: Iterable[int] = (),
+            *,
+            concurrency: int = 5,
+            interval: float = 5.0,
+            max_interval: float = 300.0,
+            backoff: float = 2.0,
+            is_finished: Callable[[Any], bool] = is_dispatch_finished,
+            on_change: Callable[[DispatchStatusChange], Any] = None,
+    ):
+        """
+        :param eskiz: Async EskizSMS instance
+        :param dispatch_ids: Dispatches to track
+        :param concurrency: Max number of status requests in flight
+        :param interval: Initial and minimal interval between polls of one dispatch
+        :param max_interval: Max interval between polls of one dispatch
+        :param backoff: Multiplier of the interval when the status didn't change
+        :param is_finished: Returns True when the dispatch status data is final
+        :param on_change: Callback (function or coroutine function) called with each DispatchStatusChange
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self._eskiz = eskiz
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.is_finished = is_finished
+        self.on_change = on_change
+        self._states: Dict[int, _DispatchState] = {}
+        self._schedule: List[Tuple[float, int]] = []
+        for dispatch_id in dispatch_ids:
+            self.add(dispatch_id)
+
+    @property
+    def active(self) -> List[int]:
+        return list(self._states)
+
+    def add(self, dispatch_id: int):
+        if dispatch_id in self._states:
+            return
+        self._states[dispatch_id] = _DispatchState(self.interval)
+        heapq.heappush(self._schedule, (0.0, dispatch_id))
+
+    def discard(self, dispatch_id: int):
+        self._states.pop(dispatch_id, None)
+
+    def _handle(self, dispatch_id: int, task: asyncio.Future, now: float) -> Optional[DispatchStatusChange]:
+        state = self._states.get(dispatch_id)
+        if state is None:
+            return None
+        error = task.exception()
+        if error is not None:
+            logger.warning(f"Eskiz dispatch {dispatch_id} status request failed: {error!r}")
+            state.interval = min(state.interval * self.backoff, self.max_interval)
+            heapq.heappush(self._schedule, (now + state.interval, dispatch_id))
+            return None
+
+        data = task.result().data
+        change = None
+        if not state.polled or data != state.data:
+            change = DispatchStatusChange(dispatch_id, data, previous=state.data)
+            state.interval = self.interval
+        else:
+            state.interval = min(state.interval * self.backoff, self.max_interval)
+        state.data = data
+        state.polled = True
+
+        if self.is_finished(data):
+            del self._states[dispatch_id]
+            if change is None:
+                change = DispatchStatusChange(dispatch_id, data, previous=data)
+            change.finished = True
+        else:
+            heapq.heappush(self._schedule, (now + state.interval, dispatch_id))
+        return change
+
+    async def _notify(self, change: DispatchStatusChange):
+        if self.on_change is None:
+            return
+        result = self.on_change(change)
+        if inspect.isawaitable(result):
+            await result
+
+    async def changes(self) -> AsyncIterator[DispatchStatusChange]:
+        """Yields the status changes until all the dispatches are finished or discarded"""
+        loop = asyncio.get_running_loop()
+        pending: Dict[asyncio.Future, int] = {}
+        try:
+            while self._schedule or pending:
+                now = loop.time()
+                while self._schedule and len(pending) < self.concurrency and self._schedule[0][0] <= now:
+                    _, dispatch_id = heapq.heappop(self._schedule)
+                    if dispatch_id in self._states:
+                        pending[asyncio.ensure_future(self._eskiz.get_dispatch_status(dispatch_id))] = dispatch_id
+
+                timeout = None
+                if self._schedule and len(pending) < self.concurrency:
+                    timeout = max(0.0, self._schedule[0][0] - now)
+                if not pending:
+                    if timeout is not None:
+                        await asyncio.sleep(timeout)
+                    continue
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                now = loop.time()
+                for task in done:
+                    change = self._handle(pending.pop(task), task, now)
+                    if change is not None:
+                        await self._notify(change)
+                        yield change
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run(self):
+        """Polls until all the dispatches are finished, changes are passed to on_change"""
+        async for _ in self.changes():
+            pass
@@ -0,0 +1,379 @@
+"""
+Pool of several Eskiz accounts, the messages are routed between them by the policy.
+
+    pool = EskizPool(
+        [EskizSMS('first@example.com', 'password'), EskizSMS('second@example.com', 'password')],
+        policy=REMAINING_LIMIT,
+    )
+    pool.send_sms('998901234567', 'message')
+
+When an account fails with InvalidCredentials it's disabled, when it's throttled or out of balance
+it cools down for a while. The message is sent with the next account in both cases.
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Generic, List, Optional, Sequence, TypeVar, TYPE_CHECKING
+
+from .exceptions import (
+    ConnectError,
+    EskizException,
+    InvalidCredentials,
+    NoAvailableAccount,
+    ServiceUnavailable,
+    TooManyRequests,
+)
+from .logging import logger
+
+if TYPE_CHECKING:
+    from .async_ import EskizSMS
+    from .eskiz import EskizSMS as SyncEskizSMS
+    from .types import Response
+
+__all__ = [
+    'Account',
+    'EskizPool',
+    'AsyncEskizPool',
+    'ROUND_ROBIN',
+    'LEAST_OUTSTANDING',
+    'REMAINING_LIMIT',
+    'STICKY',
+    'is_out_of_balance',
+]
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+REMAINING_LIMIT = "remaining_limit"
+STICKY = "sticky"
+POLICIES = (ROUND_ROBIN, LEAST_OUTSTANDING, REMAINING_LIMIT, STICKY)
+
+_BALANCE_MARKERS = ("balance", "баланс", "средств")
+
+Client = TypeVar("Client")
+
+
+def is_out_of_balance(error: EskizException) -> bool:
+    """Default check of the errors meaning that the account can't pay for the message"""
+    if not isinstance(error, EskizException) or error.status_code not in (400, 402, 403):
+        return False
+    message = str(error.message or "").lower()
+    return any(marker in message for marker in _BALANCE_MARKERS)
+
+
+def _parse_balance(response: Response) -> Optional[float]:
+    data = response.data
+    if isinstance(data, dict) and data.get('balance') is not None:
+        try:
+            return float(data['balance'])
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _account_name(client, index: int) -> str:
+    credentials = getattr(getattr(client, 'token', None), '_credentials', None) or {}
+    return credentials.get('email') or str(index)
+
+
+def _balance_order(account: Account) -> float:
+    # unknown balance goes first, so it gets known
+    if account.balance is None:
+        return float('-inf')
+    return -account.balance
+
+
+class Account(Generic[Client]):
+    """State of one account of the pool"""
+
+    __slots__ = ("client", "name", "outstanding", "balance", "balance_at", "disabled", "cooldown_until")
+
+    def __init__(self, client: Client, name: str):
+        self.client = client
+        self.name = name
+        self.outstanding = 0
+        self.balance: Optional[float] = None
+        self.balance_at = 0.0
+        self.disabled = False
+        self.cooldown_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return not self.disabled and self.cooldown_until <= now
+
+    def __repr__(self):
+        return f"Account(name={self.name!r}, outstanding={self.outstanding}, balance={self.balance})"
+
+
+class _BasePool(Generic[Client]):
+    def __init__(
+            self,
+            clients: Sequence[Client],
+            *,
+            policy: str = ROUND_ROBIN,
+            throttle_cooldown: float = 5.0,
+            balance_cooldown: float = 300.0,
+            limit_ttl: float = 60.0,
+            message_cost: float = 1.0,
+            out_of_balance: Callable[[EskizException], bool] = is_out_of_balance,
+    ):
+        """
+        :param clients: EskizSMS instances (all sync or all async) of the accounts
+        :param policy: "round_robin", "least_outstanding" (fewest requests in flight),
+            "remaining_limit" (largest balance from get_limit) or "sticky" (same account for the same phone)
+        :param throttle_cooldown: Seconds to skip a throttled account, Retry-After is used when it's sent
+        :param balance_cooldown: Seconds to skip an account which ran out of balance
+        :param limit_ttl: Seconds to trust the balance from get_limit with the remaining_limit policy
+        :param message_cost: Amount subtracted from the known balance per sent message
+        :param out_of_balance: Returns True when the error means the account can't pay for the message
+        """
+        if not clients:
+            raise ValueError("at least one client is required")
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}")
+        self.accounts: List[Account[Client]] = [
+            Account(client, _account_name(client, i)) for i, client in enumerate(clients)
+        ]
+        self.policy = policy
+        self.throttle_cooldown = throttle_cooldown
+        self.balance_cooldown = balance_cooldown
+        self.limit_ttl = limit_ttl
+        self.message_cost = message_cost
+        self.out_of_balance = out_of_balance
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _candidates(self, key: Any = None) -> List[Account[Client]]:
+        """Available accounts in the order they should be tried"""
+        now = time.monotonic()
+        accounts = [account for account in self.accounts if account.available(now)]
+        if not accounts:
+            raise NoAvailableAccount(message="All the accounts are disabled or cooling down")
+        if self.policy == LEAST_OUTSTANDING:
+            return sorted(accounts, key=lambda account: account.outstanding)
+        if self.policy == REMAINING_LIMIT:
+            return sorted(accounts, key=_balance_order)
+        if self.policy == STICKY and key is not None:
+            # the position is taken among all the accounts, so a phone moves only when its account is unavailable
+            start = zlib.crc32(str(key).encode()) % len(self.accounts)
+            ordered = self.accounts[start:] + self.accounts[:start]
+            return [account for account in ordered if account in accounts]
+        start = next(self._counter) % len(accounts)
+        return accounts[start:] + accounts[:start]
+
+    def _balance_stale(self, account: Account[Client]) -> bool:
+        return self.policy == REMAINING_LIMIT and time.monotonic() - account.balance_at >= self.limit_ttl
+
+    def _stale_accounts(self) -> List[Account[Client]]:
+        if self.policy != REMAINING_LIMIT:
+            return []
+        return [account for account in self.accounts if self._balance_stale(account)]
+
+    def _balances_unknown(self) -> bool:
+        """Some balance was never requested, routing would be blind without it"""
+        return any(account.balance_at == 0.0 for account in self.accounts)
+
+    def _set_balance(self, account: Account[Client], response: Response):
+        account.balance = _parse_balance(response)
+        account.balance_at = time.monotonic()
+
+    def _begin(self, account: Account[Client]):
+        with self._lock:
+            account.outstanding += 1
+
+    def _succeeded(self, account: Account[Client], messages: int):
+        with self._lock:
+            account.outstanding -= 1
+            if account.balance is not None:
+                account.balance -= self.message_cost * messages
+
+    def _failed(self, account: Account[Client], error: Exception) -> bool:
+        """Updates the account state, returns True if the request should be sent with another account"""
+        with self._lock:
+            account.outstanding -= 1
+        if isinstance(error, InvalidCredentials):
+            account.disabled = True
+            logger.warning(f"Eskiz account {account.name} is disabled: invalid credentials")
+            return True
+        if isinstance(error, TooManyRequests):
+            account.cooldown_until = time.monotonic() + (error.retry_after or self.throttle_cooldown)
+            logger.warning(f"Eskiz account {account.name} is throttled")
+            return True
+        if isinstance(error, EskizException) and self.out_of_balance(error):
+            account.cooldown_until = time.monotonic() + self.balance_cooldown
+            account.balance = 0
+            logger.warning(f"Eskiz account {account.name} is out of balance")
+            return True
+        # the request wasn't sent
+        return isinstance(error, (ConnectError, ServiceUnavailable))
+
+    def enable(self, account: Account[Client]):
+        """Returns the disabled or cooling down account to the pool"""
+        account.disabled = False
+        account.cooldown_until = 0.0
+
+
+class EskizPool(_BasePool['SyncEskizSMS']):
+    """Pool of sync EskizSMS instances"""
+
+    def __init__(self, clients: Sequence[SyncEskizSMS], **kwargs):
+        super().__init__(clients, **kwargs)
+        self._refresh_lock = threading.Lock()
+
+    def refresh_limits(self):
+        """Requests the balances of all the accounts"""
+        for account in self.accounts:
+            self._refresh_limit(account)
+
+    def _refresh_limit(self, account: Account[SyncEskizSMS]):
+        try:
+            self._set_balance(account, account.client.get_limit())
+        except EskizException as e:
+            logger.warning(f"Eskiz account {account.name} limit request failed: {e!r}")
+            account.balance_at = time.monotonic()
+
+    def _refresh_stale(self):
+        """
+        One thread refreshes the stale balances for the whole pool.
+        The others don't wait for it and route by the known balances, unless some balance was never requested
+        """
+        if not self._stale_accounts():
+            return
+        if not self._refresh_lock.acquire(blocking=self._balances_unknown()):
+            return
+        try:
+            for account in self._stale_accounts():
+                self._refresh_limit(account)
+        finally:
+            self._refresh_lock.release()
+
+    def execute(self, func: Callable[[SyncEskizSMS], Any], *, key: Any = None, messages: int = 1) -> Any:
+        """
+        Calls func with the clients of the pool until it succeeds or fails with non failover error.
+        :param func: Function called with EskizSMS instance
+        :param key: Key of the sticky policy, e.g. phone number
+        :param messages: Number of the messages sent by func, to update the known balance
+        """
+        self._refresh_stale()
+        error: Optional[Exception] = None
+        for account in self._candidates(key):
+            if not account.available(time.monotonic()):
+                continue
+            self._begin(account)
+            try:
+                result = func(account.client)
+            except Exception as e:
+                if not self._failed(account, e):
+                    raise
+                error = e
+                continue
+            self._succeeded(account, messages)
+            return result
+        raise NoAvailableAccount(message=f"All the accounts failed, last error: {error!r}") from error
+
+    def send_sms(self, mobile_phone: str, message: str, from_whom: str = '4546',
+                 callback_url: str = None, user_sms_id: str = None) -> Response:
+        return self.execute(
+            lambda client: client.send_sms(mobile_phone, message, from_whom, callback_url, user_sms_id),
+            key=mobile_phone,
+        )
+
+    def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int) -> Response:
+        return self.execute(
+            lambda client: client.send_batch(messages=messages, from_whom=from_whom, dispatch_id=dispatch_id),
+            key=dispatch_id,
+            messages=len(messages),
+        )
+
+    def close(self):
+        for account in self.accounts:
+            account.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncEskizPool(_BasePool['EskizSMS']):
+    """Pool of async EskizSMS instances"""
+
+    def __init__(self, clients: Sequence[EskizSMS], **kwargs):
+        super().__init__(clients, **kwargs)
+        self._refreshing: Optional[asyncio.Future] = None
+
+    async def refresh_limits(self):
+        for account in self.accounts:
+            await self._refresh_limit(account)
+
+    async def _refresh_limit(self, account: Account[EskizSMS]):
+        try:
+            self._set_balance(account, await account.client.get_limit())
+        except EskizException as e:
+            logger.warning(f"Eskiz account {account.name} limit request failed: {e!r}")
+            account.balance_at = time.monotonic()
+
+    async def _refresh_stale_limits(self):
+        await asyncio.gather(*(self._refresh_limit(account) for account in self._stale_accounts()))
+
+    def _clear_refreshing(self, future: asyncio.Future):
+        if self._refreshing is future:
+            self._refreshing = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Eskiz pool limits refresh failed: {future.exception()!r}")
+
+    async def _refresh_stale(self):
+        """Same as EskizPool._refresh_stale, the senders share one refresh task"""
+        if self._refreshing is None:
+            if not self._stale_accounts():
+                return
+            self._refreshing = asyncio.ensure_future(self._refresh_stale_limits())
+            self._refreshing.add_done_callback(self._clear_refreshing)
+        if self._balances_unknown():
+            await asyncio.shield(self._refreshing)
+
+    async def execute(self, func: Callable[[EskizSMS], Awaitable[Any]], *, key: Any = None, messages: int = 1) -> Any:
+        """Same as EskizPool.execute, func returns awaitable"""
+        await self._refresh_stale()
+        error: Optional[Exception] = None
+        for account in self._candidates(key):
+            if not account.available(time.monotonic()):
+                continue
+            self._begin(account)
+            try:
+                result = await func(account.client)
+            except Exception as e:
+                if not self._failed(account, e):
+                    raise
+                error = e
+                continue
+            self._succeeded(account, messages)
+            return result
+        raise NoAvailableAccount(message=f"All the accounts failed, last error: {error!r}") from error
+
+    async def send_sms(self, mobile_phone: str, message: str, from_whom: str = '4546',
+                       callback_url: str = None, user_sms_id: str = None) -> Response:
+        return await self.execute(
+            lambda client: client.send_sms(mobile_phone, message, from_whom, callback_url, user_sms_id),
+            key=mobile_phone,
+        )
+
+    async def send_batch(self, *, messages: List[dict], from_whom: str = "4546", dispatch_id: int) -> Response:
+        return await self.execute(
+            lambda client: client.send_batch(messages=messages, from_whom=from_whom, dispatch_id=dispatch_id),
+            key=dispatch_id,
+            messages=len(messages),
+        )
+
+    async def aclose(self):
+        for account in self.accounts:
+            await account.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
@@ -0,0 +1,223 @@
+"""
+Priority lanes in front of the requests, so the interactive messages are not stuck behind the bulk ones.
+
+    scheduler = PriorityScheduler(
+        [Lane("otp", weight=10), Lane("bulk", concurrency=4, rate=20)],
+        max_concurrency=10,
+        groups={EndpointGroup.BATCH: "bulk"},
+        default_lane="otp",
+    )
+    eskiz = EskizSMS('email', 'password', scheduler=scheduler)
+
+    with use_lane("bulk"):
+        for phone in phones:
+            eskiz.send_sms(phone, 'promo')
+
+Every request takes one of `max_concurrency` slots. A free slot is given to the waiting request
+of the first lane in the list ("strict" policy) or shared between the lanes by their weights ("weighted").
+Lanes can have their own concurrency and rate caps.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterable, Iterator, Optional, Union
+
+from .enums import EndpointGroup
+from .ratelimit import TokenBucket
+
+__all__ = ['Lane', 'PriorityScheduler', 'use_lane', 'STRICT', 'WEIGHTED']
+
+STRICT = "strict"
+WEIGHTED = "weighted"
+
+_current_lane: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("eskiz_lane", default=None)
+
+
+@contextmanager
+def use_lane(name: str) -> Iterator[None]:
+    """Requests made in the block (and in the tasks created in it) go to the lane"""
+    reset_token = _current_lane.set(name)
+    try:
+        yield
+    finally:
+        _current_lane.reset(reset_token)
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class Lane:
+    """
+    :param name: Name of the lane
+    :param weight: Share of the slots with the weighted policy
+    :param concurrency: Max number of requests of the lane in flight, None means only the global limit
+    :param rate: TokenBucket or requests per second of the lane, None means unlimited
+    """
+
+    __slots__ = ("name", "weight", "concurrency", "bucket", "active", "_waiters", "_pass")
+
+    def __init__(
+            self,
+            name: str,
+            weight: float = 1,
+            concurrency: int = None,
+            rate: Union[TokenBucket, float] = None,
+    ):
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        if concurrency is not None and concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.name = name
+        self.weight = weight
+        self.concurrency = concurrency
+        if rate is not None and not isinstance(rate, TokenBucket):
+            rate = TokenBucket(rate)
+        self.bucket: Optional[TokenBucket] = rate
+        self.active = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._pass = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _ready(self) -> bool:
+        return bool(self._waiters) and (self.concurrency is None or self.active < self.concurrency)
+
+
+class PriorityScheduler:
+    """Shares the request slots between the lanes, can be used by sync and async instances"""
+
+    def __init__(
+            self,
+            lanes: Iterable[Lane],
+            max_concurrency: int = 10,
+            policy: str = STRICT,
+            groups: Dict[EndpointGroup, str] = None,
+            default_lane: str = None,
+    ):
+        """
+        :param lanes: Lanes in the order of priority
+        :param max_concurrency: Max number of requests in flight of all lanes
+        :param policy: "strict" - a lane gets a slot only when the lanes before it have nothing to send,
+            "weighted" - slots are shared in proportion to the weights of the lanes
+        :param groups: Lane names by endpoint group, used when the lane isn't set with use_lane()
+        :param default_lane: Lane of the other requests, default is the last one
+        """
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        if not self.lanes:
+            raise ValueError("at least one lane is required")
+        if policy not in (STRICT, WEIGHTED):
+            raise ValueError(f"unknown policy {policy!r}")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.policy = policy
+        self.groups = dict(groups or {})
+        self.default_lane = default_lane if default_lane is not None else list(self.lanes)[-1]
+        for name in (self.default_lane, *self.groups.values()):
+            if name not in self.lanes:
+                raise ValueError(f"unknown lane {name!r}")
+        self.active = 0
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+    def lane_for(self, group: EndpointGroup = EndpointGroup.DEFAULT) -> Lane:
+        name = _current_lane.get()
+        if name is None:
+            name = self.groups.get(group, self.default_lane)
+        try:
+            return self.lanes[name]
+        except KeyError:
+            raise ValueError(f"unknown lane {name!r}") from None
+
+    def _next_lane(self) -> Optional[Lane]:
+        best = None
+        for lane in self.lanes.values():
+            if not lane._ready():  # noqa
+                continue
+            if self.policy == STRICT:
+                return lane
+            if best is None or lane._pass < best._pass:  # noqa
+                best = lane
+        return best
+
+    def _dispatch(self):
+        """Gives the free slots to the waiters, must be called with the lock held"""
+        while self.active < self.max_concurrency:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = lane._waiters.popleft()  # noqa
+            waiter.granted = True
+            lane.active += 1
+            self.active += 1
+            self._virtual_time = lane._pass  # noqa
+            lane._pass += 1 / lane.weight  # noqa
+            waiter.wake()
+
+    def _enqueue(self, lane: Lane, waiter: _Waiter):
+        with self._lock:
+            if not lane._waiters and lane.active == 0:  # noqa
+                # an idle lane doesn't get the credit for the time it didn't send
+                lane._pass = max(lane._pass, self._virtual_time)  # noqa
+            lane._waiters.append(waiter)  # noqa
+            self._dispatch()
+
+    def acquire(self, group: EndpointGroup = EndpointGroup.DEFAULT) -> Lane:
+        """Waits for a slot of the lane, returns the lane to be passed to release()"""
+        lane = self.lane_for(group)
+        if lane.bucket is not None:
+            lane.bucket.acquire()
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        self._enqueue(lane, waiter)
+        event.wait()
+        return lane
+
+    async def aacquire(self, group: EndpointGroup = EndpointGroup.DEFAULT) -> Lane:
+        lane = self.lane_for(group)
+        if lane.bucket is not None:
+            await lane.bucket.aacquire()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(_set_result, future)
+
+        waiter = _Waiter(wake)
+        self._enqueue(lane, waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    lane._waiters.remove(waiter)  # noqa
+            if granted:
+                self.release(lane)
+            raise
+        return lane
+
+    def release(self, lane: Lane):
+        with self._lock:
+            lane.active -= 1
+            self.active -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: {"active": lane.active, "waiting": lane.waiting} for name, lane in self.lanes.items()}
+
+
+def _set_result(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
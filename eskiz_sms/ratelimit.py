@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Union
+
+from .enums import EndpointGroup
+
+__all__ = ['TokenBucket', 'RateLimiter']
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+    Tokens are reserved in advance, so waiting callers are served in the order of arrival
+    and the bucket is drained at exactly `rate` tokens per second.
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated_at", "_lock")
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: Tokens per second
+        :param capacity: Max burst size, default is max(1, rate)
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _reserve(self, tokens: float) -> float:
+        """Takes the tokens and returns how long the caller has to wait for them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1):
+        delay = self._reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens: float = 1):
+        delay = self._reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Token buckets per endpoint group.
+    The same instance can be passed to several EskizSMS instances to share the limits.
+
+        limiter = RateLimiter(send=20, batch=TokenBucket(rate=1, capacity=2))
+        eskiz = EskizSMS('email', 'password', rate_limiter=limiter)
+    """
+
+    __slots__ = ("buckets",)
+
+    def __init__(
+            self,
+            send: Union[TokenBucket, float] = None,
+            batch: Union[TokenBucket, float] = None,
+            reporting: Union[TokenBucket, float] = None,
+            contacts: Union[TokenBucket, float] = None,
+            default: Union[TokenBucket, float] = None,
+    ):
+        """Each argument is a TokenBucket or requests per second, None means unlimited"""
+        self.buckets: Dict[EndpointGroup, TokenBucket] = {}
+        for group, bucket in (
+                (EndpointGroup.SEND, send),
+                (EndpointGroup.BATCH, batch),
+                (EndpointGroup.REPORTING, reporting),
+                (EndpointGroup.CONTACTS, contacts),
+                (EndpointGroup.DEFAULT, default),
+        ):
+            if bucket is None:
+                continue
+            if not isinstance(bucket, TokenBucket):
+                bucket = TokenBucket(bucket)
+            self.buckets[group] = bucket
+
+    def bucket(self, group: EndpointGroup) -> Optional[TokenBucket]:
+        return self.buckets.get(group)
+
+    def try_acquire(self, group: EndpointGroup) -> bool:
+        bucket = self.buckets.get(group)
+        return bucket is None or bucket.try_acquire()
+
+    def acquire(self, group: EndpointGroup):
+        bucket = self.buckets.get(group)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def aacquire(self, group: EndpointGroup):
+        bucket = self.buckets.get(group)
+        if bucket is not None:
+            await bucket.aacquire()
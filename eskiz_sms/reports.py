@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from .columns import UserMessageTable
+from .types import UserMessage
+
+if TYPE_CHECKING:
+    from .async_ import EskizSMS
+    from .eskiz import EskizSMS as SyncEskizSMS
+
+__all__ = [
+    'iter_user_messages',
+    'aiter_user_messages',
+    'user_messages_table',
+    'auser_messages_table',
+    'date_windows',
+]
+
+USER_MESSAGES_PATH = "/message/sms/get-user-messages"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DateLike = Union[str, datetime]
+
+
+def _to_datetime(value: DateLike) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def date_windows(from_date: DateLike, to_date: DateLike, window: Optional[timedelta]) -> Iterator[Tuple[str, str]]:
+    """
+    Splits the date range into consecutive non-overlapping windows.
+    Without window the range is returned as is.
+    """
+    if window is None:
+        yield (
+            from_date.strftime(DATE_FORMAT) if isinstance(from_date, datetime) else from_date,
+            to_date.strftime(DATE_FORMAT) if isinstance(to_date, datetime) else to_date,
+        )
+        return
+    if window <= timedelta(0):
+        raise ValueError("window must be positive")
+    start, end = _to_datetime(from_date), _to_datetime(to_date)
+    while start <= end:
+        window_end = min(start + window - timedelta(seconds=1), end)
+        yield start.strftime(DATE_FORMAT), window_end.strftime(DATE_FORMAT)
+        start = window_end + timedelta(seconds=1)
+
+
+def _parse_page(data) -> Tuple[List[dict], bool]:
+    """Returns the items of the page and whether there is the next page"""
+    if isinstance(data, list):
+        return data, False
+    if isinstance(data, dict) and isinstance(data.get('data'), list):
+        current_page, last_page = data.get('current_page'), data.get('last_page')
+        if current_page is not None and last_page is not None:
+            return data['data'], current_page < last_page
+        return data['data'], bool(data.get('next_page_url'))
+    return [], False
+
+
+def _payload(from_date: str, to_date: str, user_id: int, page: int) -> dict:
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "user_id": user_id,
+        "page": page,
+    }
+
+
+def _iter_pages(eskiz: SyncEskizSMS, from_date: str, to_date: str, user_id: int,
+                executor: Optional[ThreadPoolExecutor]) -> Iterator[List[dict]]:
+    def fetch(page: int):
+        response = eskiz._request.get(USER_MESSAGES_PATH, payload=_payload(from_date, to_date, user_id, page))  # noqa
+        return _parse_page(response.get('data'))
+
+    page = 1
+    items, has_next = fetch(page)
+    while True:
+        future = executor.submit(fetch, page + 1) if executor is not None and has_next else None
+        yield items
+        if not has_next:
+            return
+        page += 1
+        items, has_next = future.result() if future is not None else fetch(page)
+
+
+def iter_user_messages(
+        eskiz: SyncEskizSMS,
+        from_date: DateLike,
+        to_date: DateLike,
+        *,
+        user_id: int = None,
+        window: timedelta = None,
+        prefetch: bool = False,
+) -> Iterator[UserMessage]:
+    user_id = eskiz._get_user_id(user_id)  # noqa
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        for window_from, window_to in date_windows(from_date, to_date, window):
+            for items in _iter_pages(eskiz, window_from, window_to, user_id, executor):
+                for item in items:
+                    yield UserMessage.from_dict(item)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def user_messages_table(
+        eskiz: SyncEskizSMS,
+        from_date: DateLike,
+        to_date: DateLike,
+        *,
+        user_id: int = None,
+        window: timedelta = None,
+        prefetch: bool = False,
+) -> UserMessageTable:
+    user_id = eskiz._get_user_id(user_id)  # noqa
+    table = UserMessageTable()
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        for window_from, window_to in date_windows(from_date, to_date, window):
+            for items in _iter_pages(eskiz, window_from, window_to, user_id, executor):
+                table.extend(items)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+    return table
+
+
+async def _aiter_pages(eskiz: EskizSMS, from_date: str, to_date: str, user_id: int,
+                       prefetch: bool) -> AsyncIterator[List[dict]]:
+    async def fetch(page: int):
+        payload = _payload(from_date, to_date, user_id, page)
+        response = await eskiz._request.get(USER_MESSAGES_PATH, payload=payload)  # noqa
+        return _parse_page(response.get('data'))
+
+    page = 1
+    items, has_next = await fetch(page)
+    task = None
+    try:
+        while True:
+            task = asyncio.ensure_future(fetch(page + 1)) if prefetch and has_next else None
+            yield items
+            if not has_next:
+                return
+            page += 1
+            items, has_next = await task if task is not None else await fetch(page)
+            task = None
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+async def aiter_user_messages(
+        eskiz: EskizSMS,
+        from_date: DateLike,
+        to_date: DateLike,
+        *,
+        user_id: int = None,
+        window: timedelta = None,
+        prefetch: bool = False,
+) -> AsyncIterator[UserMessage]:
+    user_id = await eskiz._get_user_id(user_id)  # noqa
+    for window_from, window_to in date_windows(from_date, to_date, window):
+        pages = _aiter_pages(eskiz, window_from, window_to, user_id, prefetch)
+        try:
+            async for items in pages:
+                for item in items:
+                    yield UserMessage.from_dict(item)
+        finally:
+            await pages.aclose()
+
+
+async def auser_messages_table(
+        eskiz: EskizSMS,
+        from_date: DateLike,
+        to_date: DateLike,
+        *,
+        user_id: int = None,
+        window: timedelta = None,
+        prefetch: bool = False,
+) -> UserMessageTable:
+    user_id = await eskiz._get_user_id(user_id)  # noqa
+    table = UserMessageTable()
+    for window_from, window_to in date_windows(from_date, to_date, window):
+        pages = _aiter_pages(eskiz, window_from, window_to, user_id, prefetch)
+        try:
+            async for items in pages:
+                table.extend(items)
+        finally:
+            await pages.aclose()
+    return table
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 import re
-from dataclasses import dataclass, asdict
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from http.client import responses
-from json import JSONDecodeError
-from typing import Optional, TYPE_CHECKING
+from typing import Any, Optional, Tuple, Union, TYPE_CHECKING
+from urllib.parse import urlencode
 
 import httpx
 
+from .cache import ResponseCache, invalidated_paths
+from .circuit import CircuitBreaker
+from .enums import EndpointGroup, HookEvent
 from .enums import Message as ResponseMessage
 from .enums import Status as ResponseStatus
 from .exceptions import (
@@ -15,8 +21,16 @@ from .exceptions import (
     BadRequest,
     TokenInvalid,
     InvalidCredentials,
+    TooManyRequests,
+    ServerError,
+    ConnectError,
+    RequestTimeout,
+    EskizException,
 )
+from .hooks import Event, Hooks
+from .jsonlib import RawResponse, dumps, loads
 from .logging import logger
+from .retry import Retry, RetryPolicy
 
 if TYPE_CHECKING:
     from .base import EskizSMSBase
@@ -24,17 +38,105 @@ if TYPE_CHECKING:
 BASE_URL = "https://notify.eskiz.uz/api"
 API_VERSION_RE = re.compile("API version: ([0-9.]+)")
 
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+DEFAULT_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+JSON_CONTENT_TYPE = "application/json"
+
 
 # full path
 def _url(path: str):
     return BASE_URL + path
 
 
+def endpoint_group(path: str) -> EndpointGroup:
+    if path.startswith("/message/sms/send-batch"):
+        return EndpointGroup.BATCH
+    if path.startswith("/message/sms/send"):
+        return EndpointGroup.SEND
+    if path.startswith("/message/sms/get-") or path.startswith("/user/"):
+        return EndpointGroup.REPORTING
+    if path.startswith("/contact"):
+        return EndpointGroup.CONTACTS
+    return EndpointGroup.DEFAULT
+
+
+def create_http_client(
+        is_async: bool = False,
+        limits: httpx.Limits = None,
+        timeout: httpx.Timeout = None,
+        **kwargs
+) -> Union[httpx.Client, httpx.AsyncClient]:
+    """
+    Creates long-lived pooled client, which is shared between the token and the requests
+    :param is_async: Return httpx.AsyncClient instead of httpx.Client
+    :param limits: Pool limits, max connections and keep-alive
+    :param timeout: Connect/read/write/pool timeouts
+    :param kwargs: Other httpx client arguments
+    """
+    client_class = httpx.AsyncClient if is_async else httpx.Client
+    return client_class(
+        limits=limits or DEFAULT_LIMITS,
+        timeout=timeout or DEFAULT_TIMEOUT,
+        **kwargs
+    )
+
+
+def _form_value(value: Any) -> str:
+    # same as httpx form encoding
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _is_nested(value: Any) -> bool:
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, (list, tuple)) and any(isinstance(item, (dict, list)) for item in value)
+
+
+def encode_body(data: Optional[dict]) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Serializes the payload once, before the first attempt.
+    Payloads with nested objects (e.g. the batch messages) are sent as JSON, the flat ones are form encoded
+    """
+    if not data:
+        return None, None
+    if any(_is_nested(value) for value in data.values()):
+        return dumps(data), JSON_CONTENT_TYPE
+    fields = []
+    for key, value in data.items():
+        if isinstance(value, (list, tuple)):
+            fields.extend((key, _form_value(item)) for item in value)
+        else:
+            fields.append((key, _form_value(value)))
+    return urlencode(fields).encode(), FORM_CONTENT_TYPE
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
 @dataclass
 class _Response:
     status_code: int
     data: dict
     token_invalid: bool = False
+    retry_after: Optional[float] = None
 
 
 @dataclass
@@ -43,13 +145,23 @@ class _Request:
     url: str
     data: dict = None
     headers: dict = None
+    content: Optional[bytes] = None
+    content_type: Optional[str] = None
+    # the successful response is returned as RawResponse
+    raw: bool = False
 
 
 class BaseRequest:
+    _http_client: Optional[Union[httpx.Client, httpx.AsyncClient]] = None
+    _circuit_breaker: Optional[CircuitBreaker] = None
+    _hooks: Optional[Hooks] = None
 
     @staticmethod
-    def _prepare_request(method: str, path: str, data: dict = None, headers: dict = None):
-        return _Request(method, _url(path), data, headers)
+    def _prepare_request(method: str, path: str, data: dict = None, headers: dict = None, raw: bool = False):
+        content, content_type = encode_body(data)
+        if content_type is not None:
+            headers = {**headers, "Content-Type": content_type} if headers else {"Content-Type": content_type}
+        return _Request(method, _url(path), data, headers, content, content_type, raw)
 
     @staticmethod
     def _exception(_response: _Response):
@@ -63,6 +175,19 @@ class BaseRequest:
             )
         if message == ResponseMessage.INVALID_CREDENTIALS:
             return InvalidCredentials(message="Invalid credentials", status_code=_response.status_code)
+        if _response.status_code == 429:
+            return TooManyRequests(
+                message=message,
+                status=status,
+                status_code=_response.status_code,
+                retry_after=_response.retry_after,
+            )
+        if _response.status_code >= 500:
+            return ServerError(
+                message=message,
+                status=status,
+                status_code=_response.status_code
+            )
         return BadRequest(
             message=message,
             status=status,
@@ -76,33 +201,130 @@ class BaseRequest:
         }
 
     def _request(self, _request: _Request):
+        hooks = self._hooks
+        if not hooks:
+            return self._guarded_request(_request)
+        event = self._start_event(_request, hooks)
+        try:
+            response = self._guarded_request(_request, event)
+        except Exception as e:
+            hooks.emit(event.finish(HookEvent.ERROR, e))
+            raise
+        hooks.emit(event.finish(HookEvent.AFTER_RESPONSE))
+        return response
+
+    @staticmethod
+    def _start_event(_request: _Request, hooks: Hooks) -> Event:
+        endpoint = _request.url[len(BASE_URL):]
+        event = Event(HookEvent.BEFORE_REQUEST, _request.method, endpoint, endpoint_group(endpoint))
+        hooks.emit(event)
+        return event
+
+    def _guarded_request(self, _request: _Request, event: Event = None):
+        breaker = self._circuit_breaker
+        if breaker is None:
+            return self._send_request(_request, event)
+        group = endpoint_group(_request.url[len(BASE_URL):])
+        generation = breaker.before_request(group)
         try:
-            with httpx.Client() as client:
-                return self._check_response(client.request(**asdict(_request)))
+            response = self._send_request(_request, event)
+        except BaseException as e:
+            breaker.after_request(group, e, generation)
+            raise
+        breaker.after_request(group, generation=generation)
+        return response
+
+    def _send_request(self, _request: _Request, event: Event = None):
+        client = self._http_client
+        extensions = {'trace': event.trace} if event is not None else None
+        try:
+            if client is None:
+                with httpx.Client(timeout=DEFAULT_TIMEOUT) as client:
+                    r = client.request(_request.method, _request.url, content=_request.content,
+                                       headers=_request.headers, extensions=extensions)
+            else:
+                r = client.request(_request.method, _request.url, content=_request.content,
+                                   headers=_request.headers, extensions=extensions)
         except httpx.HTTPError as e:
-            raise HTTPError(message=str(e))
+            raise self._http_error(e) from e
+        if event is not None:
+            event.record(r)
+        return self._check_response(r, _request.raw)
 
     async def _a_request(self, _request: _Request):
+        hooks = self._hooks
+        if not hooks:
+            return await self._a_guarded_request(_request)
+        event = self._start_event(_request, hooks)
+        try:
+            response = await self._a_guarded_request(_request, event)
+        except Exception as e:
+            hooks.emit(event.finish(HookEvent.ERROR, e))
+            raise
+        hooks.emit(event.finish(HookEvent.AFTER_RESPONSE))
+        return response
+
+    async def _a_guarded_request(self, _request: _Request, event: Event = None):
+        breaker = self._circuit_breaker
+        if breaker is None:
+            return await self._a_send_request(_request, event)
+        group = endpoint_group(_request.url[len(BASE_URL):])
+        generation = breaker.before_request(group)
+        try:
+            response = await self._a_send_request(_request, event)
+        except BaseException as e:
+            breaker.after_request(group, e, generation)
+            raise
+        breaker.after_request(group, generation=generation)
+        return response
+
+    async def _a_send_request(self, _request: _Request, event: Event = None):
+        client = self._http_client
+        extensions = {'trace': event.atrace} if event is not None else None
         try:
-            async with httpx.AsyncClient() as client:
-                return self._check_response(await client.request(**asdict(_request)))
+            if client is None:
+                async with httpx.AsyncClient(timeout=DEFAULT_TIMEOUT) as client:
+                    r = await client.request(_request.method, _request.url, content=_request.content,
+                                             headers=_request.headers, extensions=extensions)
+            else:
+                r = await client.request(_request.method, _request.url, content=_request.content,
+                                         headers=_request.headers, extensions=extensions)
         except httpx.HTTPError as e:
-            raise HTTPError(message=str(e))
+            raise self._http_error(e) from e
+        if event is not None:
+            event.record(r)
+        return self._check_response(r, _request.raw)
+
+    @staticmethod
+    def _http_error(e: httpx.HTTPError) -> HTTPError:
+        if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return ConnectError(message=str(e))
+        if isinstance(e, httpx.TimeoutException):
+            return RequestTimeout(message=str(e))
+        return HTTPError(message=str(e))
+
+    def _check_response(self, r: httpx.Response, raw: bool = False) -> _Response:
+        if raw and r.status_code in (200, 201):
+            logger.debug("Eskiz request status_code=%s body=%s bytes", r.status_code, len(r.content))
+            return _Response(status_code=r.status_code, data=RawResponse(r.content))
 
-    def _check_response(self, r: httpx.Response) -> _Response:
         response: Optional[_Response] = None
         try:
-            response = _Response(status_code=r.status_code, data=r.json())
-        except JSONDecodeError:
+            response = _Response(status_code=r.status_code, data=loads(r.content))
+        except ValueError:
             if r.status_code == 200:
                 api_version = API_VERSION_RE.search(r.text)
                 if api_version:
                     response = _Response(status_code=r.status_code, data={'api_version': api_version.groups()[0]})
 
         if response is None:
-            response = _Response(status_code=r.status_code, data={'message': responses[r.status_code]})
+            response = _Response(status_code=r.status_code, data={'message': responses.get(r.status_code, '')})
+
+        if response.status_code == 429:
+            response.retry_after = _parse_retry_after(r.headers.get('Retry-After'))
 
-        logger.debug(f"Eskiz request status_code={response.status_code} body={response.data}")
+        # the body is formatted only if the debug logging is enabled
+        logger.debug("Eskiz request status_code=%s body=%s", response.status_code, response.data)
 
         if response.status_code == 401:
             if response.data.get('status') == ResponseStatus.TOKEN_INVALID:
@@ -118,34 +340,183 @@ class BaseRequest:
 class Request(BaseRequest):
     def __init__(self, eskiz: EskizSMSBase):
         self._eskiz = eskiz
-
-    def __call__(self, method: str, path: str, payload: dict = None):
+        # token and its headers by content type, the headers are reused until the token changes
+        self._auth: Optional[Tuple[str, dict]] = None
+
+    def _auth_header(self, token: str, content_type: str = None) -> dict:
+        auth = self._auth
+        if auth is None or auth[0] != token:
+            auth = self._auth = (token, {})
+        headers = auth[1].get(content_type)
+        if headers is None:
+            headers = self._get_authorization_header(token)
+            if content_type is not None:
+                headers["Content-Type"] = content_type
+            auth[1][content_type] = headers
+        return headers
+
+    @property
+    def _http_client(self):
+        return self._eskiz._http_client  # noqa
+
+    @property
+    def _circuit_breaker(self):
+        return self._eskiz.circuit_breaker
+
+    @property
+    def _hooks(self):
+        return self._eskiz.hooks
+
+    def __call__(self, method: str, path: str, payload: dict = None, raw: bool = False):
+        """
+        :param raw: Return the successful response as RawResponse instead of the decoded body
+        """
         _request = self._prepare_request(
             method,
             path,
-            data=self._prepare_payload(payload)
+            data=self._prepare_payload(payload),
+            raw=raw,
         )
-        if getattr(self._eskiz, 'is_async', False):  # noqa
-            return self.async_request(_request)
-        return self.request(_request)
+        group = endpoint_group(path)
+        is_async = getattr(self._eskiz, 'is_async', False)
+        cache: Optional[ResponseCache] = self._eskiz.cache
+        if cache is not None and not raw:
+            ttl = cache.ttl(method, path)
+            if ttl is not None:
+                key = cache.key(method, path, _request.data)
+                if is_async:
+                    return cache.aload(key, ttl, lambda: self.async_request(_request, group))
+                return cache.load(key, ttl, lambda: self.request(_request, group))
+            if invalidated_paths(method, path):
+                if is_async:
+                    return self._async_write(cache, method, path, _request, group)
+                response = self.request(_request, group)
+                cache.invalidate_write(method, path)
+                return response
+        if is_async:
+            return self.async_request(_request, group)
+        return self.request(_request, group)
+
+    async def _async_write(self, cache: ResponseCache, method: str, path: str, _request: _Request,
+                           group: EndpointGroup) -> dict:
+        response = await self.async_request(_request, group)
+        cache.invalidate_write(method, path)
+        return response
+
+    def _retry_policy(self, _request: _Request, group: EndpointGroup) -> Optional[RetryPolicy]:
+        retry: Optional[Retry] = self._eskiz.retry
+        if retry is None:
+            return None
+        return retry.policy(group, _request.data, _request.method, _request.url[len(BASE_URL):])
+
+    def _emit_retry(self, _request: _Request, group: EndpointGroup, attempt: int, delay: float,
+                    error: EskizException):
+        hooks = self._eskiz.hooks
+        if not hooks:
+            return
+        event = Event(HookEvent.RETRY, _request.method, _request.url[len(BASE_URL):], group)
+        event.attempt = attempt
+        event.delay = delay
+        event.error = error
+        event.status_code = getattr(error, 'status_code', None)
+        hooks.emit(event)
+
+    async def async_request(self, _request: _Request, group: EndpointGroup = EndpointGroup.DEFAULT) -> dict:
+        policy = self._retry_policy(_request, group)
+        if policy is None:
+            return await self._async_request_once(_request, group)
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return await self._async_request_once(_request, group)
+            except EskizException as e:
+                delay = policy.next_delay(e, attempt, time.monotonic() - started_at)
+                if delay is None:
+                    raise
+                logger.debug("Retrying %s %s in %.2fs: %r", _request.method, _request.url, delay, e)
+                self._emit_retry(_request, group, attempt, delay, e)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _async_request_once(self, _request: _Request, group: EndpointGroup) -> dict:
+        if self._eskiz.rate_limiter is not None:
+            await self._eskiz.rate_limiter.aacquire(group)
+        scheduler = self._eskiz.scheduler
+        if scheduler is None:
+            return await self._async_limited_send(_request)
+        lane = await scheduler.aacquire(group)
+        try:
+            return await self._async_limited_send(_request)
+        finally:
+            scheduler.release(lane)
+
+    async def _async_limited_send(self, _request: _Request) -> dict:
+        limiter = self._eskiz.concurrency_limiter
+        if limiter is None:
+            return await self._async_send(_request)
+        started_at = await limiter.acquire()
+        try:
+            response = await self._async_send(_request)
+        except BaseException as e:
+            limiter.release(started_at, e)
+            raise
+        limiter.release(started_at)
+        return response
 
-    async def async_request(self, _request: _Request) -> dict:
-        _request.headers = self._get_authorization_header(await self._eskiz.token.get())
+    async def _async_send(self, _request: _Request) -> dict:
+        token = await self._eskiz.token.get()
+        _request.headers = self._auth_header(token, _request.content_type)
         response = await self._a_request(_request)
         if response.token_invalid and self._eskiz.token.auto_update:
             logger.debug("Refreshing the token")
-            _request.headers = self._get_authorization_header(await self._eskiz.token.get(get_new=True))
+            _request.headers = self._auth_header(
+                await self._eskiz.token.get(get_new=True, invalid_token=token), _request.content_type
+            )
             response = await self._a_request(_request)
         if response.status_code not in [200, 201]:
             raise self._exception(response)
         return response.data
 
-    def request(self, _request: _Request) -> dict:
-        _request.headers = self._get_authorization_header(self._eskiz.token.get())
+    def request(self, _request: _Request, group: EndpointGroup = EndpointGroup.DEFAULT) -> dict:
+        policy = self._retry_policy(_request, group)
+        if policy is None:
+            return self._request_once(_request, group)
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return self._request_once(_request, group)
+            except EskizException as e:
+                delay = policy.next_delay(e, attempt, time.monotonic() - started_at)
+                if delay is None:
+                    raise
+                logger.debug("Retrying %s %s in %.2fs: %r", _request.method, _request.url, delay, e)
+                self._emit_retry(_request, group, attempt, delay, e)
+            time.sleep(delay)
+            attempt += 1
+
+    def _request_once(self, _request: _Request, group: EndpointGroup) -> dict:
+        if self._eskiz.rate_limiter is not None:
+            self._eskiz.rate_limiter.acquire(group)
+        scheduler = self._eskiz.scheduler
+        if scheduler is None:
+            return self._send(_request)
+        lane = scheduler.acquire(group)
+        try:
+            return self._send(_request)
+        finally:
+            scheduler.release(lane)
+
+    def _send(self, _request: _Request) -> dict:
+        token = self._eskiz.token.get()
+        _request.headers = self._auth_header(token, _request.content_type)
         response = self._request(_request)
         if response.token_invalid and self._eskiz.token.auto_update:
             logger.debug("Refreshing the token")
-            _request.headers = self._get_authorization_header(self._eskiz.token.get(get_new=True))
+            _request.headers = self._auth_header(
+                self._eskiz.token.get(get_new=True, invalid_token=token), _request.content_type
+            )
             response = self._request(_request)
         if response.status_code not in [200, 201]:
             raise self._exception(response)
@@ -153,7 +524,13 @@ class Request(BaseRequest):
 
     @staticmethod
     def _prepare_payload(payload: dict):
-        payload = payload or {}
+        """Returns the payload with API field names, the passed dict isn't changed"""
+        if not payload:
+            return {}
+        if 'from_whom' not in payload and 'mobile_phone' not in payload:
+            return payload
+        # shallow copy, the values (e.g. the batch messages) are shared
+        payload = dict(payload)
         if 'from_whom' in payload:
             payload['from'] = payload.pop('from_whom')
         if 'mobile_phone' in payload:
@@ -166,8 +543,8 @@ class Request(BaseRequest):
     def put(self, path: str, payload: dict = None):
         return self("PUT", path, payload)
 
-    def get(self, path: str, payload: Optional[dict] = None):
-        return self("GET", path, payload)
+    def get(self, path: str, payload: Optional[dict] = None, raw: bool = False):
+        return self("GET", path, payload, raw)
 
     def delete(self, path: str, payload: dict = None):
         return self("DELETE", path, payload)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import random
+from typing import Iterable, Optional
+
+from .enums import EndpointGroup
+from .exceptions import BadRequest, ConnectError, EskizException, RequestTimeout
+
+__all__ = ['RetryPolicy', 'Retry']
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    :param max_attempts: Max number of attempts including the first one
+    :param backoff: Delay before the second attempt, doubled for each next attempt
+    :param max_backoff: Upper bound of the delay
+    :param deadline: Total time in seconds for all the attempts of one call, None means no limit
+    :param jitter: Randomize the delay between 0 and the backoff
+    :param retry_statuses: Response status codes to retry. Retry-After of 429 responses is honored
+    :param retry_connect_errors: Retry when the request couldn't be sent
+    :param retry_timeouts: Retry when the request was sent, but the response didn't arrive in time
+    """
+
+    __slots__ = (
+        "max_attempts",
+        "backoff",
+        "max_backoff",
+        "deadline",
+        "jitter",
+        "retry_statuses",
+        "retry_connect_errors",
+        "retry_timeouts",
+    )
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            backoff: float = 0.5,
+            max_backoff: float = 8.0,
+            deadline: Optional[float] = 30.0,
+            jitter: bool = True,
+            retry_statuses: Iterable[int] = RETRY_STATUSES,
+            retry_connect_errors: bool = True,
+            retry_timeouts: bool = True,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_connect_errors = retry_connect_errors
+        self.retry_timeouts = retry_timeouts
+
+    def is_retryable(self, error: EskizException) -> bool:
+        if isinstance(error, ConnectError):
+            return self.retry_connect_errors
+        if isinstance(error, RequestTimeout):
+            return self.retry_timeouts
+        if isinstance(error, BadRequest):
+            return error.status_code in self.retry_statuses
+        return False
+
+    def backoff_delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        if self.jitter:
+            return random.uniform(0, delay)
+        return delay
+
+    def next_delay(self, error: EskizException, attempt: int, elapsed: float) -> Optional[float]:
+        """
+        :param error: Error of the attempt
+        :param attempt: Number of the failed attempt, starting from 0
+        :param elapsed: Seconds since the first attempt
+        :return: Seconds to wait before the next attempt, None if the error must be raised
+        """
+        if attempt + 1 >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = getattr(error, 'retry_after', None)
+        if delay is None:
+            delay = self.backoff_delay(attempt)
+        if self.deadline is not None and elapsed + delay > self.deadline:
+            return None
+        return delay
+
+
+# Sending is not idempotent, retry only when the message surely wasn't accepted
+SEND_POLICY = RetryPolicy(retry_statuses=(429,), retry_timeouts=False)
+
+# POST endpoints which only read
+READ_ONLY_POSTS = frozenset({"/user/totals"})
+
+
+class Retry:
+    """
+    Retry policies of the requests.
+
+    :param default: Policy of the idempotent requests: reports, GET/PUT/DELETE of templates and contacts etc.
+    :param send: Policy of the sends without user_sms_id and of the other non-idempotent writes
+        (creating contacts and templates). By default only connect errors and 429 are retried
+        to avoid duplicates
+    :param keyed_send: Policy of the sends with user_sms_id and of the batches. Eskiz doesn't document
+        deduplication by user_sms_id, so by default it's the same as `send`
+    """
+
+    __slots__ = ("default", "send", "keyed_send")
+
+    def __init__(
+            self,
+            default: RetryPolicy = None,
+            send: RetryPolicy = None,
+            keyed_send: RetryPolicy = None,
+    ):
+        self.default = default or RetryPolicy()
+        self.send = send or SEND_POLICY
+        self.keyed_send = keyed_send or self.send
+
+    def policy(self, group: EndpointGroup, payload: Optional[dict], method: str = None,
+               path: str = None) -> RetryPolicy:
+        if group == EndpointGroup.BATCH:
+            return self.keyed_send
+        if group == EndpointGroup.SEND:
+            if payload and payload.get('user_sms_id') is not None:
+                return self.keyed_send
+            return self.send
+        if method == "POST" and path not in READ_ONLY_POSTS:
+            return self.send
+        return self.default
@@ -0,0 +1,217 @@
+"""
+Local registry of the Eskiz templates with precompiled renderers.
+
+    registry = TemplateRegistry().refresh(eskiz)  # one get_templates request
+    otp = registry["otp"]                    # by name or id
+    otp.render(code=1234)
+
+    # column-oriented batch, the columns are checked once, not per message
+    texts = otp.render_many(code=[1234, 5678])
+    eskiz.send_batch(messages=otp.batch_messages(to=phones, user_sms_id=ids, code=codes), dispatch_id=1)
+
+Placeholders are named `{code}` or positional `%w` (a word) and `%d` (a number) as in the Eskiz templates,
+positional ones are passed as `_0`, `_1`, ... by their order.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+
+from .exceptions import TemplateError
+
+if TYPE_CHECKING:
+    from .async_ import EskizSMS
+    from .eskiz import EskizSMS as SyncEskizSMS
+    from .types import Response
+
+__all__ = ['CompiledTemplate', 'TemplateRegistry', 'compile_template']
+
+PLACEHOLDER_RE = re.compile(r"\{(\w+)\}|%([wd])")
+
+
+class CompiledTemplate:
+    """
+    Template text compiled to a %-format string, rendering is one string formatting per message.
+    """
+
+    __slots__ = ("id", "name", "text", "status", "fields", "numeric_fields", "_format", "_order")
+
+    def __init__(self, text: str, id: int = None, name: str = None, status: str = None):  # noqa
+        self.id = id
+        self.name = name
+        self.text = text
+        self.status = status
+        parts: List[str] = []
+        order: List[str] = []
+        numeric = set()
+        position = 0
+        end = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            parts.append(text[end:match.start()].replace("%", "%%"))
+            if match.group(1) is not None:
+                field = match.group(1)
+            else:
+                field = f"_{position}"
+                position += 1
+                if match.group(2) == "d":
+                    numeric.add(field)
+            parts.append("%s")
+            order.append(field)
+            end = match.end()
+        parts.append(text[end:].replace("%", "%%"))
+        self._format = "".join(parts)
+        # fields in the order of the placeholders, a field can be repeated
+        self._order: Tuple[str, ...] = tuple(order)
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(order))
+        self.numeric_fields = frozenset(numeric)
+
+    def __repr__(self):
+        return f"CompiledTemplate(id={self.id!r}, name={self.name!r}, fields={self.fields!r})"
+
+    def check(self, fields: Iterable[str], strict: bool = False):
+        """Raises TemplateError when a field is missing, or is unknown with strict=True"""
+        fields = set(fields)
+        missing = [field for field in self.fields if field not in fields]
+        if missing:
+            raise TemplateError(message=f"Template {self.name or self.id} requires {', '.join(missing)}")
+        if strict:
+            unknown = sorted(fields.difference(self.fields))
+            if unknown:
+                raise TemplateError(message=f"Template {self.name or self.id} has no {', '.join(unknown)}")
+
+    def _check_numeric(self, field: str, values: Iterable[Any]):
+        for value in values:
+            if not str(value).isdigit():
+                raise TemplateError(message=f"{field} must be a number, got {value!r}")
+
+    def render(self, *args: Any, **values: Any) -> str:
+        """Positional arguments fill %w/%d placeholders, keyword ones are the named fields"""
+        for i, value in enumerate(args):
+            values[f"_{i}"] = value
+        self.check(values)
+        for field in self.numeric_fields:
+            self._check_numeric(field, (values[field],))
+        if not self._order:
+            return self._format % ()
+        return self._format % tuple(values[field] for field in self._order)
+
+    def _columns(self, columns: Mapping[str, Sequence[Any]], validate: bool) -> Tuple[int, List[Sequence[Any]]]:
+        self.check(columns)
+        sizes = {len(columns[field]) for field in self.fields}
+        if len(sizes) > 1:
+            raise TemplateError(message="All the columns must have the same length")
+        if validate:
+            for field in self.numeric_fields:
+                self._check_numeric(field, columns[field])
+        return (sizes.pop() if sizes else 0), [columns[field] for field in self._order]
+
+    def render_many(self, columns: Mapping[str, Sequence[Any]] = None, *, validate: bool = True,
+                    **kwargs: Sequence[Any]) -> List[str]:
+        """
+        Renders the messages from the columns of the values, e.g. render_many(name=names, code=codes).
+        The columns are checked once, `validate=False` skips the check of the %d values.
+        """
+        columns = {**(columns or {}), **kwargs}
+        size, ordered = self._columns(columns, validate)
+        if not ordered:
+            return [self._format % ()] * size
+        template = self._format
+        return [template % row for row in zip(*ordered)]
+
+    def batch_messages(self, to: Sequence[Any], user_sms_id: Sequence[str], *, validate: bool = True,
+                       **columns: Sequence[Any]) -> List[dict]:
+        """Messages for send_batch/send_batch_chunked"""
+        if len(to) != len(user_sms_id):
+            raise TemplateError(message="to and user_sms_id must have the same length")
+        texts = self.render_many(columns, validate=validate) if self.fields else [self._format % ()] * len(to)
+        if len(texts) != len(to):
+            raise TemplateError(message="All the columns must have the same length")
+        return [
+            {"user_sms_id": sms_id, "to": phone, "text": text}
+            for phone, sms_id, text in zip(to, user_sms_id, texts)
+        ]
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text)
+
+
+def _template_items(data: Any) -> List[dict]:
+    if isinstance(data, dict):
+        for key in ("result", "data", "templates"):
+            if isinstance(data.get(key), list):
+                return data[key]
+        return []
+    return data if isinstance(data, list) else []
+
+
+class TemplateRegistry:
+    """Templates indexed by id and name"""
+
+    def __init__(self, templates: Iterable[CompiledTemplate] = ()):
+        self.by_id: Dict[int, CompiledTemplate] = {}
+        self.by_name: Dict[str, CompiledTemplate] = {}
+        for template in templates:
+            self.add(template)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self) -> Iterator[CompiledTemplate]:
+        return iter(self.by_id.values())
+
+    def __contains__(self, key: Union[int, str]) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: Union[int, str]) -> CompiledTemplate:
+        template = self.get(key)
+        if template is None:
+            raise KeyError(key)
+        return template
+
+    def get(self, key: Union[int, str]) -> Optional[CompiledTemplate]:
+        """Template by id or name"""
+        if isinstance(key, int):
+            return self.by_id.get(key)
+        return self.by_name.get(key)
+
+    def add(self, template: CompiledTemplate):
+        if template.id is not None:
+            old = self.by_id.get(template.id)
+            if old is not None and old.name is not None and self.by_name.get(old.name) is old:
+                del self.by_name[old.name]
+            self.by_id[template.id] = template
+        if template.name is not None:
+            self.by_name[template.name] = template
+
+    def load(self, response: Response) -> "TemplateRegistry":
+        """
+        Replaces the templates with the ones of get_templates response.
+        Raises TemplateError if the response has an invalid template id, the registry isn't changed then
+        """
+        templates = []
+        for item in _template_items(response.data):
+            if not isinstance(item, dict):
+                continue
+            text = item.get('text', item.get('template', item.get('original_text')))
+            if text is None:
+                continue
+            template_id = item.get('id')
+            if template_id is not None:
+                try:
+                    template_id = int(template_id)
+                except (TypeError, ValueError):
+                    raise TemplateError(message=f"Invalid template id {template_id!r}") from None
+            templates.append(CompiledTemplate(text, id=template_id, name=item.get('name'), status=item.get('status')))
+        self.by_id.clear()
+        self.by_name.clear()
+        for template in templates:
+            self.add(template)
+        return self
+
+    def refresh(self, eskiz: SyncEskizSMS) -> "TemplateRegistry":
+        """Loads the templates from get_templates"""
+        return self.load(eskiz.get_templates())
+
+    async def arefresh(self, eskiz: EskizSMS) -> "TemplateRegistry":
+        return self.load(await eskiz.get_templates())
@@ -1,9 +1,40 @@
-from dotenv import get_key, set_key
+import asyncio
+import base64
+import json
+import threading
+import time
+from functools import partial
+from typing import Optional
 
+from .enums import HookEvent
+from .hooks import Event, Hooks
 from .logging import logger
 from .request import BaseRequest
+from .token_store import ESKIZ_TOKEN_KEY, EnvTokenStore, TokenStore  # noqa: F401
 
-ESKIZ_TOKEN_KEY = "ESKIZ_TOKEN"
+DEFAULT_REFRESH_MARGIN = 300
+# tolerated clock skew between us and the API
+EXPIRY_LEEWAY = 5
+STORE_LOCK_POLL_INTERVAL = 0.05
+
+
+def _jwt_claim(token: str, name: str) -> Optional[float]:
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        value = json.loads(base64.urlsafe_b64decode(payload)).get(name)
+        return float(value) if value is not None else None
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return None
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """Returns `exp` claim of the JWT as unix time, signature is not verified"""
+    return _jwt_claim(token, 'exp')
+
+
+def _is_expired(expires_at: Optional[float]) -> bool:
+    return expires_at is not None and time.time() >= expires_at - EXPIRY_LEEWAY
 
 
 class Token(BaseRequest):
@@ -15,6 +46,15 @@ class Token(BaseRequest):
         "_credentials",
         "updated_at",
         "__token_checked",
+        "_http_client",
+        "_lock",
+        "_inflight",
+        "refresh_margin",
+        "_expires_at",
+        "_lifetime",
+        "_refresh_thread",
+        "store",
+        "_hooks",
     )
 
     def __init__(
@@ -25,31 +65,98 @@ class Token(BaseRequest):
             env_file_path=None,
             auto_update: bool = True,
             is_async: bool = False,
+            http_client=None,
+            refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+            store: TokenStore = None,
+            hooks: Hooks = None,
     ):
+        """
+        :param refresh_margin: Seconds before the expiry of the token to refresh it in the background,
+            at most half of the token lifetime is used
+        :param store: Storage of the token shared with other instances or processes,
+            with save_token=True the env file is used by default
+        :param hooks: Instrumentation hooks, token_refresh event is emitted on every login
+        """
         self._is_async = is_async
+        self._http_client = http_client
+        self._hooks = hooks
         self.auto_update = auto_update
         self.save_token = save_token
 
+        self.refresh_margin = refresh_margin
         self._value = None
+        self._expires_at = None
+        self._lifetime = None
         self._credentials = dict(email=email, password=password)
 
         if save_token:
             if env_file_path is None:
                 env_file_path = '.env'
             self.env_file_path = env_file_path
+            if store is None:
+                store = EnvTokenStore(env_file_path)
+        self.store = store
 
         self.__token_checked = False
+        # single-flight of the login/check: lock for threads, shared future for coroutines
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._refresh_thread = None
 
     def set(self, value):
         self._value = value
+        self._expires_at = jwt_expiry(value) if value else None
+        self._lifetime = None
+        if self._expires_at is not None:
+            # without `iat` the lifetime is counted from now, it's what is left of the token
+            issued_at = _jwt_claim(value, 'iat')
+            self._lifetime = self._expires_at - (issued_at if issued_at is not None else time.time())
+
+    @property
+    def expires_at(self) -> Optional[float]:
+        return self._expires_at
+
+    def _is_expired(self) -> bool:
+        return _is_expired(self._expires_at)
 
-    def _save_to_env(self):
-        set_key(self.env_file_path, key_to_set=ESKIZ_TOKEN_KEY,
-                value_to_set=self._value)
-        logger.info(f"Eskiz token saved to {self.env_file_path}")
+    def _expires_soon(self) -> bool:
+        if self._expires_at is None:
+            return False
+        # the margin longer than the token lifetime would refresh it on every call
+        margin = min(self.refresh_margin, max(self._lifetime, 0) / 2)
+        return time.time() >= self._expires_at - margin
 
-    def _get_from_env(self):
-        return get_key(dotenv_path=self.env_file_path, key_to_get=ESKIZ_TOKEN_KEY)
+    def _check_expiry(self):
+        """Validates the token locally if it has `exp` claim, expired token is dropped"""
+        if self._value and not self.__token_checked and self._expires_at is not None:
+            if self._is_expired():
+                self.set(None)
+            else:
+                self.__token_checked = True
+
+    def _use_stored(self, rejected: Optional[str]) -> bool:
+        """Takes the token saved by another instance, if it isn't the rejected one"""
+        value = self.store.load()
+        if not value or value == rejected:
+            return False
+        expires_at = jwt_expiry(value)
+        if _is_expired(expires_at):
+            return False
+        self.set(value)
+        self.__token_checked = expires_at is not None
+        return True
+
+    def _login(self, rejected: Optional[str] = None):
+        if self.store is None:
+            self.set(self._get_new_token())
+            return
+        self.store.acquire()
+        try:
+            if not self._use_stored(rejected):
+                self.set(self._get_new_token())
+                self.store.save(self._value)
+        finally:
+            self.store.release()
 
     def __str__(self):
         if self._value:
@@ -58,38 +165,79 @@ class Token(BaseRequest):
 
     __repr__ = __str__
 
-    def _get(self, get_new: bool = False):
-        if get_new:
-            return self._get_new_token()
+    def _get(self, get_new: bool = False, invalid_token: str = None):
+        if not get_new and self._value and self.__token_checked:
+            if not self._expires_soon():
+                return self._value
+            if not self._is_expired():
+                self._refresh_in_background()
+                return self._value
+            get_new, invalid_token = True, self._value
 
-        if self._value and self.__token_checked:
-            return self._value
+        with self._lock:
+            if get_new:
+                if invalid_token is None or not self._value or self._value == invalid_token:
+                    self._login(invalid_token or self._value)
+                return self._value
 
-        if not self._value:
-            if self.save_token:
-                self._value = self._get_from_env()
+            if not self._value and self.store is not None:
+                self.set(self.store.load())
+            self._check_expiry()
             if not self._value:
-                self._value = self._get_new_token()
-                if self.save_token:
-                    self._save_to_env()
-        if not self.__token_checked:
-            self._check()
+                self._login()
+            if not self.__token_checked:
+                self._check()
+            if self._expires_soon():
+                self._refresh_in_background()
 
-        return self._value
+            return self._value
 
-    def get(self, get_new: bool = False):
+    def _refresh_in_background(self):
+        thread = self._refresh_thread
+        if thread is not None and thread.is_alive():
+            return
+        self._refresh_thread = threading.Thread(target=self._background_refresh, args=(self._value,), daemon=True)
+        self._refresh_thread.start()
+
+    def _background_refresh(self, value: str):
+        try:
+            self._get(get_new=True, invalid_token=value)
+        except Exception as e:
+            logger.warning(f"Eskiz token refresh failed: {e!r}")
+
+    def get(self, get_new: bool = False, invalid_token: str = None):
+        """
+        :param get_new: Get the new token from the API
+        :param invalid_token: The token rejected by the API.
+            If it was already replaced by another caller, the current token is returned without login
+        """
         if self._is_async:
-            return self._aget(get_new)
-        return self._get(get_new)
+            return self._aget(get_new, invalid_token)
+        return self._get(get_new, invalid_token)
+
+    def _refresh_event(self) -> Optional[Event]:
+        if not self._hooks:
+            return None
+        return Event(HookEvent.TOKEN_REFRESH, "POST", "/auth/login")
+
+    def _emit_refresh(self, event: Optional[Event], error: Exception = None):
+        if event is not None:
+            self._hooks.emit(event.finish(HookEvent.TOKEN_REFRESH, error))
 
     def _get_new_token(self) -> str:
-        response = self._request(
-            self._prepare_request(
-                "POST",
-                "/auth/login",
-                self._credentials
+        event = self._refresh_event()
+        try:
+            response = self._request(
+                self._prepare_request(
+                    "POST",
+                    "/auth/login",
+                    self._credentials
+                )
             )
-        )
+        except Exception as e:
+            self._emit_refresh(event, e)
+            raise
+        self._emit_refresh(event)
         self.__token_checked = True
         return response.data['data']['token']
 
@@ -106,25 +254,70 @@ class Token(BaseRequest):
         self.__token_checked = True
 
     # =====Async functions==== #
-    async def _aget(self, get_new: bool = False):
+    async def _aget(self, get_new: bool = False, invalid_token: str = None):
+        if not get_new and self._value and self.__token_checked:
+            if not self._expires_soon():
+                return self._value
+            if not self._is_expired():
+                self._start_flight(partial(self._arefresh, self._value))
+                return self._value
+            get_new, invalid_token = True, self._value
+
+        if self._inflight is not None:
+            value = await asyncio.shield(self._inflight)
+            if not get_new or value != invalid_token:
+                return value
+
         if get_new:
-            return await self._aget_new_token()
+            if invalid_token is not None and self._value and self._value != invalid_token:
+                return self._value
+            return await asyncio.shield(self._start_flight(partial(self._arefresh, invalid_token or self._value)))
+        value = await asyncio.shield(self._start_flight(self._aload))
+        if self._expires_soon():
+            self._start_flight(partial(self._arefresh, self._value))
+        return value
 
-        if self._value and self.__token_checked:
-            return self._value
+    def _start_flight(self, func) -> asyncio.Future:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(func())
+            self._inflight.add_done_callback(self._clear_inflight)
+        return self._inflight
+
+    def _clear_inflight(self, future: asyncio.Future):
+        if self._inflight is future:
+            self._inflight = None
+        # waiters get the error through the shield, background refresh has nobody to receive it
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Eskiz token refresh failed: {future.exception()!r}")
 
+    async def _aload(self):
+        if not self._value and self.store is not None:
+            self.set(self.store.load())
+        self._check_expiry()
         if not self._value:
-            if self.save_token:
-                self._value = self._get_from_env()
-            if not self._value:
-                self._value = await self._aget_new_token()
-                if self.save_token:
-                    self._save_to_env()
+            await self._alogin()
         if not self.__token_checked:
             await self._acheck()
+        return self._value
 
+    async def _arefresh(self, rejected: Optional[str] = None):
+        await self._alogin(rejected)
         return self._value
 
+    async def _alogin(self, rejected: Optional[str] = None):
+        if self.store is None:
+            self.set(await self._aget_new_token())
+            return
+        # don't block the event loop while another process refreshes the token
+        while not self.store.acquire(blocking=False):
+            await asyncio.sleep(STORE_LOCK_POLL_INTERVAL)
+        try:
+            if not self._use_stored(rejected):
+                self.set(await self._aget_new_token())
+                self.store.save(self._value)
+        finally:
+            self.store.release()
+
     async def _acheck(self):
         await self._a_request(
             self._prepare_request(
@@ -138,12 +331,18 @@ class Token(BaseRequest):
         self.__token_checked = True
 
     async def _aget_new_token(self):
-        response = await self._a_request(
-            self._prepare_request(
-                "POST",
-                "/auth/login",
-                self._credentials
+        event = self._refresh_event()
+        try:
+            response = await self._a_request(
+                self._prepare_request(
+                    "POST",
+                    "/auth/login",
+                    self._credentials
+                )
             )
-        )
+        except Exception as e:
+            self._emit_refresh(event, e)
+            raise
+        self._emit_refresh(event)
         self.__token_checked = True
         return response.data['data']['token']
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from dotenv import get_key, set_key
+
+from .logging import logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+__all__ = ['TokenStore', 'MemoryTokenStore', 'FileTokenStore', 'EnvTokenStore']
+
+ESKIZ_TOKEN_KEY = "ESKIZ_TOKEN"
+
+
+class TokenStore:
+    """
+    Storage of the token shared between Token instances.
+    acquire/release guard the refresh, so only one of the sharing instances logs in at a time.
+    """
+
+    __slots__ = ()
+
+    def load(self) -> Optional[str]:
+        raise NotImplementedError
+
+    def save(self, token: str):
+        raise NotImplementedError
+
+    def acquire(self, blocking: bool = True) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+
+class MemoryTokenStore(TokenStore):
+    """Shares the token between the instances in the same process"""
+
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self, token: str = None):
+        self._value = token
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[str]:
+        return self._value
+
+    def save(self, token: str):
+        self._value = token
+
+    def acquire(self, blocking: bool = True) -> bool:
+        return self._lock.acquire(blocking)
+
+    def release(self):
+        self._lock.release()
+
+
+class FileTokenStore(TokenStore):
+    """
+    Shares the token between processes through a file.
+    Writes are atomic (temp file + rename), refresh is guarded with flock on `<path>.lock`.
+    The file is read again only when it was replaced or modified.
+    """
+
+    __slots__ = ("path", "lock_path", "_thread_lock", "_lock_fd", "_cached", "_cached_version")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self._thread_lock = threading.Lock()
+        self._lock_fd = None
+        self._cached = None
+        self._cached_version = None
+
+    def _version(self) -> tuple:
+        # the mtime alone may not change between two writes on filesystems with coarse timestamps,
+        # the rename gives the file a new inode on every write
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self) -> Optional[str]:
+        with open(self.path) as f:
+            return f.read().strip() or None
+
+    def _write(self, token: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".eskiz-token-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(token)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load(self) -> Optional[str]:
+        try:
+            version = self._version()
+        except FileNotFoundError:
+            return None
+        if version != self._cached_version:
+            self._cached = self._read()
+            self._cached_version = version
+        return self._cached
+
+    def save(self, token: str):
+        self._write(token)
+        self._cached = token
+        self._cached_version = self._version()
+        logger.info(f"Eskiz token saved to {self.path}")
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            self._thread_lock.release()
+            return False
+        self._lock_fd = fd
+        return True
+
+    def release(self):
+        fd, self._lock_fd = self._lock_fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._thread_lock.release()
+
+
+class EnvTokenStore(FileTokenStore):
+    """Keeps the token as ESKIZ_TOKEN in the env file, used by save_token=True"""
+
+    __slots__ = ()
+
+    def _read(self) -> Optional[str]:
+        return get_key(dotenv_path=self.path, key_to_get=ESKIZ_TOKEN_KEY)
+
+    def _write(self, token: str):
+        set_key(self.path, key_to_set=ESKIZ_TOKEN_KEY, value_to_set=token)
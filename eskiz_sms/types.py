@@ -1,48 +1,374 @@
-from dataclasses import dataclass
+"""
+Models of the API responses.
+
+The models are plain classes with __slots__, all the fields default to None.
+Unknown keys of the API are kept in `extra` instead of failing the construction:
+
+    user = User(**data)
+    user.extra            # {'new_field': ...} or None
+
+Datetime fields keep the API string until they are read, then it's parsed once.
+The models aren't dataclasses, use `to_dict()` instead of dataclasses.asdict.
+"""
 from datetime import datetime
-from typing import Union, Optional
-
-
-@dataclass
-class Response:
-    id: Optional[str] = None
-    status: Optional[str] = None
-    data: Optional[Union[dict, list]] = None
-    message: Optional[Union[str, dict]] = None
-
-
-@dataclass
-class User:
-    id: Optional[int] = None
-    name: Optional[str] = None
-    email: Optional[str] = None
-    role: Optional[str] = None
-    api_token: Optional[str] = None
-    status: Optional[str] = None
-    sms_api_login: Optional[str] = None
-    sms_api_password: Optional[str] = None
-    uz_price: Optional[int] = None
-    ucell_price: Optional[int] = None
-    test_ucell_price: Optional[int] = None
-    balance: Optional[int] = None
-    is_vip: Optional[bool] = None
-    host: Optional[str] = None
-    created_at: Optional[datetime] = None
-    updated_at: Optional[datetime] = None
-
-
-@dataclass
-class Contact:
-    id: Optional[int] = None
-    user_id: Optional[int] = None
-    group: Optional[str] = None
-    name: Optional[str] = None
-    email: Optional[str] = None
-    mobile_phone: Optional[str] = None
-    created_at: Optional[datetime] = None
-    updated_at: Optional[datetime] = None
-
-
-@dataclass
-class ContactCreated:
-    contact_id: int
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar, Union
+
+__all__ = [
+    'Model',
+    'Response',
+    'User',
+    'Contact',
+    'ContactCreated',
+    'UserMessage',
+    'parse_datetime',
+]
+
+M = TypeVar("M", bound="Model")
+
+DateTimeValue = Union[datetime, str, None]
+
+
+def parse_datetime(value: str) -> Optional[datetime]:
+    """Parses the API datetime, e.g. "2023-01-01 10:00:00" or "2023-01-01T10:00:00.000000Z", None if it's invalid"""
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _datetime_property(name: str) -> property:
+    """Property over the `_<name>` slot, the string is parsed on the first read and kept if it's invalid"""
+    slot = "_" + name
+
+    def get(self) -> DateTimeValue:
+        value = getattr(self, slot)
+        if isinstance(value, str):
+            parsed = parse_datetime(value)
+            if parsed is not None:
+                setattr(self, slot, parsed)
+                return parsed
+        return value
+
+    def set(self, value: DateTimeValue):
+        setattr(self, slot, value)
+
+    return property(get, set)
+
+
+def _compile_build_many(cls: type) -> Callable[[Iterable[dict], type], list]:
+    """
+    Function building the models of the class from the dicts, it's generated once per class
+    the same way dataclasses generate __init__, so each field is a plain slot store
+    """
+    lines = [
+        "def build_many(items, cls):",
+        "    new = cls.__new__",
+        "    result = []",
+        "    append = result.append",
+        "    for item in items:",
+        "        model = new(cls)",
+        "        get = item.get",
+    ]
+    for field in cls._fields:
+        # datetime fields are properties over the `_<name>` slots
+        slot = "_" + field if isinstance(getattr(cls, field, None), property) else field
+        lines.append(f"        model.{slot} = get({field!r})")
+    lines += [
+        "        if item.keys() <= fields:",
+        "            model.extra = None",
+        "        else:",
+        "            model.extra = {key: value for key, value in item.items() if key not in fields}",
+        "        append(model)",
+        "    return result",
+    ]
+    namespace = {"fields": frozenset(cls._fields)}
+    exec("\n".join(lines), namespace)
+    return namespace["build_many"]
+
+
+class Model:
+    __slots__ = ("extra",)
+
+    # names of the fields in the order of __init__ arguments
+    _fields: Tuple[str, ...] = ()
+
+    extra: Optional[Dict[str, Any]]
+
+    @classmethod
+    def from_dict(cls: Type[M], data: dict) -> M:
+        """Unknown keys are kept in `extra`"""
+        return cls(**data)
+
+    @classmethod
+    def from_dicts(cls: Type[M], items: Iterable[dict]) -> List[M]:
+        """
+        Builds the models from the API dicts, unknown keys are kept in `extra`.
+        The instances are created without __init__, the values are stored right into the slots
+        """
+        build = cls.__dict__.get("_build_many")
+        if build is None:
+            build = _compile_build_many(cls)
+            cls._build_many = build
+        return build(items, cls)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Fields and the extra keys, datetime fields are parsed"""
+        data = {field: getattr(self, field) for field in self._fields}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self._fields)
+        return f"{type(self).__name__}({values})"
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self._fields) + (self.extra,)
+
+    def __setstate__(self, state):
+        for field, value in zip(self._fields, state):
+            setattr(self, field, value)
+        self.extra = state[-1]
+
+
+class Response(Model):
+    __slots__ = ("id", "status", "data", "message")
+
+    _fields = ("id", "status", "data", "message")
+
+    def __init__(
+            self,
+            id: Optional[str] = None,
+            status: Optional[str] = None,
+            data: Optional[Union[dict, list]] = None,
+            message: Optional[Union[str, dict]] = None,
+            **extra: Any
+    ):
+        self.id = id
+        self.status = status
+        self.data = data
+        self.message = message
+        self.extra = extra or None
+
+
+class User(Model):
+    __slots__ = (
+        "id",
+        "name",
+        "email",
+        "role",
+        "api_token",
+        "status",
+        "sms_api_login",
+        "sms_api_password",
+        "uz_price",
+        "ucell_price",
+        "test_ucell_price",
+        "balance",
+        "is_vip",
+        "host",
+        "_created_at",
+        "_updated_at",
+    )
+
+    _fields = (
+        "id",
+        "name",
+        "email",
+        "role",
+        "api_token",
+        "status",
+        "sms_api_login",
+        "sms_api_password",
+        "uz_price",
+        "ucell_price",
+        "test_ucell_price",
+        "balance",
+        "is_vip",
+        "host",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+            self,
+            id: Optional[int] = None,
+            name: Optional[str] = None,
+            email: Optional[str] = None,
+            role: Optional[str] = None,
+            api_token: Optional[str] = None,
+            status: Optional[str] = None,
+            sms_api_login: Optional[str] = None,
+            sms_api_password: Optional[str] = None,
+            uz_price: Optional[int] = None,
+            ucell_price: Optional[int] = None,
+            test_ucell_price: Optional[int] = None,
+            balance: Optional[int] = None,
+            is_vip: Optional[bool] = None,
+            host: Optional[str] = None,
+            created_at: DateTimeValue = None,
+            updated_at: DateTimeValue = None,
+            **extra: Any
+    ):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+        self.api_token = api_token
+        self.status = status
+        self.sms_api_login = sms_api_login
+        self.sms_api_password = sms_api_password
+        self.uz_price = uz_price
+        self.ucell_price = ucell_price
+        self.test_ucell_price = test_ucell_price
+        self.balance = balance
+        self.is_vip = is_vip
+        self.host = host
+        self._created_at = created_at
+        self._updated_at = updated_at
+        self.extra = extra or None
+
+    created_at = _datetime_property("created_at")
+    updated_at = _datetime_property("updated_at")
+
+
+class Contact(Model):
+    __slots__ = ("id", "user_id", "group", "name", "email", "mobile_phone", "_created_at", "_updated_at")
+
+    _fields = ("id", "user_id", "group", "name", "email", "mobile_phone", "created_at", "updated_at")
+
+    def __init__(
+            self,
+            id: Optional[int] = None,
+            user_id: Optional[int] = None,
+            group: Optional[str] = None,
+            name: Optional[str] = None,
+            email: Optional[str] = None,
+            mobile_phone: Optional[str] = None,
+            created_at: DateTimeValue = None,
+            updated_at: DateTimeValue = None,
+            **extra: Any
+    ):
+        self.id = id
+        self.user_id = user_id
+        self.group = group
+        self.name = name
+        self.email = email
+        self.mobile_phone = mobile_phone
+        self._created_at = created_at
+        self._updated_at = updated_at
+        self.extra = extra or None
+
+    created_at = _datetime_property("created_at")
+    updated_at = _datetime_property("updated_at")
+
+
+class ContactCreated(Model):
+    __slots__ = ("contact_id",)
+
+    _fields = ("contact_id",)
+
+    def __init__(self, contact_id: Optional[int] = None, **extra: Any):
+        self.contact_id = contact_id
+        self.extra = extra or None
+
+
+class UserMessage(Model):
+    __slots__ = (
+        "id",
+        "user_id",
+        "dispatch_id",
+        "user_sms_id",
+        "request_id",
+        "nick",
+        "to",
+        "message",
+        "encoding",
+        "parts_count",
+        "price",
+        "is_ad",
+        "status",
+        "_sent_at",
+        "_submit_sm_resp_at",
+        "_delivery_sm_at",
+        "_created_at",
+        "_updated_at",
+    )
+
+    _fields = (
+        "id",
+        "user_id",
+        "dispatch_id",
+        "user_sms_id",
+        "request_id",
+        "nick",
+        "to",
+        "message",
+        "encoding",
+        "parts_count",
+        "price",
+        "is_ad",
+        "status",
+        "sent_at",
+        "submit_sm_resp_at",
+        "delivery_sm_at",
+        "created_at",
+        "updated_at",
+    )
+
+    def __init__(
+            self,
+            id: Optional[int] = None,
+            user_id: Optional[int] = None,
+            dispatch_id: Optional[int] = None,
+            user_sms_id: Optional[str] = None,
+            request_id: Optional[str] = None,
+            nick: Optional[str] = None,
+            to: Optional[str] = None,
+            message: Optional[str] = None,
+            encoding: Optional[int] = None,
+            parts_count: Optional[int] = None,
+            price: Optional[int] = None,
+            is_ad: Optional[bool] = None,
+            status: Optional[str] = None,
+            sent_at: DateTimeValue = None,
+            submit_sm_resp_at: DateTimeValue = None,
+            delivery_sm_at: DateTimeValue = None,
+            created_at: DateTimeValue = None,
+            updated_at: DateTimeValue = None,
+            **extra: Any
+    ):
+        self.id = id
+        self.user_id = user_id
+        self.dispatch_id = dispatch_id
+        self.user_sms_id = user_sms_id
+        self.request_id = request_id
+        self.nick = nick
+        self.to = to
+        self.message = message
+        self.encoding = encoding
+        self.parts_count = parts_count
+        self.price = price
+        self.is_ad = is_ad
+        self.status = status
+        self._sent_at = sent_at
+        self._submit_sm_resp_at = submit_sm_resp_at
+        self._delivery_sm_at = delivery_sm_at
+        self._created_at = created_at
+        self._updated_at = updated_at
+        self.extra = extra or None
+
+    sent_at = _datetime_property("sent_at")
+    submit_sm_resp_at = _datetime_property("submit_sm_resp_at")
+    delivery_sm_at = _datetime_property("delivery_sm_at")
+    created_at = _datetime_property("created_at")
+    updated_at = _datetime_property("updated_at")
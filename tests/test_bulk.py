@@ -0,0 +1,62 @@
+from eskiz_sms.bulk import BulkMessage, iter_chunks
+from eskiz_sms.mock import MockEskizServer
+
+
+async def _messages(n):
+    for i in range(n):
+        yield f"99890{i:07}", "message", f"sms{i}"
+
+
+class TestBulk:
+    async def test_send_bulk(self):
+        server = MockEskizServer()
+        server.rejected_phones.add("998900000003")
+        eskiz = server.async_client()
+        results = [result async for result in eskiz.send_bulk(_messages(20), concurrency=4)]
+        assert len(results) == 20
+        failed = [result for result in results if not result.ok]
+        assert [result.message.user_sms_id for result in failed] == ["sms3"]
+        assert len(server.sent) == 19
+        assert server.sent[0]["user_sms_id"] == "sms0"
+
+    async def test_send_bulk_iterable(self):
+        server = MockEskizServer()
+        eskiz = server.async_client()
+        messages = [BulkMessage("998901234567", "message"), ("998901234568", "message")]
+        results = [result async for result in eskiz.send_bulk(messages)]
+        assert all(result.ok for result in results)
+
+
+def _batch_messages(n):
+    for i in range(n):
+        yield {"user_sms_id": f"sms{i}", "to": f"99890{i:07}", "text": "message"}
+
+
+class TestBatchChunked:
+    def test_iter_chunks(self):
+        chunks = list(iter_chunks(_batch_messages(25), chunk_size=10))
+        assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+        chunks = list(iter_chunks(_batch_messages(25), max_payload_bytes=130))
+        assert all(len(chunk) == 2 for chunk in chunks[:-1])
+
+    def test_send_batch_chunked(self):
+        server = MockEskizServer()
+        server.rejected_dispatches.add(102)
+        eskiz = server.client()
+        result = eskiz.send_batch_chunked(
+            _batch_messages(45), dispatch_id=lambda index: 100 + index, chunk_size=10, parallelism=3
+        )
+        assert len(result) == 45
+        assert result.dispatch_ids == [100, 101, 102, 103, 104]
+        assert not result.ok
+        assert result["sms25"].dispatch_id == 102 and not result["sms25"].ok
+        assert result["sms44"].ok
+        assert sorted({message["dispatch_id"] for message in server.messages}) == [100, 101, 103, 104]
+
+    async def test_async_send_batch_chunked(self):
+        server = MockEskizServer()
+        eskiz = server.async_client()
+        result = await eskiz.send_batch_chunked(_batch_messages(45), dispatch_id=7, chunk_size=10)
+        assert result.ok
+        assert result.dispatch_ids == [7]
+        assert len(result.chunks) == 5
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from eskiz_sms.cache import ResponseCache, invalidated_paths
+from eskiz_sms.exceptions import ServerError
+from eskiz_sms.mock import MockEskizServer
+
+LIMIT = ("GET", "/user/get-limit")
+
+
+class TestResponseCache:
+    def test_ttl_and_lru(self):
+        cache = ResponseCache(max_size=2)
+        assert cache.load(("GET", "/a", ()), 0.01, lambda: 1) == 1
+        assert cache.load(("GET", "/a", ()), 0.01, lambda: 2) == 1
+        time.sleep(0.02)
+        assert cache.load(("GET", "/a", ()), 60, lambda: 3) == 3
+        cache.load(("GET", "/b", ()), 60, lambda: 4)
+        cache.load(("GET", "/c", ()), 60, lambda: 5)
+        assert len(cache) == 2
+        assert cache.load(("GET", "/a", ()), 60, lambda: 6) == 6
+
+    def test_single_flight(self):
+        cache = ResponseCache()
+        calls = []
+        started = threading.Event()
+
+        def loader():
+            calls.append(1)
+            started.set()
+            time.sleep(0.05)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.load(("GET", "/a", ()), 60, loader)))]
+        threads[0].start()
+        started.wait()
+        threads += [threading.Thread(target=lambda: results.append(cache.load(("GET", "/a", ()), 60, loader)))
+                    for _ in range(4)]
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ["value"] * 5
+        assert len(calls) == 1
+
+    def test_write_invalidates(self):
+        cache = ResponseCache()
+        assert cache.ttl("GET", "/template/5") == 300
+        assert cache.ttl("DELETE", "/contact/5") is None
+        cache.load(cache.key("GET", "/template", None), 60, lambda: "list")
+        cache.load(cache.key("GET", "/template/5", None), 60, lambda: "item")
+        cache.load(cache.key("GET", "/template/6", None), 60, lambda: "other")
+        cache.invalidate_write("PUT", "/template/5")
+        assert len(cache) == 1
+
+    def test_invalidated_paths(self):
+        assert invalidated_paths("PUT", "/template/5") == ("/template/5", "/template")
+        assert invalidated_paths("POST", "/message/sms/send") == ("/user/get-limit", "/user/totals")
+        assert invalidated_paths("POST", "/contact") == ()
+        assert invalidated_paths("GET", "/template") == ()
+
+    def test_unrelated_write_during_load(self):
+        cache = ResponseCache()
+        key = cache.key("GET", "/user/get-limit", None)
+
+        def loader(method, path):
+            cache.invalidate_write(method, path)
+            return "limit"
+
+        cache.load(key, 60, lambda: loader("PUT", "/contact/5"))
+        assert len(cache) == 1
+        cache.invalidate()
+        # a send finished while the limit was loaded, the loaded value may be stale
+        cache.load(key, 60, lambda: loader("POST", "/message/sms/send"))
+        assert len(cache) == 0
+
+
+class TestClient:
+    def test_cached(self):
+        server = MockEskizServer(balance=1000)
+        eskiz = server.client(cache=ResponseCache())
+        eskiz.get_limit()
+        assert eskiz.get_limit().data == {"balance": 1000}
+        assert server.calls.count(LIMIT) == 1
+        eskiz.totals(2023, user_id=1)
+        eskiz.totals(2023, user_id=1)
+        eskiz.totals(2024, user_id=1)
+        assert server.calls.count(("POST", "/user/totals")) == 2
+
+    def test_send_invalidates_limit(self):
+        server = MockEskizServer()
+        eskiz = server.client(cache=ResponseCache())
+        eskiz.get_limit()
+        eskiz.totals(2023, user_id=1)
+        eskiz.get_templates()
+        eskiz.send_sms("998901234567", "message")
+        eskiz.get_limit()
+        eskiz.totals(2023, user_id=1)
+        eskiz.get_templates()
+        assert server.calls.count(LIMIT) == 2
+        assert server.calls.count(("POST", "/user/totals")) == 2
+        assert server.calls.count(("GET", "/template")) == 1
+
+    def test_templates(self):
+        server = MockEskizServer()
+        eskiz = server.client(cache=ResponseCache())
+        eskiz.create_template("otp", "Code: %d")
+        assert eskiz.get_template(1).data["text"] == "Code: %d"
+        assert len(eskiz.get_templates().data) == 1
+        eskiz.update_template(1, "otp", "Your code: %d")
+        assert eskiz.get_template(1).data["text"] == "Your code: %d"
+        assert eskiz.get_templates().data[0]["text"] == "Your code: %d"
+        eskiz.create_template("promo", "Sale")
+        assert len(eskiz.get_templates().data) == 2
+
+    def test_contact(self):
+        server = MockEskizServer()
+        server.contacts[1] = {"id": 1, "name": "Test", "group": "test", "mobile_phone": "998901234567"}
+        eskiz = server.client(cache=ResponseCache())
+        assert eskiz.get_contact(1).name == "Test"
+        eskiz.delete_contact(1)
+        assert eskiz.get_contact(1) is None
+
+    def test_errors_are_not_cached(self):
+        server = MockEskizServer()
+        eskiz = server.client(cache=ResponseCache())
+        eskiz.get_templates()
+        eskiz.cache.invalidate()
+        server.errors = [httpx.Response(500)]
+        with pytest.raises(ServerError):
+            eskiz.get_limit()
+        eskiz.get_limit()
+
+    async def test_async_single_flight(self):
+        server = MockEskizServer(balance=1000)
+        eskiz = server.async_client(cache=ResponseCache())
+        await eskiz.get_templates()
+        responses = await asyncio.gather(*(eskiz.get_limit() for _ in range(10)))
+        assert {response.data["balance"] for response in responses} == {1000}
+        assert server.calls.count(LIMIT) == 1
+        await eskiz.create_template("otp", "text")
+        assert len((await eskiz.get_templates()).data) == 1
+        await eskiz.aclose()
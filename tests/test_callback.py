@@ -0,0 +1,123 @@
+import asyncio
+import io
+import json
+
+from eskiz_sms.callback import (
+    ASGICallbackApp,
+    AsyncBatcher,
+    DeliveryReport,
+    ThreadedBatcher,
+    WSGICallbackApp,
+    parse_delivery_report,
+)
+
+PAYLOAD = {
+    "message_id": "4385062", "user_sms_id": "sms1", "country": "UZ",
+    "phone_number": "998991234567", "sms_count": "1",
+    "status": "DELIVER", "status_date": "2021-04-02 00:39:36", "extra": "ignored",
+}
+
+
+def _wsgi_call(app, body: bytes, method="POST", content_type="application/json"):
+    result = {}
+
+    def start_response(status, headers):
+        result["status"] = status
+
+    environ = {
+        "REQUEST_METHOD": method,
+        "CONTENT_TYPE": content_type,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    }
+    app(environ, start_response)
+    return result["status"]
+
+
+class TestDeliveryReport:
+    def test_parse(self):
+        report = parse_delivery_report(json.dumps(PAYLOAD).encode())
+        assert report.message_id == "4385062"
+        assert report.sms_count == 1
+        assert report.status_datetime.year == 2021
+        form = parse_delivery_report(b"message_id=1&status=DELIVER", "application/x-www-form-urlencoded")
+        assert form == DeliveryReport("1", status="DELIVER")
+
+    def test_wsgi(self):
+        batches = []
+        batcher = ThreadedBatcher(batches.append, max_batch_size=2, flush_interval=10)
+        app = WSGICallbackApp(batcher)
+        for _ in range(3):
+            assert _wsgi_call(app, json.dumps(PAYLOAD).encode()) == "200 OK"
+        assert _wsgi_call(app, b"not json").startswith("400")
+        assert _wsgi_call(app, b"", method="GET").startswith("405")
+        batcher.close()
+        assert [len(batch) for batch in batches] == [2, 1]
+
+    def test_queue_full(self):
+        batcher = ThreadedBatcher(lambda batch: None, max_queue_size=1)
+        batcher._thread = object()  # not started, nothing drains the queue
+        app = WSGICallbackApp(batcher)
+        assert _wsgi_call(app, json.dumps(PAYLOAD).encode()) == "200 OK"
+        assert _wsgi_call(app, json.dumps(PAYLOAD).encode()).startswith("503")
+
+    async def test_asgi(self):
+        batches = []
+
+        async def sink(batch):
+            batches.append(batch)
+
+        batcher = AsyncBatcher(sink, max_batch_size=100, flush_interval=10)
+        app = ASGICallbackApp(batcher)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        for _ in range(3):
+            messages = [{"type": "http.request", "body": json.dumps(PAYLOAD).encode(), "more_body": False}]
+
+            async def receive():
+                return messages.pop(0)
+
+            scope = {"type": "http", "method": "POST", "headers": [(b"content-type", b"application/json")]}
+            await app(scope, receive, send)
+        assert [message["status"] for message in sent if "status" in message] == [200, 200, 200]
+        await batcher.aclose()
+        assert [len(batch) for batch in batches] == [3]
+
+    async def test_aclose_during_flush(self):
+        batches = []
+        flushing = asyncio.Event()
+
+        async def sink(batch):
+            batches.append(batch)
+            flushing.set()
+            await asyncio.sleep(0.05)
+
+        batcher = AsyncBatcher(sink, max_batch_size=2, flush_interval=10)
+        for _ in range(3):
+            batcher.put(parse_delivery_report(json.dumps(PAYLOAD).encode()))
+        await flushing.wait()
+        await batcher.aclose()
+        assert [len(batch) for batch in batches] == [2, 1]
+
+    async def test_put_during_aclose(self):
+        batches = []
+        flushing = asyncio.Event()
+
+        async def sink(batch):
+            batches.append(batch)
+            flushing.set()
+            await asyncio.sleep(0.05)
+
+        batcher = AsyncBatcher(sink, max_batch_size=1, flush_interval=10)
+        report = parse_delivery_report(json.dumps(PAYLOAD).encode())
+        batcher.put(report)
+        await flushing.wait()
+        closing = asyncio.ensure_future(batcher.aclose())
+        await asyncio.sleep(0)
+        assert not batcher.put(report)
+        await closing
+        assert batcher._task is None
+        assert [len(batch) for batch in batches] == [1]
@@ -0,0 +1,113 @@
+import time
+
+import httpx
+import pytest
+
+from eskiz_sms.circuit import CircuitBreaker
+from eskiz_sms.enums import CircuitState, EndpointGroup
+from eskiz_sms.exceptions import BadRequest, ServerError, ServiceUnavailable
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.outbox import OutboxWorker, SQLiteOutbox
+
+
+class TestCircuitBreaker:
+    def test_states(self):
+        changes = []
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.01)
+        breaker.add_listener(lambda group, old, new: changes.append(new))
+        for _ in range(2):
+            breaker.before_request()
+            breaker.after_request(error=ServerError(status_code=500))
+        assert breaker.state() == CircuitState.OPEN
+        with pytest.raises(ServiceUnavailable) as e:
+            breaker.before_request()
+        assert 0 < e.value.retry_after <= 0.01
+
+        time.sleep(0.02)
+        assert breaker.state() == CircuitState.HALF_OPEN
+        breaker.before_request()
+        with pytest.raises(ServiceUnavailable):
+            # only one trial request at once
+            breaker.before_request()
+        breaker.after_request(error=ServerError(status_code=502))
+        assert breaker.state() == CircuitState.OPEN
+
+        time.sleep(0.02)
+        breaker.before_request()
+        breaker.after_request()
+        assert breaker.state() == CircuitState.CLOSED
+        assert changes == [CircuitState.OPEN, CircuitState.HALF_OPEN, CircuitState.OPEN,
+                           CircuitState.HALF_OPEN, CircuitState.CLOSED]
+
+    def test_late_result_of_old_request(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        old = breaker.before_request()
+        breaker.after_request(error=ServerError(status_code=500), generation=breaker.before_request())
+        assert breaker.state() == CircuitState.OPEN
+        time.sleep(0.02)
+        trial = breaker.before_request()
+        # the request started while the circuit was closed isn't a probe
+        breaker.after_request(generation=old)
+        assert breaker.state() == CircuitState.HALF_OPEN
+        with pytest.raises(ServiceUnavailable):
+            breaker.before_request()
+        breaker.after_request(generation=trial)
+        assert breaker.state() == CircuitState.CLOSED
+
+    def test_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2)
+        breaker.after_request(error=ServerError(status_code=500))
+        breaker.after_request(error=BadRequest(status_code=400))
+        breaker.after_request(error=ServerError(status_code=500))
+        assert breaker.state() == CircuitState.CLOSED
+
+    def test_group_thresholds(self):
+        breaker = CircuitBreaker(failure_threshold=5, thresholds={EndpointGroup.BATCH: 1})
+        breaker.after_request(EndpointGroup.BATCH, ServerError(status_code=500))
+        breaker.after_request(EndpointGroup.SEND, ServerError(status_code=500))
+        assert breaker.state(EndpointGroup.BATCH) == CircuitState.OPEN
+        assert breaker.state(EndpointGroup.SEND) == CircuitState.CLOSED
+        breaker.reset()
+        assert breaker.state(EndpointGroup.BATCH) == CircuitState.CLOSED
+
+
+class TestClient:
+    def test_shared(self):
+        server = MockEskizServer()
+        breaker = CircuitBreaker(failure_threshold=2)
+        first = server.client(circuit_breaker=breaker)
+        second = server.client(circuit_breaker=breaker)
+        first.get_limit()
+        second.get_limit()
+        server.errors = [httpx.Response(503), httpx.ConnectError("refused")]
+        for eskiz in (first, second):
+            with pytest.raises(Exception):
+                eskiz.send_sms("998901234567", "message")
+        calls = len(server.calls)
+        with pytest.raises(ServiceUnavailable):
+            second.send_sms("998901234567", "message")
+        assert len(server.calls) == calls
+        # other groups are not affected
+        first.get_limit()
+
+    async def test_async(self):
+        server = MockEskizServer()
+        eskiz = server.async_client(circuit_breaker=CircuitBreaker(failure_threshold=1))
+        await eskiz.get_limit()
+        server.errors = [httpx.Response(500)]
+        with pytest.raises(ServerError):
+            await eskiz.send_sms("998901234567", "message")
+        with pytest.raises(ServiceUnavailable):
+            await eskiz.send_sms("998901234567", "message")
+        await eskiz.aclose()
+
+    def test_outbox_postpones(self, tmp_path):
+        server = MockEskizServer()
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.after_request(EndpointGroup.SEND, ServerError(status_code=500))
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message", user_sms_id="sms1")
+        worker = OutboxWorker(outbox, server.client(circuit_breaker=breaker))
+        worker.run_once()
+        assert outbox.status("sms1") == "pending"
+        assert server.sent == []
@@ -0,0 +1,53 @@
+import httpx
+
+from eskiz_sms import EskizSMS, types
+from eskiz_sms.async_ import EskizSMS as EskizSMSAsync
+from eskiz_sms.mock import MockEskizServer
+
+
+class TestClient:
+    def test_shared_client(self):
+        server = MockEskizServer()
+        eskiz = server.client()
+        assert eskiz.token._http_client is eskiz._http_client
+        response = eskiz.send_sms("998991234567", "message")
+        assert type(response) == types.Response
+        assert server.calls == [("POST", "/auth/login"), ("POST", "/message/sms/send")]
+
+    def test_context_manager(self):
+        with EskizSMS("email", "password") as eskiz:
+            client = eskiz._http_client
+            assert isinstance(client, httpx.Client)
+        assert client.is_closed
+
+    def test_external_client_is_not_closed(self):
+        eskiz = MockEskizServer().client()
+        eskiz.close()
+        assert not eskiz._http_client.is_closed
+
+    async def test_async_shared_client(self):
+        server = MockEskizServer()
+        async with server.async_client() as eskiz:
+            assert eskiz.token._http_client is eskiz._http_client
+            response = await eskiz.send_sms("998991234567", "message")
+            assert type(response) == types.Response
+
+    async def test_async_context_manager(self):
+        async with EskizSMSAsync("email", "password") as eskiz:
+            client = eskiz._http_client
+            assert isinstance(client, httpx.AsyncClient)
+        assert client.is_closed
+
+    def test_payload_is_not_changed(self):
+        server = MockEskizServer()
+        eskiz = server.client()
+        payload = {"mobile_phone": "+998 99 123 45 67", "message": "message", "from_whom": "4546"}
+        eskiz._request.post("/message/sms/send", payload=payload)
+        assert payload == {"mobile_phone": "+998 99 123 45 67", "message": "message", "from_whom": "4546"}
+        assert server.sent[-1]["to"] == "998991234567"
+
+    def test_authorization_header_is_reused(self):
+        eskiz = MockEskizServer().client()
+        token = eskiz.token.get()
+        assert eskiz._request._auth_header(token) is eskiz._request._auth_header(token)
+        assert eskiz._request._auth_header("other") == {"Authorization": "Bearer other"}
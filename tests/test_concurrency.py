@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+
+from eskiz_sms.concurrency import AIMDLimiter
+from eskiz_sms.exceptions import BadRequest, ServerError, TooManyRequests
+from eskiz_sms.mock import MockEskizServer
+
+
+class TestAIMDLimiter:
+    async def test_limit(self):
+        limiter = AIMDLimiter(initial=2)
+        first = await limiter.acquire()
+        await limiter.acquire()
+        third = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not third.done()
+        assert limiter.waiting == 1
+        limiter.release(first)
+        await third
+        assert limiter.in_flight == 2
+
+    async def test_increase(self):
+        limiter = AIMDLimiter(initial=2, max_limit=3)
+        for _ in range(20):
+            started = [await limiter.acquire() for _ in range(limiter.limit)]
+            for started_at in started:
+                limiter.release(started_at)
+        assert limiter.limit == 3
+
+    async def test_not_increased_when_unused(self):
+        limiter = AIMDLimiter(initial=4)
+        for _ in range(20):
+            limiter.release(await limiter.acquire())
+        assert limiter.limit == 4
+
+    async def test_latency_threshold(self):
+        limiter = AIMDLimiter(initial=1, latency_threshold=0.001)
+        started_at = await limiter.acquire()
+        await asyncio.sleep(0.01)
+        limiter.release(started_at)
+        assert limiter.limit == 1
+
+    async def test_decrease_once_per_congestion(self):
+        limiter = AIMDLimiter(initial=8)
+        started = [await limiter.acquire() for _ in range(4)]
+        for started_at in started:
+            limiter.release(started_at, TooManyRequests(status_code=429))
+        assert limiter.limit == 4
+        limiter.release(await limiter.acquire(), ServerError(status_code=503))
+        assert limiter.limit == 2
+        limiter.release(await limiter.acquire(), BadRequest(status_code=400))
+        assert limiter.limit == 2
+
+    async def test_min_limit(self):
+        limiter = AIMDLimiter(initial=2, min_limit=2)
+        limiter.release(await limiter.acquire(), ServerError(status_code=500))
+        assert limiter.limit == 2
+
+    async def test_cancelled_waiter(self):
+        limiter = AIMDLimiter(initial=1)
+        started_at = await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release(started_at)
+        assert limiter.in_flight == 0
+        assert limiter.waiting == 0
+
+    async def test_client(self):
+        server = MockEskizServer()
+        limiter = AIMDLimiter(initial=4)
+        eskiz = server.async_client(concurrency_limiter=limiter)
+        await eskiz.get_limit()
+        server.errors = [httpx.Response(503)]
+        with pytest.raises(ServerError):
+            await eskiz.send_sms("998901234567", "message")
+        assert limiter.limit == 2
+        await asyncio.gather(*(eskiz.send_sms("998901234567", "message") for _ in range(10)))
+        assert len(server.sent) == 10
+        assert limiter.in_flight == 0
+        await eskiz.aclose()
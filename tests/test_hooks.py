@@ -0,0 +1,117 @@
+import httpx
+import pytest
+
+from eskiz_sms import exceptions
+from eskiz_sms.enums import EndpointGroup, HookEvent
+from eskiz_sms.hooks import Hooks
+from eskiz_sms.metrics import MetricsCollector, endpoint_label
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.retry import Retry, RetryPolicy
+
+FAST = RetryPolicy(max_attempts=3, backoff=0.001)
+
+
+def recorder(hooks: Hooks):
+    events = []
+    for event_type in HookEvent:
+        hooks.add(event_type, lambda event, t=event_type: events.append((t, event.endpoint, event.status_code)))
+    return events
+
+
+class TestHooks:
+    def test_events(self):
+        hooks = Hooks()
+        events = recorder(hooks)
+        eskiz = MockEskizServer().client(hooks=hooks)
+        eskiz.send_sms("998901234567", "Hello")
+        assert events == [
+            (HookEvent.BEFORE_REQUEST, "/auth/login", None),
+            (HookEvent.AFTER_RESPONSE, "/auth/login", 200),
+            (HookEvent.TOKEN_REFRESH, "/auth/login", None),
+            (HookEvent.BEFORE_REQUEST, "/message/sms/send", None),
+            (HookEvent.AFTER_RESPONSE, "/message/sms/send", 200),
+        ]
+
+    def test_event_details(self):
+        hooks = Hooks()
+        responses = []
+        hooks.add(HookEvent.AFTER_RESPONSE, responses.append)
+        eskiz = MockEskizServer().client(hooks=hooks)
+        eskiz.send_sms("998901234567", "Hello")
+        event = responses[-1]
+        assert event.method == "POST"
+        assert event.group == EndpointGroup.SEND
+        assert event.duration >= 0
+        assert event.request_size > 0 and event.response_size > 0
+
+    def test_error_and_retry(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(503), httpx.Response(500)]
+        hooks = Hooks()
+        events = recorder(hooks)
+        eskiz = server.client(hooks=hooks, retry=Retry(default=FAST))
+        eskiz.get_limit()
+        kinds = [kind for kind, endpoint, _ in events if endpoint == "/user/get-limit"]
+        assert kinds == [
+            HookEvent.BEFORE_REQUEST, HookEvent.ERROR, HookEvent.RETRY,
+            HookEvent.BEFORE_REQUEST, HookEvent.ERROR, HookEvent.RETRY,
+            HookEvent.BEFORE_REQUEST, HookEvent.AFTER_RESPONSE,
+        ]
+
+    def test_failing_listener(self):
+        hooks = Hooks()
+
+        @hooks.on(HookEvent.AFTER_RESPONSE)
+        def fail(event):
+            raise ValueError
+
+        eskiz = MockEskizServer().client(hooks=hooks)
+        assert eskiz.get_limit().status == "success"
+        hooks.remove(HookEvent.AFTER_RESPONSE, fail)
+        assert not hooks
+
+    async def test_async(self):
+        server = MockEskizServer()
+        hooks = Hooks()
+        events = recorder(hooks)
+        eskiz = server.async_client(hooks=hooks)
+        server.password = "changed"
+        with pytest.raises(exceptions.InvalidCredentials):
+            await eskiz.get_limit()
+        assert events[-1] == (HookEvent.TOKEN_REFRESH, "/auth/login", 401)
+        server.password = None
+        await eskiz.get_limit()
+        assert events[-1] == (HookEvent.AFTER_RESPONSE, "/user/get-limit", 200)
+
+
+class TestMetrics:
+    def test_prometheus(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(500)]
+        metrics = MetricsCollector()
+        eskiz = server.client(hooks=metrics.hooks, retry=Retry(default=FAST))
+        eskiz.get_limit()
+        eskiz.get_limit()
+        assert metrics.counter("requests") == {
+            ("POST", "/auth/login", "200"): 1,
+            ("GET", "/user/get-limit", "500"): 1,
+            ("GET", "/user/get-limit", "200"): 2,
+        }
+        assert metrics.counter("retries") == {("GET", "/user/get-limit"): 1}
+        assert metrics.counter("token_refreshes") == {("success",): 1}
+        text = metrics.to_prometheus()
+        assert 'eskiz_requests_total{method="GET",endpoint="/user/get-limit",status="200"} 2' in text
+        assert 'eskiz_request_errors_total{method="GET",endpoint="/user/get-limit",error="ServerError"} 1' in text
+        assert 'eskiz_request_duration_seconds_bucket{method="GET",endpoint="/user/get-limit",le="+Inf"} 3' in text
+        assert 'eskiz_request_duration_seconds_count{method="GET",endpoint="/user/get-limit"} 3' in text
+
+    def test_endpoint_label(self):
+        assert endpoint_label("/template/15") == "/template/{id}"
+        assert endpoint_label("/message/sms/send") == "/message/sms/send"
+
+    def test_detach(self):
+        metrics = MetricsCollector()
+        metrics.detach(metrics.hooks)
+        eskiz = MockEskizServer().client(hooks=metrics.hooks)
+        eskiz.get_limit()
+        assert metrics.counter("requests") == {}
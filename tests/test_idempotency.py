@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from eskiz_sms.exceptions import BadRequest, IdempotencyConflict, RequestTimeout
+from eskiz_sms.idempotency import PENDING, UNKNOWN, MemoryIdempotencyStore, SQLiteIdempotencyStore, batch_key
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.types import Response
+
+
+class TestStores:
+    def test_memory_lru(self):
+        store = MemoryIdempotencyStore(max_size=2)
+        store.put("a", Response(id="1", status="waiting"))
+        store.put("b", Response(id="2", status="waiting"))
+        assert store.get("a").id == "1"
+        store.put("c", Response(id="3", status="waiting"))
+        assert store.get("b") is None
+        assert store.get("a").id == "1"
+        assert len(store) == 2
+
+    def test_memory_ttl(self):
+        store = MemoryIdempotencyStore(ttl=0.01)
+        store.put("a", Response(id="1"))
+        time.sleep(0.02)
+        assert store.get("a") is None
+
+    def test_sqlite(self, tmp_path):
+        path = str(tmp_path / "ledger.db")
+        SQLiteIdempotencyStore(path).put("a", Response(id="1", status="waiting", message="Waiting for SMS provider"))
+        response = SQLiteIdempotencyStore(path).get("a")
+        assert response == Response(id="1", status="waiting", message="Waiting for SMS provider")
+        store = SQLiteIdempotencyStore(path, ttl=-1)
+        store.put("b", Response(id="2"))
+        assert store.get("b") is None
+        assert store.purge_expired() == 1
+
+    @pytest.mark.parametrize("kind", ["memory", "sqlite"])
+    def test_reservation(self, kind, tmp_path):
+        if kind == "memory":
+            store = MemoryIdempotencyStore(pending_timeout=0.05)
+        else:
+            store = SQLiteIdempotencyStore(str(tmp_path / "ledger.db"), pending_timeout=0.05)
+        assert store.reserve("a")
+        assert not store.reserve("a")
+        assert store.state("a") == PENDING and store.get("a") is None
+        time.sleep(0.06)
+        # the sender died, nobody knows whether the message was accepted
+        assert store.state("a") == UNKNOWN
+        with pytest.raises(IdempotencyConflict):
+            store.claim("a")
+        store.discard("a")
+        assert store.claim("a") is None
+        store.put("a", Response(id="1"))
+        assert store.claim("a").id == "1"
+
+    def test_response_like_a_state(self):
+        store = MemoryIdempotencyStore()
+        store.put("a", Response(id=PENDING, status="waiting"))
+        store.put("b", Response(id=UNKNOWN, status="waiting"))
+        assert store.get("a") == Response(id=PENDING, status="waiting")
+        assert store.get("b") == Response(id=UNKNOWN, status="waiting")
+
+    def test_batch_key(self):
+        assert batch_key(1, ["a", "b"]) == batch_key(1, ["a", "b"])
+        assert batch_key(1, ["a", "b"]) != batch_key(2, ["a", "b"])
+        assert batch_key(1, ["ab"]) != batch_key(1, ["a", "b"])
+
+
+class TestClient:
+    def test_send_sms(self):
+        server = MockEskizServer()
+        eskiz = server.client(idempotency=MemoryIdempotencyStore())
+        first = eskiz.send_sms("998901234567", "message", user_sms_id="sms1")
+        assert eskiz.send_sms("998901234567", "message", user_sms_id="sms1") == first
+        eskiz.send_sms("998901234567", "message", user_sms_id="sms2")
+        eskiz.send_sms("998901234567", "message")
+        eskiz.send_sms("998901234567", "message")
+        assert len(server.sent) == 4
+
+    def test_failed_send_is_not_remembered(self):
+        server = MockEskizServer()
+        server.rejected_phones.add("998900000000")
+        eskiz = server.client(idempotency=MemoryIdempotencyStore())
+        for _ in range(2):
+            with pytest.raises(BadRequest):
+                eskiz.send_sms("998900000000", "message", user_sms_id="sms1")
+        assert server.calls.count(("POST", "/message/sms/send")) == 2
+
+    def test_concurrent_duplicates(self):
+        server = MockEskizServer(latency=0.05)
+        eskiz = server.client(idempotency=MemoryIdempotencyStore())
+        eskiz.get_limit()
+        with ThreadPoolExecutor(5) as executor:
+            responses = list(executor.map(
+                lambda _: eskiz.send_sms("998901234567", "message", user_sms_id="sms1"), range(5)
+            ))
+        assert len(server.sent) == 1
+        assert all(response == responses[0] for response in responses)
+
+    def test_ambiguous_failure_keeps_the_key(self):
+        server = MockEskizServer()
+        eskiz = server.client(idempotency=MemoryIdempotencyStore())
+        eskiz.get_limit()
+        server.errors = [httpx.ReadTimeout("timeout")]
+        with pytest.raises(RequestTimeout):
+            eskiz.send_sms("998901234567", "message", user_sms_id="sms1")
+        with pytest.raises(IdempotencyConflict):
+            eskiz.send_sms("998901234567", "message", user_sms_id="sms1")
+        assert server.calls.count(("POST", "/message/sms/send")) == 1
+
+    def test_send_batch(self, tmp_path):
+        server = MockEskizServer()
+        eskiz = server.client(idempotency=SQLiteIdempotencyStore(str(tmp_path / "ledger.db")))
+        messages = [{"user_sms_id": "sms1", "to": 998901234567, "text": "message"}]
+        eskiz.send_batch(messages=messages, dispatch_id=1)
+        eskiz.send_batch(messages=messages, dispatch_id=1)
+        eskiz.send_batch(messages=messages, dispatch_id=2)
+        assert sorted({message["dispatch_id"] for message in server.messages}) == [1, 2]
+
+    async def test_async(self):
+        server = MockEskizServer()
+        eskiz = server.async_client(idempotency=MemoryIdempotencyStore())
+        first = await eskiz.send_sms("998901234567", "message", idempotency_key="order-1")
+        assert await eskiz.send_sms("998901234567", "other", idempotency_key="order-1") == first
+        assert len(server.sent) == 1
+        responses = await asyncio.gather(*(
+            eskiz.send_sms("998901234567", "message", user_sms_id="sms1") for _ in range(5)
+        ))
+        assert len(server.sent) == 2
+        assert all(response == responses[0] for response in responses)
+        await eskiz.aclose()
+
+    async def test_async_sqlite_is_not_called_on_the_loop(self, tmp_path):
+        threads = set()
+
+        class Store(SQLiteIdempotencyStore):
+            __slots__ = ()
+
+            def reserve(self, key):
+                threads.add(threading.current_thread())
+                return super().reserve(key)
+
+            def put(self, key, response):
+                threads.add(threading.current_thread())
+                super().put(key, response)
+
+        server = MockEskizServer()
+        store = Store(str(tmp_path / "ledger.db"))
+        eskiz = server.async_client(idempotency=store)
+        first = await eskiz.send_sms("998901234567", "message", user_sms_id="sms1")
+        assert await eskiz.send_sms("998901234567", "message", user_sms_id="sms1") == first
+        assert len(server.sent) == 1
+        assert threads and threading.current_thread() not in threads
+        await eskiz.aclose()
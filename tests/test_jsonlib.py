@@ -0,0 +1,105 @@
+import json
+from urllib.parse import parse_qs
+
+import pytest
+
+from eskiz_sms import jsonlib
+from eskiz_sms.jsonlib import RawResponse, available_backends, get_json_backend, set_json_backend
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.request import FORM_CONTENT_TYPE, JSON_CONTENT_TYPE, encode_body
+
+BODY = json.dumps({
+    "status": "success",
+    "data": {
+        "current_page": 1,
+        "meta": {"links": [{"url": None, "label": "[1]"}], "note": "a } b ] c"},
+        "data": [{"id": 1, "message": "[x]"}, {"id": 2, "message": "{y}"}],
+        "last_page": 3,
+    },
+}, indent=2).encode()
+
+
+class TestBackend:
+    @pytest.mark.parametrize("name", available_backends())
+    def test_roundtrip(self, name):
+        set_json_backend(name)
+        try:
+            assert get_json_backend().name == name
+            data = {"text": "Привет", "items": [1, 2.5, None, True]}
+            assert jsonlib.loads(jsonlib.dumps(data)) == data
+            assert isinstance(jsonlib.dumps(data), bytes)
+        finally:
+            set_json_backend(None)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            set_json_backend("simplejson")
+
+    def test_encode_body(self):
+        assert encode_body(None) == (None, None)
+        content, content_type = encode_body({"mobile_phone": "998901234567", "flag": True, "ids": [1, 2]})
+        assert content_type == FORM_CONTENT_TYPE
+        assert parse_qs(content.decode()) == {"mobile_phone": ["998901234567"], "flag": ["true"], "ids": ["1", "2"]}
+        content, content_type = encode_body({"messages": [{"to": "1", "text": "a"}], "dispatch_id": 5})
+        assert content_type == JSON_CONTENT_TYPE
+        assert json.loads(content) == {"messages": [{"to": "1", "text": "a"}], "dispatch_id": 5}
+
+
+class TestRawResponse:
+    def test_get(self):
+        raw = RawResponse(BODY)
+        assert raw.get("status") == "success"
+        assert raw.get("data", "last_page") == 3
+        assert raw.get("data", "meta", "note") == "a } b ] c"
+        assert raw.get("data", "missing", default=0) == 0
+        assert raw.get("status", "nested") is None
+        assert raw.json() == json.loads(BODY)
+
+    def test_iter_items(self):
+        raw = RawResponse(BODY)
+        assert list(raw.iter_items("data", "data")) == [{"id": 1, "message": "[x]"}, {"id": 2, "message": "{y}"}]
+        assert list(raw.iter_items("data", "current_page")) == []
+        assert list(raw.iter_items("missing")) == []
+        assert list(RawResponse(b'{"data": []}').iter_items("data")) == []
+        assert list(RawResponse(b'[1, 2]').iter_items()) == [1, 2]
+
+    def test_escapes_are_skipped(self):
+        raw = RawResponse(json.dumps({
+            "a": 'x"]}\\',
+            "b": [{"c": "\\\"{"}, [], {}],
+            "d": "Привет",
+            "e": [-1.5e3, True, None],
+        }, ensure_ascii=False).encode())
+        assert raw.get("d") == "Привет"
+        assert list(raw.iter_items("e")) == [-1.5e3, True, None]
+        assert list(raw.iter_items("b")) == [{"c": "\\\"{"}, [], {}]
+        assert raw.get("f") is None
+
+    def test_raw_user_messages(self):
+        server = MockEskizServer(per_page=2)
+        with server.client(user_id=1) as eskiz:
+            for phone in ("998901234567", "998901234568", "998901234569"):
+                eskiz.send_sms(phone, "Hello")
+            raw = eskiz.get_user_messages("2023-01-01 00:00:00", "2023-01-02 00:00:00", raw=True)
+        assert isinstance(raw, RawResponse)
+        assert raw.get("data", "last_page") == 2
+        assert [item["to"] for item in raw.iter_items("data", "data")] == ["998901234567", "998901234568"]
+
+    async def test_async_raw_user_messages(self):
+        server = MockEskizServer()
+        async with server.async_client(user_id=1) as eskiz:
+            await eskiz.send_sms("998901234567", "Hello")
+            raw = await eskiz.get_user_messages("2023-01-01 00:00:00", "2023-01-02 00:00:00", raw=True)
+            response = await eskiz.get_user_messages("2023-01-01 00:00:00", "2023-01-02 00:00:00")
+        assert list(raw.iter_items("data", "data")) == response.data["data"]
+
+
+def test_batch_is_sent_as_json():
+    server = MockEskizServer()
+    eskiz = server.client()
+    eskiz.send_batch(messages=[{"user_sms_id": "1", "to": 998901234567, "text": "Hi"}], dispatch_id=7)
+    assert server.payloads("/message/sms/send-batch")[-1] == {
+        "messages": [{"user_sms_id": "1", "to": "998901234567", "text": "Hi"}],
+        "from": "4546",
+        "dispatch_id": 7,
+    }
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from benchmarks import bench_client, bench_models, bench_send_path
+from eskiz_sms import exceptions
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.retry import Retry, RetryPolicy
+
+FAST = RetryPolicy(max_attempts=5, backoff=0.001)
+
+
+class TestMockEskizServer:
+    def test_endpoints(self):
+        server = MockEskizServer("user@example.com", "secret")
+        with server.client() as eskiz:
+            assert eskiz.send_sms("998901234567", "Hello", user_sms_id="a").status == "waiting"
+            eskiz.send_batch(messages=[
+                {"user_sms_id": "b", "to": 998901234567, "text": "Hi"},
+                {"user_sms_id": "c", "to": 998901234568, "text": "Hi"},
+            ], dispatch_id=1)
+            assert eskiz.get_limit().data["balance"] == 1_000_000 - 3
+            created = eskiz.create_template("otp", "Code {code}")
+            assert eskiz.get_template(created.data["id"]).data["text"] == "Code {code}"
+        assert len(server.messages) == 3
+        assert server.stats["/auth/login"] == 1
+
+    def test_invalid_credentials(self):
+        server = MockEskizServer("user@example.com", "secret")
+        eskiz = server.client()
+        eskiz.token._credentials["password"] = "wrong"
+        with pytest.raises(exceptions.EskizException):
+            eskiz.get_limit()
+
+    @pytest.mark.parametrize("rate, error, stat", [
+        ("error_rate", exceptions.ServerError, "injected_500"),
+        ("throttle_rate", exceptions.TooManyRequests, "injected_429"),
+        ("token_invalid_rate", exceptions.TokenInvalid, "injected_401"),
+    ])
+    def test_injected_errors(self, rate, error, stat):
+        server = MockEskizServer(retry_after=0, **{rate: 1.0})
+        with server.client(retry=Retry(default=FAST)) as eskiz:
+            with pytest.raises(error):
+                eskiz.get_limit()
+        assert server.stats[stat] >= 1
+
+    def test_injected_errors_retried(self):
+        server = MockEskizServer(error_rate=0.3, throttle_rate=0.3, retry_after=0, seed=1)
+        with server.client(retry=Retry(default=RetryPolicy(max_attempts=20, backoff=0.001))) as eskiz:
+            for _ in range(10):
+                assert eskiz.get_limit().status == "success"
+        assert server.stats["injected_500"] and server.stats["injected_429"]
+
+    async def test_latency(self):
+        server = MockEskizServer(latency=0.02)
+        async with server.async_client() as eskiz:
+            await eskiz.get_limit()
+            started = time.perf_counter()
+            await eskiz.send_sms("998901234567", "Hello")
+            assert time.perf_counter() - started >= 0.02
+
+
+def test_bench_client(capsys):
+    bench_client.main(["--requests", "200", "--alloc-calls", "2"])
+    output = capsys.readouterr().out
+    for scenario in bench_client.SCENARIOS:
+        assert scenario in output
+
+
+def test_bench_send_path(capsys):
+    bench_send_path.main(["--sends", "20", "--batch-size", "10", "--alloc-calls", "2"])
+    output = capsys.readouterr().out
+    assert "send_sms" in output and "send_batch" in output
+
+
+def test_bench_models(capsys):
+    bench_models.main(["--rows", "50"])
+    output = capsys.readouterr().out
+    for builder in bench_models.BUILDERS:
+        assert builder in output
@@ -0,0 +1,120 @@
+import asyncio
+
+import httpx
+
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.outbox import AsyncOutboxWorker, OutboxWorker, SQLiteOutbox
+from eskiz_sms.retry import RetryPolicy
+
+NO_BACKOFF = RetryPolicy(max_attempts=2, backoff=0, jitter=False, deadline=None)
+
+
+class TestOutbox:
+    def test_enqueue_is_idempotent(self, tmp_path):
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        assert outbox.enqueue("998901234567", "message", user_sms_id="sms1") == "sms1"
+        outbox.enqueue("998901234567", "message", user_sms_id="sms1")
+        assert len(outbox.enqueue("998901234567", "message")) == 32
+        assert outbox.stats() == {"pending": 2}
+
+    def test_lease(self, tmp_path):
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message")
+        assert len(outbox.claim(10, lease=60)) == 1
+        assert outbox.claim(10) == []
+        # the worker died, the lease expired
+        outbox._connection().execute("UPDATE eskiz_outbox SET locked_until = 0")
+        assert len(outbox.claim(10)) == 1
+
+    def test_lost_lease(self, tmp_path):
+        server = MockEskizServer()
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message", user_sms_id="sms1")
+        [stale] = outbox.claim(10, lease=60)
+        outbox._connection().execute("UPDATE eskiz_outbox SET locked_until = 0")
+        [current] = outbox.claim(10, lease=60)
+        assert not outbox.renew(stale)
+        assert not outbox.mark_sent(stale)
+        assert not outbox.mark_failed(stale, ValueError())
+        assert outbox.status("sms1") == "sending"
+        # the stale worker doesn't send the message claimed by the other one
+        worker = OutboxWorker(outbox, server.client())
+        worker._send(stale)
+        assert server.sent == []
+        worker._send(current)
+        assert outbox.status("sms1") == "sent"
+        assert len(server.sent) == 1
+
+    def test_worker(self, tmp_path):
+        server = MockEskizServer()
+        server.rejected_phones.add("998900000000")
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message", user_sms_id="ok")
+        outbox.enqueue("998900000000", "message", user_sms_id="invalid")
+        worker = OutboxWorker(outbox, server.client(), batch_size=10)
+        assert worker.run_once() == 2
+        assert outbox.status("ok") == "sent"
+        assert outbox.status("invalid") == "failed"
+        assert server.sent[0]["user_sms_id"] == "ok"
+
+    def test_retry(self, tmp_path):
+        server = MockEskizServer()
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message", user_sms_id="sms1")
+        worker = OutboxWorker(outbox, server.client(), retry_policy=NO_BACKOFF)
+        worker.eskiz.get_limit()
+        server.errors = [httpx.Response(503)]
+        worker.run_once()
+        assert outbox.status("sms1") == "pending"
+        worker.run_once()
+        assert outbox.status("sms1") == "sent"
+
+    def test_timeout_is_not_retried_by_default(self, tmp_path):
+        server = MockEskizServer()
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message", user_sms_id="sms1")
+        worker = OutboxWorker(outbox, server.client())
+        worker.eskiz.get_limit()
+        server.errors = [httpx.ReadTimeout("timeout")]
+        worker.run_once()
+        assert outbox.status("sms1") == "failed"
+
+    def test_threads(self, tmp_path):
+        server = MockEskizServer()
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        for i in range(20):
+            outbox.enqueue("998901234567", "message", user_sms_id=f"sms{i}")
+        worker = OutboxWorker(outbox, server.client(), workers=3, batch_size=4, poll_interval=0.01)
+        worker.start()
+        for _ in range(200):
+            if outbox.stats() == {"sent": 20}:
+                break
+            worker._stopped.wait(0.01)
+        worker.stop()
+        assert outbox.stats() == {"sent": 20}
+        assert sorted(message["user_sms_id"] for message in server.sent) == sorted(f"sms{i}" for i in range(20))
+
+    async def test_async_worker(self, tmp_path):
+        server = MockEskizServer()
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        for i in range(5):
+            outbox.enqueue("998901234567", "message", user_sms_id=f"sms{i}")
+        worker = AsyncOutboxWorker(outbox, server.async_client(), batch_size=10)
+        assert await worker.run_once() == 5
+        assert outbox.stats() == {"sent": 5}
+        await worker.stop()
+        assert worker._executor is None
+
+    async def test_async_stop_waits_for_sends(self, tmp_path):
+        server = MockEskizServer(latency=0.05)
+        outbox = SQLiteOutbox(str(tmp_path / "outbox.db"))
+        outbox.enqueue("998901234567", "message", user_sms_id="sms1")
+        eskiz = server.async_client()
+        worker = AsyncOutboxWorker(outbox, eskiz, workers=2, poll_interval=0.01)
+        worker.start()
+        while "sending" not in outbox.stats():
+            await asyncio.sleep(0.001)
+        await worker.stop()
+        # the send wasn't interrupted between the request and mark_sent
+        assert outbox.stats() == {"sent": 1}
+        assert len(server.sent) == 1
@@ -0,0 +1,47 @@
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.poller import is_dispatch_finished
+
+WAITING = [{"status": "WAITING", "total": 2}]
+HALF = [{"status": "DELIVRD", "total": 1}, {"status": "WAITING", "total": 1}]
+DONE = [{"status": "DELIVRD", "total": 2}]
+
+
+class TestDispatchPoller:
+    def test_is_finished(self):
+        assert not is_dispatch_finished(WAITING)
+        assert not is_dispatch_finished([])
+        assert is_dispatch_finished(DONE)
+
+    async def test_get_dispatch_status(self):
+        server = MockEskizServer()
+        server.dispatch_statuses[1] = [DONE]
+        eskiz = server.async_client(user_id=1)
+        response = await eskiz.get_dispatch_status(1)
+        assert response.data == DONE
+
+    async def test_poll(self):
+        server = MockEskizServer()
+        server.dispatch_statuses = {1: [WAITING, WAITING, HALF, DONE], 2: [DONE]}
+        eskiz = server.async_client(user_id=1)
+        received = []
+        poller = eskiz.poll_dispatches([1, 2], interval=0.001, on_change=received.append)
+        changes = [change async for change in poller.changes()]
+        # the first polls of both dispatches are concurrent, so only the order per dispatch is fixed
+        assert [(change.data, change.finished) for change in changes if change.dispatch_id == 1] == [
+            (WAITING, False),
+            (HALF, False),
+            (DONE, True),
+        ]
+        assert [(change.data, change.finished) for change in changes if change.dispatch_id == 2] == [(DONE, True)]
+        assert received == changes
+        assert poller.active == []
+        assert server.calls.count(("GET", "/message/sms/get-dispatch-status")) == 5
+
+    async def test_discard(self):
+        server = MockEskizServer()
+        server.dispatch_statuses = {1: [WAITING]}
+        eskiz = server.async_client(user_id=1)
+        poller = eskiz.poll_dispatches([1], interval=0.001)
+        async for change in poller.changes():
+            poller.discard(change.dispatch_id)
+        assert poller.active == []
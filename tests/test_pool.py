@@ -0,0 +1,124 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from eskiz_sms.exceptions import BadRequest, NoAvailableAccount
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.pool import (
+    AsyncEskizPool,
+    EskizPool,
+    LEAST_OUTSTANDING,
+    REMAINING_LIMIT,
+    STICKY,
+)
+
+
+def _pool(servers, **kwargs) -> EskizPool:
+    return EskizPool([server.client() for server in servers], **kwargs)
+
+
+class TestPool:
+    def test_round_robin(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        pool = _pool(servers)
+        for _ in range(4):
+            pool.send_sms("998901234567", "message")
+        assert [len(server.sent) for server in servers] == [2, 2]
+
+    def test_sticky(self):
+        servers = [MockEskizServer(), MockEskizServer(), MockEskizServer()]
+        pool = _pool(servers, policy=STICKY)
+        for _ in range(3):
+            pool.send_sms("998901234567", "message")
+        assert sorted(len(server.sent) for server in servers) == [0, 0, 3]
+
+    def test_remaining_limit(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        servers[0].balance = 10
+        servers[1].balance = 12
+        pool = _pool(servers, policy=REMAINING_LIMIT)
+        for _ in range(4):
+            pool.send_sms("998901234567", "message")
+        # the second account is chosen at 12 and 11, the first one wins the tie at 10
+        assert [len(server.sent) for server in servers] == [1, 3]
+        assert servers[1].calls.count(("GET", "/user/get-limit")) == 1
+
+    def test_shared_limit_refresh(self):
+        servers = [MockEskizServer(latency=0.02), MockEskizServer(latency=0.02)]
+        pool = _pool(servers, policy=REMAINING_LIMIT)
+        for account in pool.accounts:
+            account.client.get_limit()
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: pool.send_sms("998901234567", "message"), range(16)))
+        assert [server.calls.count(("GET", "/user/get-limit")) for server in servers] == [2, 2]
+        # the balances are stale, one sender refreshes them and the others don't wait for it
+        for account in pool.accounts:
+            account.balance_at -= 60
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(lambda _: pool.send_sms("998901234567", "message"), range(16)))
+        assert [server.calls.count(("GET", "/user/get-limit")) for server in servers] == [3, 3]
+        assert sum(len(server.sent) for server in servers) == 32
+
+    async def test_async_shared_limit_refresh(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        pool = AsyncEskizPool([server.async_client() for server in servers], policy=REMAINING_LIMIT)
+        await asyncio.gather(*(pool.send_sms("998901234567", "message") for _ in range(10)))
+        assert [server.calls.count(("GET", "/user/get-limit")) for server in servers] == [1, 1]
+        assert sum(len(server.sent) for server in servers) == 10
+        await pool.aclose()
+
+    def test_least_outstanding(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        pool = _pool(servers, policy=LEAST_OUTSTANDING)
+        pool.accounts[0].outstanding = 5
+        pool.send_sms("998901234567", "message")
+        assert [len(server.sent) for server in servers] == [0, 1]
+
+    def test_failover(self):
+        servers = [MockEskizServer(), MockEskizServer(), MockEskizServer()]
+        pool = _pool(servers)
+        servers[0].password = "changed"
+        pool.accounts[1].client.get_limit()
+        servers[1].errors = [httpx.Response(429, headers={"Retry-After": "60"}, json={"message": "Too many requests"})]
+        for i in range(3):
+            pool.send_sms(f"99890123456{i}", "message")
+        assert [len(server.sent) for server in servers] == [0, 0, 3]
+        assert pool.accounts[0].disabled
+        assert not pool.accounts[1].available(time.monotonic())
+
+    def test_out_of_balance(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        pool = _pool(servers)
+        pool.accounts[0].client.get_limit()
+        servers[0].errors = [httpx.Response(400, json={"message": "Insufficient balance"})]
+        pool.send_sms("998901234567", "message")
+        assert [len(server.sent) for server in servers] == [0, 1]
+        assert pool.accounts[0].balance == 0
+
+    def test_no_failover(self):
+        server = MockEskizServer()
+        server.rejected_phones.add("998900000000")
+        pool = _pool([server, MockEskizServer()])
+        with pytest.raises(BadRequest):
+            pool.send_sms("998900000000", "message")
+
+    def test_all_failed(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        pool = _pool(servers)
+        for server in servers:
+            server.password = "changed"
+        with pytest.raises(NoAvailableAccount):
+            pool.send_sms("998901234567", "message")
+        with pytest.raises(NoAvailableAccount):
+            pool.send_sms("998901234567", "message")
+
+    async def test_async(self):
+        servers = [MockEskizServer(), MockEskizServer()]
+        async with AsyncEskizPool([server.async_client() for server in servers]) as pool:
+            servers[0].password = "changed"
+            for _ in range(2):
+                await pool.send_sms("998901234567", "message")
+        assert [len(server.sent) for server in servers] == [0, 2]
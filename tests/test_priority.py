@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from eskiz_sms.enums import EndpointGroup
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.priority import Lane, PriorityScheduler, WEIGHTED, use_lane
+
+
+async def _grant_order(scheduler: PriorityScheduler, lanes):
+    """Holds the only slot while the requests are queued, then returns the order they got the slot"""
+    order = []
+    held = await scheduler.aacquire()
+
+    async def request(name):
+        with use_lane(name):
+            lane = await scheduler.aacquire()
+        order.append(name)
+        await asyncio.sleep(0)
+        scheduler.release(lane)
+
+    tasks = [asyncio.ensure_future(request(name)) for name in lanes]
+    await asyncio.sleep(0)
+    scheduler.release(held)
+    await asyncio.gather(*tasks)
+    return order
+
+
+class TestScheduler:
+    async def test_strict(self):
+        scheduler = PriorityScheduler([Lane("otp"), Lane("bulk")], max_concurrency=1)
+        order = await _grant_order(scheduler, ["bulk", "bulk", "otp", "bulk", "otp"])
+        assert order == ["otp", "otp", "bulk", "bulk", "bulk"]
+
+    async def test_weighted(self):
+        scheduler = PriorityScheduler(
+            [Lane("otp", weight=3), Lane("bulk", weight=1)], max_concurrency=1, policy=WEIGHTED
+        )
+        order = await _grant_order(scheduler, ["bulk"] * 8 + ["otp"] * 8)
+        # ~3 of each 4 slots go to otp, bulk isn't starved
+        assert 6 <= order[:8].count("otp") < 8
+        assert order[-2:] == ["bulk", "bulk"]
+
+    async def test_lane_concurrency(self):
+        scheduler = PriorityScheduler([Lane("otp"), Lane("bulk", concurrency=1)], max_concurrency=10)
+        with use_lane("bulk"):
+            first = await scheduler.aacquire()
+            second = asyncio.ensure_future(scheduler.aacquire())
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        with use_lane("otp"):
+            assert await scheduler.aacquire() is scheduler.lanes["otp"]
+        scheduler.release(first)
+        assert await second is first
+        assert scheduler.stats() == {"otp": {"active": 1, "waiting": 0}, "bulk": {"active": 1, "waiting": 0}}
+
+    async def test_cancelled_waiter(self):
+        scheduler = PriorityScheduler([Lane("default")], max_concurrency=1)
+        held = await scheduler.aacquire()
+        waiter = asyncio.ensure_future(scheduler.aacquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release(held)
+        assert scheduler.active == 0
+        assert scheduler.stats() == {"default": {"active": 0, "waiting": 0}}
+
+    def test_lane_for(self):
+        scheduler = PriorityScheduler(
+            [Lane("otp"), Lane("bulk")], groups={EndpointGroup.BATCH: "bulk"}, default_lane="otp"
+        )
+        assert scheduler.lane_for(EndpointGroup.SEND).name == "otp"
+        assert scheduler.lane_for(EndpointGroup.BATCH).name == "bulk"
+        with use_lane("bulk"):
+            assert scheduler.lane_for(EndpointGroup.SEND).name == "bulk"
+        with pytest.raises(ValueError):
+            PriorityScheduler([Lane("otp")], default_lane="bulk")
+
+
+class TestClient:
+    def test_sync(self):
+        server = MockEskizServer()
+        scheduler = PriorityScheduler([Lane("otp"), Lane("bulk", rate=100)], max_concurrency=2)
+        eskiz = server.client(scheduler=scheduler)
+        with use_lane("bulk"):
+            eskiz.send_sms("998901234567", "message")
+        eskiz.send_sms("998901234567", "message")
+        assert len(server.sent) == 2
+        assert scheduler.active == 0
+
+    async def test_async(self):
+        server = MockEskizServer()
+        scheduler = PriorityScheduler([Lane("otp"), Lane("bulk")], max_concurrency=2)
+        eskiz = server.async_client(scheduler=scheduler)
+        await asyncio.gather(*(eskiz.send_sms("998901234567", "message") for _ in range(10)))
+        assert len(server.sent) == 10
+        assert scheduler.active == 0
+        await eskiz.aclose()
@@ -0,0 +1,44 @@
+import time
+
+from eskiz_sms.enums import EndpointGroup
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.ratelimit import RateLimiter, TokenBucket
+from eskiz_sms.request import endpoint_group
+
+
+class TestRateLimit:
+    def test_endpoint_group(self):
+        assert endpoint_group("/message/sms/send") == EndpointGroup.SEND
+        assert endpoint_group("/message/sms/send-global") == EndpointGroup.SEND
+        assert endpoint_group("/message/sms/send-batch") == EndpointGroup.BATCH
+        assert endpoint_group("/message/sms/get-dispatch-status") == EndpointGroup.REPORTING
+        assert endpoint_group("/user/get-limit") == EndpointGroup.REPORTING
+        assert endpoint_group("/contact/1") == EndpointGroup.CONTACTS
+        assert endpoint_group("/template") == EndpointGroup.DEFAULT
+
+    def test_try_acquire(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert bucket.try_acquire()
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+
+    def test_shared_limiter(self):
+        limiter = RateLimiter(send=TokenBucket(rate=50, capacity=1))
+        first = MockEskizServer().client(rate_limiter=limiter)
+        second = MockEskizServer().client(rate_limiter=limiter)
+        started_at = time.monotonic()
+        for _ in range(3):
+            first.send_sms("998901234567", "message")
+            second.send_sms("998901234567", "message")
+        # 1 token at start, 5 more at 50 per second
+        assert time.monotonic() - started_at >= 0.09
+        assert not limiter.try_acquire(EndpointGroup.SEND)
+        assert limiter.try_acquire(EndpointGroup.CONTACTS)
+
+    async def test_async_limiter(self):
+        limiter = RateLimiter(send=TokenBucket(rate=50, capacity=1))
+        eskiz = MockEskizServer().async_client(rate_limiter=limiter)
+        started_at = time.monotonic()
+        for _ in range(4):
+            await eskiz.send_sms("998901234567", "message")
+        assert time.monotonic() - started_at >= 0.05
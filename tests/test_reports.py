@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.reports import date_windows
+from eskiz_sms.types import UserMessage
+
+
+class TestUserCache:
+    def test_user_is_cached(self):
+        server = MockEskizServer()
+        eskiz = server.client()
+        eskiz.totals(2023)
+        eskiz.get_dispatch_status(1)
+        assert server.payloads("/message/sms/get-dispatch-status")[-1]["user_id"] == "1"
+        assert server.calls.count(("GET", "/auth/user")) == 1
+
+    def test_invalidate_user(self):
+        server = MockEskizServer()
+        eskiz = server.client()
+        assert eskiz.user.id == 1
+        eskiz.invalidate_user()
+        assert eskiz.user.id == 1
+        assert server.calls.count(("GET", "/auth/user")) == 2
+
+    def test_cache_disabled(self):
+        server = MockEskizServer()
+        eskiz = server.client(user_cache_ttl=0)
+        eskiz.totals(2023)
+        eskiz.totals(2023)
+        assert server.calls.count(("GET", "/auth/user")) == 2
+
+    def test_pinned_user_id(self):
+        server = MockEskizServer()
+        eskiz = server.client(user_id=5)
+        eskiz.totals(2023)
+        eskiz.totals(2023, user_id=7)
+        assert [payload["user_id"] for payload in server.payloads("/user/totals")] == ["5", "7"]
+        assert ("GET", "/auth/user") not in server.calls
+
+    async def test_async_user_is_cached(self):
+        server = MockEskizServer()
+        eskiz = server.async_client()
+        await eskiz.totals(2023)
+        await eskiz.get_user_messages_by_dispatch(1)
+        assert server.payloads("/message/sms/get-user-messages-by-dispatch")[-1]["user_id"] == "1"
+        assert server.calls.count(("GET", "/auth/user")) == 1
+
+
+def _pages(server: MockEskizServer):
+    payloads = server.payloads("/message/sms/get-user-messages")
+    return [(payload["from_date"], int(payload["page"])) for payload in payloads]
+
+
+def _user_messages(n):
+    return [{"id": i, "to": "998901234567", "status": "DELIVRD", "unknown_field": 1} for i in range(n)]
+
+
+class TestUserMessages:
+    def test_date_windows(self):
+        windows = list(date_windows("2023-01-01 00:00", "2023-01-03 23:59:59", timedelta(days=1)))
+        assert windows == [
+            ("2023-01-01 00:00:00", "2023-01-01 23:59:59"),
+            ("2023-01-02 00:00:00", "2023-01-02 23:59:59"),
+            ("2023-01-03 00:00:00", "2023-01-03 23:59:59"),
+        ]
+
+    def test_iter_user_messages(self):
+        server = MockEskizServer(per_page=2)
+        server.messages = _user_messages(5)
+        eskiz = server.client()
+        messages = list(eskiz.iter_user_messages("2023-01-01 00:00", "2023-01-31 23:59", prefetch=True))
+        assert [message.id for message in messages] == [0, 1, 2, 3, 4]
+        assert isinstance(messages[0], UserMessage)
+        assert [page for _, page in _pages(server)] == [1, 2, 3]
+
+    def test_iter_user_messages_windows(self):
+        server = MockEskizServer(per_page=2)
+        server.messages = _user_messages(1)
+        eskiz = server.client(user_id=1)
+        messages = list(eskiz.iter_user_messages(
+            datetime(2023, 1, 1), datetime(2023, 1, 2, 23, 59, 59), window=timedelta(days=1)
+        ))
+        assert len(messages) == 2
+        assert _pages(server) == [("2023-01-01 00:00:00", 1), ("2023-01-02 00:00:00", 1)]
+
+    async def test_async_iter_user_messages(self):
+        server = MockEskizServer(per_page=2)
+        server.messages = _user_messages(5)
+        eskiz = server.async_client()
+        messages = [
+            message async for message in eskiz.iter_user_messages("2023-01-01", "2023-01-31", prefetch=True)
+        ]
+        assert [message.id for message in messages] == [0, 1, 2, 3, 4]
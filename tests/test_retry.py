@@ -0,0 +1,79 @@
+import httpx
+import pytest
+
+from eskiz_sms import exceptions
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.retry import Retry, RetryPolicy
+
+FAST = RetryPolicy(max_attempts=3, backoff=0.001)
+
+
+class TestRetry:
+    def test_server_error(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(503), httpx.Response(502)]
+        eskiz = server.client(retry=Retry(default=FAST))
+        assert eskiz.get_limit().status == "success"
+
+    def test_max_attempts(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(500)] * 3
+        eskiz = server.client(retry=Retry(default=FAST))
+        with pytest.raises(exceptions.ServerError):
+            eskiz.get_limit()
+
+    def test_no_retry_by_default(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(503)]
+        eskiz = server.client()
+        with pytest.raises(exceptions.BadRequest):
+            eskiz.get_limit()
+
+    def test_retry_after(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(429, headers={"Retry-After": "0"})]
+        eskiz = server.client(retry=Retry(send=RetryPolicy(retry_statuses=(429,), backoff=60)))
+        assert eskiz.send_sms("998901234567", "message").status == "waiting"
+
+    def test_deadline(self):
+        server = MockEskizServer()
+        server.errors = [httpx.Response(429, headers={"Retry-After": "120"})]
+        eskiz = server.client(retry=Retry(send=RetryPolicy(deadline=10)))
+        with pytest.raises(exceptions.TooManyRequests) as e:
+            eskiz.send_sms("998901234567", "message")
+        assert e.value.retry_after == 120
+
+    def test_send_timeout_is_not_retried(self):
+        server = MockEskizServer()
+        eskiz = server.client(retry=Retry(default=FAST))
+        eskiz.get_limit()
+        server.errors = [httpx.ReadTimeout("timeout"), httpx.ReadTimeout("timeout")]
+        with pytest.raises(exceptions.RequestTimeout):
+            eskiz.send_sms("998901234567", "message")
+        with pytest.raises(exceptions.RequestTimeout):
+            eskiz.send_sms("998901234567", "message", user_sms_id="sms1")
+
+    def test_keyed_send_policy(self):
+        server = MockEskizServer()
+        eskiz = server.client(retry=Retry(keyed_send=FAST))
+        eskiz.get_limit()
+        server.errors = [httpx.ReadTimeout("timeout")]
+        assert eskiz.send_sms("998901234567", "message", user_sms_id="sms1").status == "waiting"
+
+    def test_non_idempotent_writes(self):
+        server = MockEskizServer()
+        eskiz = server.client(retry=Retry(default=FAST))
+        eskiz.get_limit()
+        server.errors = [httpx.Response(500)]
+        with pytest.raises(exceptions.ServerError):
+            eskiz.create_template("name", "text")
+        assert server.templates == {}
+        server.errors = [httpx.Response(500)]
+        assert eskiz.totals(2023).status == "success"
+
+    async def test_async_connect_error(self):
+        server = MockEskizServer()
+        server.errors = [httpx.ConnectError("refused")]
+        eskiz = server.async_client(retry=Retry(send=FAST))
+        response = await eskiz.send_sms("998901234567", "message")
+        assert response.status == "waiting"
@@ -0,0 +1,74 @@
+import pytest
+
+from eskiz_sms.exceptions import TemplateError
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.templates import CompiledTemplate, TemplateRegistry
+from eskiz_sms.types import Response
+
+
+class TestCompiledTemplate:
+    def test_render(self):
+        template = CompiledTemplate("Hi {name}, your code is {code}. 100% {name}")
+        assert template.fields == ("name", "code")
+        assert template.render(name="Ali", code=1234) == "Hi Ali, your code is 1234. 100% Ali"
+        with pytest.raises(TemplateError):
+            template.render(name="Ali")
+
+    def test_positional(self):
+        template = CompiledTemplate("Kod: %d, %w")
+        assert template.fields == ("_0", "_1")
+        assert template.render(1234, "Eskiz") == "Kod: 1234, Eskiz"
+        with pytest.raises(TemplateError):
+            template.render("abc", "Eskiz")
+
+    def test_render_many(self):
+        template = CompiledTemplate("{name}: %d")
+        assert template.render_many(name=["a", "b"], _0=[1, 2]) == ["a: 1", "b: 2"]
+        with pytest.raises(TemplateError):
+            template.render_many(name=["a", "b"], _0=[1])
+        with pytest.raises(TemplateError):
+            template.render_many(name=["a"], _0=["x"])
+        assert template.render_many(name=["a"], _0=["x"], validate=False) == ["a: x"]
+        with pytest.raises(TemplateError):
+            template.check(["name", "_0", "other"], strict=True)
+
+    def test_batch_messages(self):
+        template = CompiledTemplate("Code {code}")
+        assert template.batch_messages(to=[998901234567], user_sms_id=["sms1"], code=[1]) == [
+            {"user_sms_id": "sms1", "to": 998901234567, "text": "Code 1"},
+        ]
+        assert CompiledTemplate("Static").batch_messages(to=[1, 2], user_sms_id=["a", "b"])[1]["text"] == "Static"
+
+
+class TestRegistry:
+    def test_refresh(self):
+        server = MockEskizServer()
+        eskiz = server.client()
+        eskiz.create_template("otp", "Code {code}")
+        eskiz.create_template("promo", "Sale %d off")
+        registry = TemplateRegistry().refresh(eskiz)
+        assert len(registry) == 2
+        assert registry["otp"] is registry[1]
+        assert registry["promo"].render(50) == "Sale 50 off"
+        assert "missing" not in registry
+        assert server.calls.count(("GET", "/template")) == 1
+
+    def test_replace(self):
+        registry = TemplateRegistry([CompiledTemplate("a", id=1, name="old")])
+        registry.add(CompiledTemplate("b", id=1, name="new"))
+        assert registry.get("old") is None
+        assert registry[1].text == "b"
+
+    def test_invalid_id(self):
+        registry = TemplateRegistry([CompiledTemplate("a", id=1, name="old")])
+        with pytest.raises(TemplateError):
+            registry.load(Response(data=[{"id": "abc", "name": "otp", "text": "Code {code}"}]))
+        assert registry["old"].text == "a"
+
+    async def test_async(self):
+        server = MockEskizServer()
+        eskiz = server.async_client()
+        await eskiz.create_template("otp", "Code {code}")
+        registry = await TemplateRegistry().arefresh(eskiz)
+        assert registry["otp"].render(code=1) == "Code 1"
+        await eskiz.aclose()
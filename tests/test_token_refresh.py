@@ -0,0 +1,97 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.token import jwt_expiry
+
+
+class TestTokenSingleFlight:
+    async def test_async_burst(self):
+        server = MockEskizServer(latency=0.01)
+        eskiz = server.async_client()
+        await asyncio.gather(*(eskiz.get_limit() for _ in range(1000)))
+        assert server.stats["/auth/login"] == 1
+
+    async def test_async_refresh(self):
+        server = MockEskizServer(latency=0.01)
+        eskiz = server.async_client()
+        eskiz.token.set("expired-token")
+        await asyncio.gather(*(eskiz.get_limit() for _ in range(100)))
+        assert server.stats["/auth/login"] == 1
+        assert str(eskiz.token) == server.last_token
+
+    def test_threads(self):
+        server = MockEskizServer(latency=0.01)
+        eskiz = server.client()
+        eskiz.token.set("expired-token")
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            list(executor.map(lambda _: eskiz.get_limit(), range(40)))
+        assert server.stats["/auth/login"] == 1
+
+
+class TestTokenExpiry:
+    def test_jwt_expiry(self):
+        assert jwt_expiry(MockEskizServer().issue_token(exp=1668234797)) == 1668234797
+        assert jwt_expiry("not-a-jwt") is None
+
+    def test_valid_token_is_not_checked(self):
+        server = MockEskizServer(token_ttl=3600)
+        eskiz = server.client()
+        eskiz.token.set(server.issue_token())
+        eskiz.get_limit()
+        assert server.calls == [("GET", "/user/get-limit")]
+
+    def test_expired_token_is_replaced_before_request(self):
+        server = MockEskizServer(token_ttl=3600)
+        eskiz = server.client()
+        eskiz.token.set(server.issue_token(exp=time.time() - 10))
+        eskiz.get_limit()
+        assert server.calls == [("POST", "/auth/login"), ("GET", "/user/get-limit")]
+
+    def test_background_refresh(self):
+        server = MockEskizServer(token_ttl=3600)
+        expiring = server.issue_token(exp=time.time() + 60, iat=time.time() - 3600)
+        eskiz = server.client()
+        eskiz.token.set(expiring)
+        eskiz.get_limit()
+        eskiz.token._refresh_thread.join()
+        assert str(eskiz.token) == server.last_token
+        eskiz.get_limit()
+        assert server.stats["/auth/login"] == 1
+
+    async def test_async_background_refresh(self):
+        server = MockEskizServer(token_ttl=3600)
+        expiring = server.issue_token(exp=time.time() + 60, iat=time.time() - 3600)
+        eskiz = server.async_client()
+        eskiz.token.set(expiring)
+        await eskiz.get_limit()
+        await asyncio.sleep(0.01)
+        assert str(eskiz.token) == server.last_token
+        await eskiz.get_limit()
+        assert server.stats["/auth/login"] == 1
+
+    def test_margin_longer_than_lifetime(self):
+        server = MockEskizServer(token_ttl=600)
+        eskiz = server.client(token_refresh_margin=3600)
+        for _ in range(5):
+            eskiz.get_limit()
+        assert eskiz.token._refresh_thread is None
+        assert server.stats["/auth/login"] == 1
+
+    async def test_async_margin_longer_than_lifetime(self):
+        server = MockEskizServer(token_ttl=600)
+        eskiz = server.async_client(token_refresh_margin=3600)
+        for _ in range(5):
+            await eskiz.get_limit()
+            await asyncio.sleep(0)
+        assert server.stats["/auth/login"] == 1
+
+    def test_margin_is_clamped_to_half_lifetime(self):
+        server = MockEskizServer()
+        now = time.time()
+        eskiz = server.client(token_refresh_margin=3600)
+        eskiz.token.set(server.issue_token(exp=now + 100, iat=now - 500))
+        assert eskiz.token._expires_soon()
+        eskiz.token.set(server.issue_token(exp=now + 400, iat=now - 200))
+        assert not eskiz.token._expires_soon()
@@ -0,0 +1,77 @@
+import os
+
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.token_store import EnvTokenStore, FileTokenStore, MemoryTokenStore
+
+
+class TestTokenStore:
+    def test_memory_store(self):
+        server = MockEskizServer()
+        store = MemoryTokenStore()
+        first = server.client(token_store=store)
+        second = server.client(token_store=store)
+        first.get_limit()
+        second.get_limit()
+        assert server.stats["/auth/login"] == 1
+        assert store.load() == server.last_token
+
+    def test_file_store(self, tmp_path):
+        server = MockEskizServer(token_ttl=3600)
+        path = str(tmp_path / "token")
+        first = server.client(token_store=FileTokenStore(path))
+        second = server.client(token_store=FileTokenStore(path))
+        first.get_limit()
+        second.get_limit()
+        assert server.stats["/auth/login"] == 1
+        assert open(path).read() == server.last_token
+        # the second instance didn't check the stored token
+        assert server.calls.count(("GET", "/auth/user")) == 0
+
+    def test_refresh_is_shared(self, tmp_path):
+        server = MockEskizServer()
+        path = str(tmp_path / "token")
+        first = server.client(token_store=FileTokenStore(path))
+        second = server.client(token_store=FileTokenStore(path))
+        first.get_limit()
+        second.get_limit()
+        server.tokens.clear()
+        first.get_limit()
+        second.get_limit()
+        assert server.stats["/auth/login"] == 2
+
+    def test_replace_within_same_mtime(self, tmp_path):
+        path = str(tmp_path / "token")
+        reader, writer = FileTokenStore(path), FileTokenStore(path)
+        writer.save("old-token")
+        mtime = os.stat(path).st_mtime_ns
+        assert reader.load() == "old-token"
+        writer.save("new-token")
+        # a coarse timestamp doesn't change between the writes
+        os.utime(path, ns=(mtime, mtime))
+        assert reader.load() == "new-token"
+
+    def test_file_lock(self, tmp_path):
+        path = str(tmp_path / "token")
+        first, second = FileTokenStore(path), FileTokenStore(path)
+        assert first.acquire()
+        assert not second.acquire(blocking=False)
+        first.release()
+        assert second.acquire(blocking=False)
+        second.release()
+
+    def test_env_store(self, tmp_path):
+        path = tmp_path / ".env"
+        path.write_text("OTHER=1\n")
+        store = EnvTokenStore(str(path))
+        store.save("token")
+        assert EnvTokenStore(str(path)).load() == "token"
+        assert "OTHER=1" in path.read_text()
+
+    async def test_async_file_store(self, tmp_path):
+        server = MockEskizServer()
+        path = str(tmp_path / "token")
+        first = server.async_client(token_store=FileTokenStore(path))
+        second = server.async_client(token_store=FileTokenStore(path))
+        await first.get_limit()
+        await second.get_limit()
+        assert server.stats["/auth/login"] == 1
@@ -0,0 +1,113 @@
+import pickle
+from datetime import datetime, timezone
+
+from eskiz_sms.columns import UserMessageTable
+from eskiz_sms.mock import MockEskizServer
+from eskiz_sms.types import ContactCreated, Response, User, UserMessage
+
+MESSAGE = {
+    "id": 15,
+    "user_id": 1,
+    "dispatch_id": None,
+    "user_sms_id": "a-1",
+    "request_id": "req-1",
+    "nick": "4546",
+    "to": "998901234567",
+    "message": "Hello",
+    "encoding": 0,
+    "parts_count": 1,
+    "price": 50,
+    "is_ad": False,
+    "status": "DELIVRD",
+    "sent_at": "2023-01-01 10:00:00",
+    "submit_sm_resp_at": None,
+    "delivery_sm_at": "2023-01-01 10:00:05",
+    "created_at": "2023-01-01T10:00:00.000000Z",
+    "updated_at": "2023-01-01T10:00:05.000000Z",
+}
+
+
+class TestModels:
+    def test_unknown_fields(self):
+        response = Response(status="success", data={"id": 1}, api_version="2")
+        assert response.status == "success"
+        assert response.extra == {"api_version": "2"}
+        assert Response(status="success").extra is None
+        assert not hasattr(response, "__dict__")
+
+    def test_lazy_datetime(self):
+        user = User(id=1, created_at="2023-01-01T10:00:00.000000Z", updated_at="invalid")
+        assert user.created_at == datetime(2023, 1, 1, 10, tzinfo=timezone.utc)
+        assert user.created_at is user.created_at
+        assert user.updated_at == "invalid"
+        assert User().created_at is None
+
+    def test_from_dicts(self):
+        messages = UserMessage.from_dicts([MESSAGE, dict(MESSAGE, id=16, new_field=1)])
+        assert [message.id for message in messages] == [15, 16]
+        assert messages[0].extra is None
+        assert messages[1].extra == {"new_field": 1}
+        assert messages[0] == UserMessage(**MESSAGE)
+        assert messages[0] != messages[1]
+        assert messages[0].sent_at == datetime(2023, 1, 1, 10)
+
+    def test_from_dicts_matches_init(self):
+        users = User.from_dicts([{"id": 1, "created_at": "2023-01-01 10:00:00", "new_field": 1}, {}])
+        assert users == [User(id=1, created_at="2023-01-01 10:00:00", new_field=1), User()]
+        assert users[0].created_at == datetime(2023, 1, 1, 10)
+        assert Response.from_dicts(iter([{"status": "success"}])) == [Response(status="success")]
+        # each class gets its own builder
+        assert "_build_many" in User.__dict__ and "_build_many" in Response.__dict__
+
+    def test_positional_and_pickle(self):
+        assert ContactCreated(5).contact_id == 5
+        user = User(id=1, name="Test", created_at="2023-01-01 10:00:00", extra_key=True)
+        restored = pickle.loads(pickle.dumps(user))
+        assert restored == user
+        assert restored.extra == {"extra_key": True}
+        assert user.to_dict()["created_at"] == datetime(2023, 1, 1, 10)
+
+
+class TestUserMessageTable:
+    def test_roundtrip(self):
+        items = [dict(MESSAGE, id=i, status="DELIVRD" if i % 3 else "EXPIRED") for i in range(6)]
+        table = UserMessageTable(items)
+        assert len(table) == 6
+        assert list(table) == UserMessage.from_dicts(items)
+        assert table[-1] == UserMessage.from_dict(items[-1])
+        assert [message.id for message in table[1:3]] == [1, 2]
+        assert table.column("price") == [50] * 6
+        assert table.column("dispatch_id") == [None] * 6
+        assert table.counts("status") == {"EXPIRED": 2, "DELIVRD": 4}
+        assert table[0].created_at == datetime(2023, 1, 1, 10, tzinfo=timezone.utc)
+
+    def test_unexpected_values(self):
+        table = UserMessageTable([MESSAGE])
+        table.append(dict(MESSAGE, id="16", price=1.5, is_ad=None, sent_at="yesterday", status=["?"], extra=1))
+        assert table.column("id") == [15, "16"]
+        assert table.column("price") == [50, 1.5]
+        assert table.column("is_ad") == [False, None]
+        assert table.column("sent_at") == [datetime(2023, 1, 1, 10), "yesterday"]
+        assert table.column("status") == ["DELIVRD", ["?"]]
+        assert table[1].extra is None
+
+    def test_mixed_timezones(self):
+        table = UserMessageTable([MESSAGE, dict(MESSAGE, created_at="2023-01-01 12:00:00")])
+        assert table.column("created_at") == [
+            datetime(2023, 1, 1, 10, tzinfo=timezone.utc), "2023-01-01 12:00:00"
+        ]
+
+    def test_user_messages_table(self):
+        server = MockEskizServer(per_page=2)
+        server.messages = [dict(MESSAGE, id=i) for i in range(5)]
+        eskiz = server.client()
+        table = eskiz.user_messages_table("2023-01-01 00:00", "2023-01-31 23:59", prefetch=True)
+        assert table.column("id") == [0, 1, 2, 3, 4]
+        assert [int(payload["page"]) for payload in server.payloads("/message/sms/get-user-messages")] == [1, 2, 3]
+
+    async def test_async_user_messages_table(self):
+        server = MockEskizServer(per_page=2)
+        server.messages = [dict(MESSAGE, id=i) for i in range(5)]
+        eskiz = server.async_client()
+        table = await eskiz.user_messages_table("2023-01-01", "2023-01-31")
+        assert list(table) == UserMessage.from_dicts(server.messages)